@@ -87,7 +87,9 @@ class SpecFixer():
             model_name="gpt-3.5-turbo", 
             use_docker=False, 
             timeout=300,
-            tmp_dir=None
+            tmp_dir=None,
+            cache_dir=None,
+            incremental=False
         ):
         self.state = FixingState()
         self.workflow = self.basic_workflow()
@@ -102,9 +104,9 @@ class SpecFixer():
                 
         if language == "java":
             if use_docker:
-                self.verifier = create_verifier("OpenJML")
+                self.verifier = create_verifier("OpenJML", cache_dir=cache_dir, incremental=incremental)
             else:
-                self.verifier = create_verifier("OpenJMLWithoutDocker")
+                self.verifier = create_verifier("OpenJMLWithoutDocker", cache_dir=cache_dir, incremental=incremental)
               
             self.fix_sys_mes = "You are an experts on Java Modeling Language (JML). Your task is to fix the JML specifications annotated in the target Java code." \
                             +  "You will be provided the error messages from the OpenJML tool and you need to fix the specifications accordingly."
@@ -49,7 +49,8 @@ class SpecInfer():
             use_docker=True, 
             prompt_type="zero_shot", 
             timeout=300,
-            tmp_dir=None
+            tmp_dir=None,
+            cache_dir=None
         ):
         self.state = State()
         self.model_name = model_name
@@ -64,9 +65,9 @@ class SpecInfer():
         if language == "java":
             if workflow != "only_gen":
                 if use_docker:
-                    self.verifier = create_verifier("OpenJML")
+                    self.verifier = create_verifier("OpenJML", cache_dir=cache_dir)
                 else:
-                    self.verifier = create_verifier("OpenJMLWithoutDocker")
+                    self.verifier = create_verifier("OpenJMLWithoutDocker", cache_dir=cache_dir)
             
             if prompt_type == "two_shot":
                 self.gen_sys_mes = (
@@ -96,8 +97,10 @@ class SpecInfer():
             self.example_set = JavaExample
         elif language == "c":
             if workflow != "only_gen":
-                assert use_docker, "FramaC without docker is not implemented yet. Please use FramaC with docker."
-                self.verifier = create_verifier("FramaC")
+                if use_docker:
+                    self.verifier = create_verifier("FramaC", cache_dir=cache_dir)
+                else:
+                    self.verifier = create_verifier("FramaCWithoutDocker", cache_dir=cache_dir)
             
             if prompt_type == "two_shot":
                 self.gen_sys_mes = (
@@ -0,0 +1,57 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+
+/**
+ * Long-lived OpenJML worker used by FormalBench.
+ *
+ * Reads one job per line from stdin: the OpenJML command-line arguments
+ * separated by tabs. For each job, runs OpenJML in-process and writes its
+ * combined stdout/stderr followed by a line
+ * "__FORMALBENCH_DONE__ <exit code> <used heap bytes>".
+ */
+public class OpenJMLWorker {
+
+    private static final String DONE = "__FORMALBENCH_DONE__";
+
+    public static void main(String[] args) throws Exception {
+        String mainClass = args.length > 0 ? args[0] : "org.jmlspecs.openjml.Main";
+        Method execute = Class.forName(mainClass).getMethod("execute", String[].class);
+
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(buffer, true, "UTF-8");
+            System.setOut(capture);
+            System.setErr(capture);
+            int exitCode;
+            try {
+                Object result = execute.invoke(null, (Object) line.split("\t"));
+                exitCode = result instanceof Integer ? (Integer) result : 0;
+            } catch (InvocationTargetException e) {
+                e.getCause().printStackTrace(capture);
+                exitCode = 255;
+            } catch (Throwable e) {
+                e.printStackTrace(capture);
+                exitCode = 255;
+            }
+            capture.flush();
+
+            Runtime runtime = Runtime.getRuntime();
+            long usedMemory = runtime.totalMemory() - runtime.freeMemory();
+            out.write(buffer.toByteArray());
+            out.print("\n" + DONE + " " + exitCode + " " + usedMemory + "\n");
+            out.flush();
+        }
+    }
+}
@@ -0,0 +1,191 @@
+"""
+Caching proxy between OpenJML and an SMT solver.
+
+Usage: smt_cache.py CACHE_DIR SOLVER [SOLVER_ARGS...]
+
+The proxy forwards SMT-LIB commands to the solver and answers `check-sat`
+from CACHE_DIR when the same sequence of commands was already solved. The
+skipped `check-sat` is only sent to the solver if a later command needs its
+model, e.g. `get-value` for a counterexample. Only `sat` and `unsat` answers
+are cached, stored as one small file per query and shared by every process
+that uses the same directory. The solver answers every command, so that the
+answers stay matched to their commands even after an error.
+
+This script runs inside the verifier containers and only uses the standard
+library.
+"""
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import uuid
+
+_COMMAND_NAME = re.compile(rb"^\(\s*([^\s()]+)")
+_CHECK_COMMANDS = {b"check-sat", b"check-sat-assuming"}
+_MODEL_COMMANDS = {
+    b"get-value", b"get-model", b"get-assignment", b"get-unsat-core",
+    b"get-unsat-assumptions", b"get-proof", b"get-info"
+}
+_CACHED_ANSWERS = {b"sat", b"unsat"}
+
+
+class SexprReader():
+    """
+    Read complete S-expressions (or top-level atoms) from a binary stream
+    """
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.buffer = b""
+
+    def next(self):
+        depth = 0
+        in_string = in_quote = in_comment = in_atom = False
+        i = 0
+        while True:
+            while i < len(self.buffer):
+                c = self.buffer[i]
+                i += 1
+                if in_comment:
+                    in_comment = c != 0x0A
+                elif in_string:
+                    in_string = c != 0x22
+                elif in_quote:
+                    in_quote = c != 0x7C
+                elif c == 0x22:
+                    in_string = True
+                elif c == 0x7C:
+                    in_quote = True
+                elif c == 0x3B:
+                    in_comment = True
+                elif c == 0x28:
+                    depth += 1
+                elif c == 0x29:
+                    depth -= 1
+                    if depth == 0:
+                        return self._take(i)
+                elif depth == 0:
+                    if chr(c).isspace():
+                        if in_atom:
+                            return self._take(i)
+                    else:
+                        in_atom = True
+            chunk = self.stream.read1(65536)
+            if not chunk:
+                expr = self.buffer.strip()
+                self.buffer = b""
+                return expr or None
+            self.buffer += chunk
+
+    def _take(self, end: int) -> bytes:
+        expr = self.buffer[:end].strip()
+        self.buffer = self.buffer[end:]
+        return expr
+
+
+def lookup(cache_dir: str, key: str):
+    path = os.path.join(cache_dir, key[:2], key)
+    try:
+        with open(path, "rb") as f:
+            answer = f.read().strip()
+        os.utime(path)
+    except OSError:
+        return None
+    return answer if answer in _CACHED_ANSWERS else None
+
+
+def store(cache_dir: str, key: str, answer: bytes) -> None:
+    path = os.path.join(cache_dir, key[:2], key)
+    tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(answer)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _is_error(response) -> bool:
+    return response is not None and response.startswith(b"(error")
+
+
+def main() -> int:
+    cache_dir, solver = sys.argv[1], sys.argv[2:]
+    process = subprocess.Popen(solver, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    commands = SexprReader(sys.stdin.buffer)
+    responses = SexprReader(process.stdout)
+    out = sys.stdout.buffer
+
+    def ask(command: bytes):
+        process.stdin.write(command + b"\n")
+        process.stdin.flush()
+        return responses.next()
+
+    def respond(response) -> None:
+        if response is not None:
+            out.write(response + b"\n")
+            out.flush()
+
+    # The solver always prints success, so that every command has exactly one
+    # response and an error cannot shift the answers of later commands. The
+    # client only sees success if it asked for it.
+    ask(b"(set-option :print-success true)")
+    transcript = hashlib.sha256(os.path.basename(solver[0]).encode("utf-8"))
+    for arg in solver[1:]:
+        transcript.update(b" " + arg.encode("utf-8"))
+    print_success = False
+    # Answers are not stored once the solver has reported an error
+    failed = False
+    pending_check = None
+    while True:
+        command = commands.next()
+        if command is None:
+            break
+        match = _COMMAND_NAME.match(command)
+        name = match.group(1) if match else b""
+        transcript.update(b"\n" + command)
+
+        if name == b"set-option" and b":print-success" in command:
+            print_success = b"true" in command
+            if print_success:
+                respond(b"success")
+            continue
+
+        if name in _CHECK_COMMANDS:
+            key = transcript.hexdigest()
+            answer = lookup(cache_dir, key)
+            if answer is not None:
+                pending_check = command
+                respond(answer)
+                continue
+            pending_check = None
+            answer = ask(command)
+            respond(answer)
+            if answer in _CACHED_ANSWERS and not failed:
+                store(cache_dir, key, answer)
+            failed = failed or _is_error(answer)
+            continue
+
+        if pending_check is not None and name in _MODEL_COMMANDS:
+            failed = failed or _is_error(ask(pending_check))
+            pending_check = None
+        response = ask(command)
+        if _is_error(response):
+            failed = True
+            respond(response)
+        elif response != b"success" or print_success:
+            respond(response)
+        if name == b"exit":
+            break
+
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    return process.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,33 @@ from .tools.verifier import (
     create_verifier,
     OpenJMLVerifier,
     OpenJMLVerifierWithoutDocker,
+    FramaCVerifier,
+    FramaCVerifierWithoutDocker,
     Verifier
 )
 
+from .tools.result import VerificationResult
+from .tools.cache import CachedVerifier, VerificationCache
+from .tools.split import SplitVerifier
+from .tools.incremental import IncrementalVerifier
+from .tools.cascade import CascadePolicy, CascadeVerifier
+from .tools.portfolio import PortfolioVerifier
+from .tools.service import RemoteVerifier, VerificationService
+from .tools.container import shutdown_containers
+
 from .tools.mutation_analysis import (
     create_mutator,
     MajorMutantGenerator,
     MajorMutantGeneratorWithoutDocker,
+    MullMutantGenerator,
+    MullMutantGeneratorWithoutDocker,
     MutantGenerator
 )
+from .tools.mutant_cache import CachedMutantGenerator
 
 from .metrics.consistency import eval_consistency
 from .metrics.completeness import CoverageScore, eval_completeness
+from .metrics.sampling import CoverageEstimate, SamplingPolicy
 
 from .dataset.base import load_base_dataset
 from .dataset.diverse import load_diverse_dataset
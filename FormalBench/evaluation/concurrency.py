@@ -0,0 +1,132 @@
+from typing import Any, Callable, Optional
+import threading
+import time
+import os
+import psutil
+
+
+class AdaptiveLimiter():
+    """
+    Limit the number of in-flight verifications and adapt the limit during a run.
+
+    The limit is revised every `interval` seconds from the jobs completed in
+    that window. It is cut by a quarter when the host runs short of memory or
+    CPU, or when too many jobs time out (a sign of oversubscription). When
+    jobs were waiting for a slot, the limit grows by one as long as throughput
+    keeps up. A growth step that lowers throughput is undone. Containers share
+    the host kernel, so host CPU and memory include the verifier containers.
+
+    Jobs run through `run`, from as many threads as `max_workers`.
+    """
+
+    def __init__(
+            self,
+            max_workers: Optional[int] = None,
+            initial: Optional[int] = None,
+            min_workers: int = 1,
+            interval: float = 10.0,
+            max_cpu: float = 95.0,
+            max_memory: float = 90.0,
+            max_timeout_rate: float = 0.1,
+            is_timeout: Optional[Callable[[Any], bool]] = None
+        ) -> None:
+        """
+        Args:
+            max_workers (int, optional): Upper bound of the limit. Defaults to twice the number of cores.
+            initial (int, optional): Initial limit. Defaults to half of the cores, within the bounds.
+            min_workers (int, optional): Lower bound of the limit. Defaults to 1.
+            interval (float, optional): Seconds between two revisions of the limit. Defaults to 10.
+            max_cpu (float, optional): Host CPU usage (percent) above which the limit is lowered. Defaults to 95.
+            max_memory (float, optional): Host memory usage (percent) above which the limit is lowered. Defaults to 90.
+            max_timeout_rate (float, optional): Fraction of timed out jobs above which the limit is lowered. Defaults to 0.1.
+            is_timeout (Callable[[Any], bool], optional): Tell whether the result of a job is a timeout. Defaults to None (no timeouts).
+        """
+        n_cores = os.cpu_count() or 1
+        self.max_workers = max_workers if max_workers is not None else 2 * n_cores
+        self.min_workers = min_workers
+        assert 1 <= self.min_workers <= self.max_workers, "Invalid bounds of the number of workers"
+        if initial is None:
+            initial = max(1, n_cores // 2)
+        self.limit = min(max(initial, self.min_workers), self.max_workers)
+        self.interval = interval
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.max_timeout_rate = max_timeout_rate
+        self.is_timeout = is_timeout
+        self.history = []
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._window_start = time.monotonic()
+        self._completed = 0
+        self._timeouts = 0
+        self._waited = False
+        self._last_throughput = None
+        self._last_step = 0
+        psutil.cpu_percent(interval=None)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._waited = True
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, timed_out: bool = False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+            self._timeouts += int(timed_out)
+            if time.monotonic() - self._window_start >= self.interval:
+                self._revise()
+            self._cond.notify_all()
+
+    def run(self, func: Callable, *args, **kwargs):
+        """
+        Run a job once a slot is available
+        """
+        self.acquire()
+        timed_out = False
+        try:
+            result = func(*args, **kwargs)
+            timed_out = self.is_timeout is not None and self.is_timeout(result)
+            return result
+        finally:
+            self.release(timed_out)
+
+    def _revise(self) -> None:
+        now = time.monotonic()
+        throughput = self._completed / (now - self._window_start)
+        timeout_rate = self._timeouts / self._completed
+        cpu = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory().percent
+
+        step = 0
+        if memory > self.max_memory or timeout_rate > self.max_timeout_rate or cpu > self.max_cpu:
+            step = -max(1, self.limit // 4)
+        elif self._last_step > 0 and self._last_throughput is not None \
+                and throughput < 0.95 * self._last_throughput:
+            step = -self._last_step
+        elif self._waited:
+            step = 1
+        new_limit = min(max(self.limit + step, self.min_workers), self.max_workers)
+
+        self.history.append({
+            "limit": self.limit,
+            "throughput": throughput,
+            "timeout_rate": timeout_rate,
+            "cpu": cpu,
+            "memory": memory
+        })
+        if new_limit != self.limit:
+            print("Adjusting the number of in-flight verifications: {} -> {} "
+                  "(throughput {:.2f}/s, timeouts {:.0%}, cpu {:.0f}%, memory {:.0f}%)".format(
+                      self.limit, new_limit, throughput, timeout_rate, cpu, memory))
+        self._last_step = new_limit - self.limit
+        self._last_throughput = throughput
+        self.limit = new_limit
+
+        self._window_start = now
+        self._completed = 0
+        self._timeouts = 0
+        self._waited = False
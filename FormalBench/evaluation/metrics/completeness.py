@@ -1,16 +1,57 @@
-from .. import create_verifier, Verifier, create_mutator, MutantGenerator
+from .. import create_verifier, CascadePolicy, Verifier, create_mutator, MutantGenerator, CachedMutantGenerator
+from ..concurrency import AdaptiveLimiter
+from ..tools.dedup import group_mutants, ORIGINAL
+from ..tools.source import changed_units, split_java_methods, split_c_functions
+from .sampling import SamplingPolicy, CoverageEstimate, mutant_operators, sampling_order
 import os
 import concurrent.futures
-from typing import Tuple, List, Optional
+from functools import partial
+from typing import Callable, Dict, Tuple, List, Optional
+import time
 import json
 from tqdm import tqdm
 
 class CoverageScore():
 
-    def __init__(self, verifier: Verifier, mutator: MutantGenerator) -> None:
+    def __init__(
+            self,
+            verifier: Verifier,
+            mutator: MutantGenerator,
+            fail_fast: bool = False,
+            limiter: Optional[AdaptiveLimiter] = None,
+            dedup: Optional[str] = None,
+            scoped: bool = False,
+            sampling: Optional[SamplingPolicy] = None
+        ) -> None:
         super().__init__()
         self.verifier = verifier
         self.mutator = mutator
+        # When given, the limiter decides how many of the n_proc threads may
+        # verify a mutant at the same time.
+        self.limiter = limiter
+        # Mutants only need to know whether verification fails, so verifiers
+        # that can stop at the first failing goal are allowed to.
+        self.fail_fast = fail_fast and hasattr(verifier, "verify_fail_fast")
+        # Mutants that are the same program, by normalized source ("source")
+        # or also by compiled program ("compiled"), are verified once.
+        assert dedup in (None, "source", "compiled"), "Unknown deduplication: {}".format(dedup)
+        self.dedup = dedup
+        # Mutants whose change stays inside one body are verified against the
+        # units it affects only, the other units keeping the original's result.
+        self.scoped = scoped
+        # Mutants are verified in random order until the coverage estimate is
+        # precise enough or the budget of the policy is spent.
+        self.sampling = sampling
+        if scoped:
+            if hasattr(verifier, "verify_methods"):
+                self.split = split_java_methods
+                self.verify_part = verifier.verify_methods
+            elif hasattr(verifier, "verify_functions"):
+                self.split = split_c_functions
+                self.verify_part = verifier.verify_functions
+            else:
+                raise ValueError(
+                    "Verifier {} does not support partial verification".format(type(verifier).__name__))
 
     def measure_completeness(
             self, 
@@ -50,6 +91,13 @@ class CoverageScore():
                 killed_mutants += 1
             else:
                 survived_mutants += 1
+        if self.sampling is not None:
+            assert total_mutants <= n_mutants, "Sampled mutants should be at most the number of mutants generated"
+            if total_mutants == 0:
+                print("[WARNING] No mutants verified within the sampling budget. Skipping !!!")
+                return None, 0, 0
+            coverage = CoverageEstimate(survived_mutants, total_mutants, n_mutants, self.sampling.confidence)
+            return coverage, survived_mutants, total_mutants
         assert total_mutants == n_mutants, "Total mutants should be equal to the number of mutants generated"
 
         coverage = survived_mutants / total_mutants
@@ -81,14 +129,9 @@ class CoverageScore():
         print("Measuring mutation score for path: {}".format(path))
         mutation_dir = os.path.join(save_dir, "mutants")
 
-        if not os.path.exists(mutation_dir) or len(
-                os.listdir(mutation_dir)) == 0:
-            self.mutator.generate_mutants(path, save_dir)
-            basename = os.path.basename(path)
-
-            if not os.path.exists(mutation_dir):
-                print("Mutants directory not found. Exiting !!!")
-                return {}, None
+        if not self.generate_mutants(path, save_dir):
+            print("Mutants directory not found. Exiting !!!")
+            return {}, None
 
         n_mutants = len(os.listdir(mutation_dir))
 
@@ -131,33 +174,157 @@ class CoverageScore():
             path)
 
         basename = os.path.basename(path)
-        with concurrent.futures.ThreadPoolExecutor(
-                max_workers=n_proc) as executor:
-            futures = {
-                executor.submit(self.verify_mutant, mutant, mutation_dir, basename, timeout):
-                mutant
-                for i, mutant in enumerate(os.listdir(mutation_dir))
-            }
-            for future in concurrent.futures.as_completed(futures):
-                mutant, n_errors = future.result()
+        original = None
+        if self.scoped:
+            with open(path, "r") as original_file:
+                original = original_file.read()
+        if self.limiter is not None:
+            verify_mutant = partial(self.limiter.run, self.verify_mutant)
+            n_proc = self.limiter.max_workers
+        else:
+            verify_mutant = self.verify_mutant
+        if self.dedup is None:
+            groups = {mutant: [mutant] for mutant in os.listdir(mutation_dir)}
+        else:
+            groups = group_mutants(mutation_dir, basename, original_path=path,
+                                   compiled=self.dedup == "compiled", n_proc=n_proc)
+            print("Verifying {} of {} mutants after deduplication".format(len(groups) - 1, n_mutants))
+
+        def _record(mutants: List[str], n_errors: int) -> None:
+            for mutant in mutants:
                 f.write(f"{mutant}: {n_errors}\n")
                 results[mutant] = n_errors
+
+        # Mutants that are the same program as the original have its result
+        original_group = groups.pop(ORIGINAL, [ORIGINAL])[1:]
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=n_proc) as executor:
+            submit = lambda mutant: executor.submit(
+                verify_mutant, mutant, mutation_dir, basename, timeout, original)
+            if self.sampling is not None:
+                groups[ORIGINAL] = original_group
+                self.sample_mutants(groups, save_dir, n_proc, submit, _record, results["Original"])
+            else:
+                _record(original_group, results["Original"])
+                futures = [submit(mutant) for mutant in groups]
+                for future in concurrent.futures.as_completed(futures):
+                    representative, n_errors = future.result()
+                    _record(groups[representative], n_errors)
         f.close()
 
         return results, n_mutants
 
+    def sample_mutants(
+            self,
+            groups: Dict[str, List[str]],
+            save_dir: str,
+            n_proc: int,
+            submit: Callable[[str], concurrent.futures.Future],
+            record: Callable[[List[str], int], None],
+            original_n_errors: int
+        ) -> None:
+        """
+        Verify mutants in the sampling order until the policy stops, keeping up to `n_proc` verifications in flight
+
+        Args:
+            groups (Dict[str, List[str]]): The members of each group of identical mutants by representative, `ORIGINAL` for the mutants identical to the original
+            submit (Callable[[str], concurrent.futures.Future]): Start the verification of a representative
+            record (Callable[[List[str], int], None]): Record the result of sampled mutants
+            original_n_errors (int): The result of the original program
+        """
+        policy = self.sampling
+        representative_of = {mutant: rep for rep, members in groups.items() for mutant in members}
+        n_mutants = len(representative_of)
+        operators = mutant_operators(save_dir) if policy.stratify else None
+        order = sampling_order(list(representative_of), operators, policy.seed)
+
+        start = time.monotonic()
+        known = {ORIGINAL: original_n_errors}
+        running: Dict[str, concurrent.futures.Future] = {}
+        waiting: Dict[str, List[str]] = {}
+        counts = {"verified": 0, "survived": 0}
+
+        def _collect(rep: str, n_errors: int) -> None:
+            members = waiting.pop(rep, [])
+            record(members, n_errors)
+            counts["verified"] += len(members)
+            counts["survived"] += len(members) if n_errors != 0 else 0
+
+        def _done() -> bool:
+            n_verified = counts["verified"]
+            if policy.max_mutants is not None and n_verified + sum(map(len, waiting.values())) >= policy.max_mutants:
+                return True
+            if policy.max_seconds is not None and time.monotonic() - start >= policy.max_seconds:
+                return True
+            if n_verified < policy.min_mutants:
+                return False
+            estimate = CoverageEstimate(counts["survived"], n_verified, n_mutants, policy.confidence)
+            return estimate.width <= policy.target_width
+
+        for mutant in order:
+            if _done():
+                break
+            rep = representative_of[mutant]
+            waiting.setdefault(rep, []).append(mutant)
+            if rep in known:
+                _collect(rep, known[rep])
+            elif rep not in running:
+                while len(running) >= n_proc:
+                    finished, _ = concurrent.futures.wait(
+                        running.values(), return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        done_rep, n_errors = future.result()
+                        del running[done_rep]
+                        known[done_rep] = n_errors
+                        _collect(done_rep, n_errors)
+                running[rep] = submit(rep)
+
+        # Sampled mutants whose verification has started are kept in the sample
+        for rep, future in running.items():
+            _, n_errors = future.result()
+            _collect(rep, n_errors)
+        print("Coverage estimate after {:.0f}s: {}".format(
+            time.monotonic() - start,
+            CoverageEstimate(counts["survived"], counts["verified"], n_mutants, policy.confidence)))
+
+    def generate_mutants(self, path: str, save_dir: str) -> bool:
+        """
+        Generate the mutants of a program into `save_dir/mutants` unless they already exist
+
+        Mutators use isolated scratch directories, so this may be called for
+        several programs at once.
+
+        Returns:
+            bool: Whether the mutants directory exists
+        """
+        mutation_dir = os.path.join(save_dir, "mutants")
+        if not os.path.exists(mutation_dir) or len(
+                os.listdir(mutation_dir)) == 0:
+            self.mutator.generate_mutants(path, save_dir)
+        return os.path.exists(mutation_dir)
+
     def verify_mutant(
         self, 
         mutant: str, 
         mutation_dir: str,
         basename: str, 
-        timeout: int
+        timeout: int,
+        original: Optional[str] = None
     ) -> Tuple[str, int]:
         
         mutant_path = os.path.join(mutation_dir, mutant, basename)
-        n_errors, output = self.verifier.verify(path=mutant_path,
-                                                basedir=mutant,
-                                                timeout=timeout)
+        if original is not None:
+            with open(mutant_path, "r") as f:
+                units = changed_units(original, f.read(), self.split)
+            if units is not None:
+                # Only Frama-C verifies fail-fast, see `__init__`
+                kwargs = {"fail_fast": True} if self.fail_fast else {}
+                n_errors, output = self.verify_part(mutant_path, units, timeout=timeout, basedir=mutant, **kwargs)
+                return mutant, n_errors
+        verify = self.verifier.verify_fail_fast if self.fail_fast else self.verifier.verify
+        n_errors, output = verify(path=mutant_path,
+                                  basedir=mutant,
+                                  timeout=timeout)
         return mutant, n_errors
     
 def eval_completeness(
@@ -167,22 +334,67 @@ def eval_completeness(
         n_proc: int = 8,
         language: str = "java", 
         data_ids: Optional[str] = None,
-        timeout: int = 300
+        timeout: int = 300,
+        pool_size: int = 1,
+        cache_dir: Optional[str] = None,
+        incremental: bool = False,
+        wp_cache_dir: Optional[str] = None,
+        split_workers: int = 1,
+        cascade: Optional[CascadePolicy] = None,
+        fail_fast: bool = False,
+        smt_cache_dir: Optional[str] = None,
+        adaptive_concurrency: bool = False,
+        cpu_time_limit: bool = False,
+        pin_cpus: bool = False,
+        verifier_name: Optional[str] = None,
+        mutator_name: Optional[str] = None,
+        generation_workers: int = 1,
+        mutant_cache_dir: Optional[str] = None,
+        dedup: Optional[str] = None,
+        scoped: bool = False,
+        sampling: Optional[SamplingPolicy] = None,
+        mutator_profile: str = "full"
     ) -> Tuple[float, List[float], List[str]]:
+    """
+    Measure the completeness of a set of specifications as the ratio of mutants they reject
+
+    Args:
+        n_proc (int, optional): Number of mutants verified concurrently, or the upper bound of that number with `adaptive_concurrency`. Defaults to 8.
+        adaptive_concurrency (bool, optional): Adapt the number of concurrent verifications to throughput, timeouts and host load during the run. Defaults to False.
+        cpu_time_limit (bool, optional): Count timeouts in CPU time rather than wall-clock time, so that results do not depend on the load of the machine. Defaults to False.
+        pin_cpus (bool, optional): Pin each verifier container to its own share of the cores. Defaults to False.
+        verifier_name (str, optional): Verifier to use, e.g. FramaCWithoutDocker to run a local Frama-C. Defaults to OpenJML for Java and FramaC for C.
+        mutator_name (str, optional): Mutator to use, e.g. MullWithoutDocker to run a local Mull. Defaults to Major for Java and Mull for C.
+        generation_workers (int, optional): Number of benchmarks whose mutants are generated concurrently before verification starts. Defaults to 1 (mutants are generated benchmark by benchmark).
+        mutant_cache_dir (str, optional): Directory where the mutants of each program are stored, so that they are generated once for all specifications of the program. Defaults to None (no cache).
+        dedup (str, optional): Verify once the mutants that are the same program, by normalized source ("source") or also by unoptimized compiled program ("compiled", with a local clang or javac). Mutants that are the same program as the original get its result. Defaults to None (every mutant is verified).
+        scoped (bool, optional): Verify a mutant whose change stays inside one method or function body against that unit only, with OpenJML's --method or Frama-C's -wp-fct, plus the units that use it if it is a pure method. Defaults to False.
+        sampling (SamplingPolicy, optional): Verify a random sample of the mutants of each benchmark, stopping once the confidence interval of its coverage is narrow enough or the budget is spent. Coverages are then `CoverageEstimate`s carrying their interval. Defaults to None (every mutant is verified).
+        mutator_profile (str, optional): Set of mutation operators: full, sufficient or minimal. See `formalbench-profiles` for how closely the reduced sets track the full one. Defaults to full.
+
+    Returns:
+        Tuple[float, List[Optional[float]], List[str]]: The average coverage, the coverage of each consistent benchmark (None when none of its mutants was verified) and the benchmarks whose specification is inconsistent
+    """
     
     assert os.path.exists(spec_dir), "Data directory not found: {}".format(spec_dir)
     
     os.makedirs(save_dir, exist_ok=True)
     if language == "java":
         ending = ".java"
-        verifier = create_verifier("OpenJML", 21)
-        mutator = create_mutator("Major")
+        verifier = create_verifier(verifier_name or "OpenJML", 21, pool_size=pool_size, cache_dir=cache_dir, incremental=incremental,
+                                   split_workers=split_workers, cascade=cascade, smt_cache_dir=smt_cache_dir,
+                                   cpu_time_limit=cpu_time_limit, pin_cpus=pin_cpus)
+        mutator = create_mutator(mutator_name or "Major", profile=mutator_profile)
     elif language == "c":
         ending = ".c"
-        verifier = create_verifier("FramaC")
-        mutator = create_mutator("Mull")
+        verifier = create_verifier(verifier_name or "FramaC", pool_size=pool_size, cache_dir=cache_dir, incremental=incremental,
+                                   wp_cache_dir=wp_cache_dir, split_workers=split_workers, cascade=cascade,
+                                   cpu_time_limit=cpu_time_limit, pin_cpus=pin_cpus)
+        mutator = create_mutator(mutator_name or "Mull", profile=mutator_profile)
     else:
         raise ValueError("Unsupported language: {}. Please select from ['java', 'c']".format(language))
+    if mutant_cache_dir is not None:
+        mutator = CachedMutantGenerator(mutator, mutant_cache_dir)
 
     if data_ids is None:
         benchmarks = os.listdir(spec_dir)
@@ -190,10 +402,25 @@ def eval_completeness(
     else:
         benchmarks = data_ids.split(",")
 
+    # One limiter for the whole run, so what it learns carries over between benchmarks.
+    limiter = None
+    if adaptive_concurrency:
+        limiter = AdaptiveLimiter(max_workers=n_proc, is_timeout=lambda result: result[1] == -1)
+
+    if generation_workers > 1:
+        coverage_score = CoverageScore(verifier, mutator)
+        print("Generating mutants of {} benchmarks".format(len(benchmarks)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=generation_workers) as executor:
+            list(tqdm(executor.map(
+                lambda b: coverage_score.generate_mutants(
+                    os.path.join(spec_dir, f"{b}{ending}"), os.path.join(save_dir, b)),
+                benchmarks), total=len(benchmarks)))
+
     coverage_results = []
     inconsistent_instances = []
     for b in tqdm(benchmarks):
-        coverage_score = CoverageScore(verifier, mutator)
+        coverage_score = CoverageScore(verifier, mutator, fail_fast=fail_fast, limiter=limiter, dedup=dedup, scoped=scoped,
+                                       sampling=sampling)
         coverage, survived, total = coverage_score.measure_completeness(
             path = os.path.join(spec_dir, f"{b}{ending}"),
             analysis_path= os.path.join(analysis_dir, f"{b}.json"),
@@ -202,9 +429,17 @@ def eval_completeness(
             timeout= timeout
         )
         if coverage is None:
-            inconsistent_instances.append(b)
+            # Without any mutant verified, the specification is not inconsistent
+            if total is None:
+                inconsistent_instances.append(b)
+            else:
+                # No mutant was sampled, keep its place so that runs stay aligned
+                coverage_results.append(None)
             continue
+        if isinstance(coverage, CoverageEstimate):
+            print("Coverage of {}: {}".format(b, coverage))
         coverage_results.append(coverage)
     
-    avg_coverage = sum(coverage_results) / len(coverage_results)    
+    measured = [coverage for coverage in coverage_results if coverage is not None]
+    avg_coverage = sum(measured) / len(measured)    
     return avg_coverage, coverage_results, inconsistent_instances
\ No newline at end of file
@@ -1,8 +1,10 @@
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional
+import concurrent.futures
 import os
 from tqdm import tqdm
 import json
-from .. import create_verifier
+from .. import create_verifier, CascadePolicy
+from ..concurrency import AdaptiveLimiter
 import os 
 
 def eval_consistency(
@@ -13,6 +15,12 @@ def eval_consistency(
         timeout: int = 300,
         language: str = "java",
         re_evaluate: bool = False,
+        cache_dir: Optional[str] = None,
+        split_workers: int = 1,
+        cascade: Optional[CascadePolicy] = None,
+        n_proc: int = 1,
+        adaptive_concurrency: bool = False,
+        cpu_time_limit: bool = False,
     ) -> Tuple[float, float, Dict]:
     """
     Measure the consistency metrics of a set of specifications againts their reference implementations
@@ -20,6 +28,12 @@ def eval_consistency(
     Args:
         spec_dir (str): Path to the directory containing the specifications
         analysis_dir (str, optional): Path to the directory storing the analysis results. 
+        cache_dir (str, optional): Directory of an on-disk verification result cache shared across runs. Defaults to None.
+        split_workers (int, optional): Verify the methods (functions for C) of each file concurrently with this many workers. Defaults to 1.
+        cascade (CascadePolicy, optional): Stages (type-check, short verification) tried before a full verification. Defaults to None.
+        n_proc (int, optional): Number of specifications verified concurrently, or the upper bound of that number with `adaptive_concurrency`. Defaults to 1.
+        adaptive_concurrency (bool, optional): Adapt the number of concurrent verifications to throughput, timeouts and host load during the run. Defaults to False.
+        cpu_time_limit (bool, optional): Count timeouts in CPU time rather than wall-clock time, so that results do not depend on the load of the machine. Defaults to False.
 
     Returns:
         Tuple[int, int]: A tuple containing (1) verification success rate, (2) verification failure rate and (3) a dictionary containing the detailed verification results
@@ -27,11 +41,15 @@ def eval_consistency(
     
     if language == "java":
         assert verifier_name == "OpenJML", "Only OpenJML is supported for Java programs"
-        verifier = create_verifier(verifier_name, verifier_version)
+        verifier = create_verifier(verifier_name, verifier_version, cache_dir=cache_dir,
+                                   split_workers=split_workers, cascade=cascade,
+                                   cpu_time_limit=cpu_time_limit)
         ending = ".java"
     elif language == "c":
-        assert verifier_name == "FramaC", "Only FramaC is supported for C programs"
-        verifier = create_verifier(verifier_name, verifier_version)
+        assert verifier_name in ["FramaC", "FramaCWithoutDocker"], "Only FramaC is supported for C programs"
+        verifier = create_verifier(verifier_name, verifier_version, cache_dir=cache_dir,
+                                   split_workers=split_workers, cascade=cascade,
+                                   cpu_time_limit=cpu_time_limit)
         ending = ".c"
     else:
         raise ValueError("Unknown language: {}. Please select ['java', 'c']".format(language))
@@ -50,7 +68,7 @@ def eval_consistency(
     number_of_successes = 0
     number_of_unknown = 0
     
-    for spec_name in tqdm(evaluated_specs):
+    def _evaluate(spec_name: str) -> Tuple[int, str]:
         spec_path = os.path.join(spec_dir, spec_name + ending)
         analysis_path = os.path.join(analysis_dir, spec_name + ".json")
         if os.path.exists(analysis_path):
@@ -81,7 +99,22 @@ def eval_consistency(
             spec = open(spec_path, "r").read()
             with open(analysis_path, "w") as f:
                 json.dump({"analysis_results": [n_errors, output, spec]}, f)
+        return n_errors, output
 
+    if adaptive_concurrency:
+        limiter = AdaptiveLimiter(max_workers=n_proc, is_timeout=lambda result: result[0] == -1)
+        evaluate = lambda spec_name: limiter.run(_evaluate, spec_name)
+    else:
+        evaluate = _evaluate
+
+    if n_proc > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_proc)
+        results = executor.map(evaluate, evaluated_specs)
+    else:
+        executor = None
+        results = map(evaluate, evaluated_specs)
+
+    for spec_name, (n_errors, output) in tqdm(zip(evaluated_specs, results), total=total_evaluated_specs):
         evaluation_results[spec_name] = {
             "details": (n_errors, output)
         }
@@ -96,6 +129,8 @@ def eval_consistency(
             number_of_failures += 1
             evaluation_results[spec_name]["status"] = "Failure"
 
+    if executor is not None:
+        executor.shutdown()
     return number_of_successes / total_evaluated_specs, number_of_failures / total_evaluated_specs, evaluation_results
         
         
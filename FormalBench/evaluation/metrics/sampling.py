@@ -0,0 +1,135 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from statistics import NormalDist
+import random
+import math
+import os
+import re
+
+# Mull names its patches after the source file, the mutator and the location
+_MULL_OPERATOR = re.compile(r"^(cxx_\w+|\w+_mutator)$")
+
+
+class SamplingPolicy(NamedTuple):
+    """
+    When to stop verifying the mutants of a benchmark.
+
+    Mutants are verified in random order, spread across mutation operators
+    when `stratify` is set, until the `confidence` interval of the coverage is
+    at most `target_width` wide after at least `min_mutants` mutants, or until
+    `max_mutants` mutants or `max_seconds` seconds have been spent. The
+    interval is that of simple random sampling, which is conservative for the
+    stratified order.
+    """
+    target_width: float = 0.1
+    confidence: float = 0.95
+    min_mutants: int = 20
+    max_mutants: Optional[int] = None
+    max_seconds: Optional[float] = None
+    stratify: bool = True
+    seed: int = 0
+
+
+class CoverageEstimate(float):
+    """
+    A coverage with its confidence interval, usable as the plain coverage
+    """
+
+    def __new__(cls, survived: int, n_verified: int, n_mutants: int, confidence: float = 0.95):
+        coverage = survived / n_verified if n_verified > 0 else 0.0
+        estimate = super().__new__(cls, coverage)
+        estimate.low, estimate.high = wilson_interval(survived, n_verified, n_mutants, confidence)
+        estimate.n_verified = n_verified
+        estimate.n_mutants = n_mutants
+        estimate.confidence = confidence
+        return estimate
+
+    @property
+    def width(self) -> float:
+        return self.high - self.low
+
+    def __str__(self) -> str:
+        return "{:.3f} [{:.3f}, {:.3f}] ({} of {} mutants)".format(
+            float(self), self.low, self.high, self.n_verified, self.n_mutants)
+
+    def __repr__(self) -> str:
+        return "CoverageEstimate({})".format(self)
+
+
+def wilson_interval(
+        successes: int,
+        n: int,
+        population: Optional[int] = None,
+        confidence: float = 0.95
+    ) -> Tuple[float, float]:
+    """
+    Wilson score interval of a proportion, for a sample drawn without replacement from `population`
+
+    Returns:
+        Tuple[float, float]: The lower and upper bounds, which meet when the whole population is in the sample
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    if population is not None and population > 1:
+        z *= math.sqrt(max(0, population - n) / (population - 1))
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def mutant_operators(save_dir: str) -> Dict[str, str]:
+    """
+    Map the mutants of `save_dir/mutants` to their mutation operator, from Major's mutants.log or Mull's patch names
+
+    Returns:
+        Dict[str, str]: The operator of each mutant whose operator is known
+    """
+    operators = {}
+    log_path = os.path.join(save_dir, "mutants.log")
+    patch_dir = os.path.join(save_dir, "mutants-patches")
+    if os.path.exists(log_path):
+        # <id>:<operator>:<original>:<replacement>:<method>:<line>:...
+        with open(log_path, "r") as f:
+            for line in f:
+                fields = line.split(":")
+                if len(fields) > 1:
+                    operators[fields[0].strip()] = fields[1].strip()
+    elif os.path.isdir(patch_dir):
+        # Mutants are numbered in the order of their sorted patches
+        for idx, patch in enumerate(sorted(os.listdir(patch_dir))):
+            parts = patch[:-len(".patch")].split("-") if patch.endswith(".patch") else [patch]
+            for part in parts:
+                if _MULL_OPERATOR.match(part):
+                    operators[str(idx)] = part
+                    break
+    return operators
+
+
+def sampling_order(
+        mutants: List[str],
+        operators: Optional[Dict[str, str]] = None,
+        seed: int = 0
+    ) -> List[str]:
+    """
+    Shuffle mutants so that every prefix is a random sample, spread across operators in proportion to their size when `operators` is given
+    """
+    rng = random.Random(seed)
+    if not operators:
+        order = sorted(mutants)
+        rng.shuffle(order)
+        return order
+
+    strata: Dict[str, List[str]] = {}
+    for mutant in sorted(mutants):
+        strata.setdefault(operators.get(mutant, ""), []).append(mutant)
+    # The i-th mutant of a stratum of size n comes at (i + u) / n, which
+    # interleaves the strata proportionally.
+    positions = []
+    for members in strata.values():
+        rng.shuffle(members)
+        offset = rng.random()
+        for i, mutant in enumerate(members):
+            positions.append(((i + offset) / len(members), rng.random(), mutant))
+    return [mutant for _, _, mutant in sorted(positions)]
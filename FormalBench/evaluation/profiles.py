@@ -0,0 +1,174 @@
+from typing import Dict, List, Optional, Sequence
+import statistics
+import argparse
+import json
+import math
+import time
+import os
+import concurrent.futures
+from .metrics.completeness import CoverageScore, eval_completeness
+from .tools.mutation_analysis import PROFILES, create_mutator
+from .tools.mutant_cache import CachedMutantGenerator
+
+# Caches that would let a profile reuse the work of the profiles run before it
+_PROFILE_CACHES = ("cache_dir", "wp_cache_dir", "smt_cache_dir")
+
+
+def _ranks(values: List[float]) -> List[float]:
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        # Ties share the average of their ranks
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def _correlation(x: List[float], y: List[float]) -> float:
+    try:
+        return statistics.correlation(x, y)
+    except statistics.StatisticsError:
+        return math.nan
+
+
+def _generate_mutants(
+        spec_dir: str,
+        profile_dir: str,
+        benchmarks: List[str],
+        language: str,
+        profile: str,
+        mutator_name: Optional[str] = None,
+        mutant_cache_dir: Optional[str] = None,
+        generation_workers: int = 1
+    ) -> None:
+    ending = ".java" if language == "java" else ".c"
+    mutator = create_mutator(mutator_name or ("Major" if language == "java" else "Mull"), profile=profile)
+    if mutant_cache_dir is not None:
+        mutator = CachedMutantGenerator(mutator, mutant_cache_dir)
+    coverage_score = CoverageScore(None, mutator)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=generation_workers) as executor:
+        list(executor.map(
+            lambda b: coverage_score.generate_mutants(
+                os.path.join(spec_dir, f"{b}{ending}"), os.path.join(profile_dir, b)),
+            benchmarks))
+
+
+def compare_profiles(
+        spec_dir: str,
+        analysis_dir: str,
+        save_dir: str,
+        language: str = "java",
+        profiles: Sequence[str] = PROFILES,
+        data_ids: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, dict]:
+    """
+    Measure how closely the coverage of reduced operator profiles tracks the full profile, and what they save
+
+    Each profile is evaluated with `eval_completeness` in `save_dir/<profile>`
+    on the same benchmarks. Mutants are generated beforehand, so only their
+    verification is timed, and each profile gets its own verification, WP and
+    SMT caches under `<cache>/<profile>`. Results left in `save_dir` by an
+    earlier run are reused, so time a fresh `save_dir`.
+
+    Args:
+        spec_dir (str): Directory of the specifications, e.g. generated for Formal-Base
+        analysis_dir (str): Directory of their consistency analysis results
+        save_dir (str): Directory storing the mutants and results of each profile
+        language (str, optional): java or c. Defaults to java.
+        profiles (Sequence[str], optional): Profiles to compare. Defaults to all of them.
+        data_ids (str, optional): Comma-separated benchmarks to evaluate. Defaults to None (all of them).
+        **kwargs: Other arguments of `eval_completeness`
+
+    Returns:
+        Dict[str, dict]: For each profile, its average coverage, number of mutants and verification time in seconds and, against the full profile, the Pearson and Spearman correlations of the per-benchmark coverages, their mean absolute difference and the fraction of time saved
+    """
+    assert "full" in profiles, "The full profile is the reference of the comparison"
+    if data_ids is None:
+        ending = ".java" if language == "java" else ".c"
+        data_ids = ",".join(sorted(
+            file_name[:-len(ending)] for file_name in os.listdir(spec_dir) if file_name.endswith(ending)))
+
+    runs = {}
+    for profile in ["full"] + [profile for profile in profiles if profile != "full"]:
+        print("Evaluating completeness with the {} profile".format(profile))
+        profile_dir = os.path.join(save_dir, profile)
+        _generate_mutants(
+            spec_dir, profile_dir, data_ids.split(","), language, profile,
+            mutator_name=kwargs.get("mutator_name"), mutant_cache_dir=kwargs.get("mutant_cache_dir"),
+            generation_workers=kwargs.get("generation_workers", 1))
+        profile_kwargs = dict(kwargs)
+        for cache in _PROFILE_CACHES:
+            if profile_kwargs.get(cache) is not None:
+                profile_kwargs[cache] = os.path.join(profile_kwargs[cache], profile)
+        start = time.monotonic()
+        avg_coverage, coverage_results, _ = eval_completeness(
+            spec_dir, analysis_dir, profile_dir, language=language, data_ids=data_ids,
+            mutator_profile=profile, **profile_kwargs)
+        elapsed = time.monotonic() - start
+        n_mutants = 0
+        for b in data_ids.split(","):
+            mutation_dir = os.path.join(profile_dir, b, "mutants")
+            if os.path.isdir(mutation_dir):
+                n_mutants += len(os.listdir(mutation_dir))
+        runs[profile] = (avg_coverage, [None if c is None else float(c) for c in coverage_results], n_mutants, elapsed)
+
+    full_coverage = runs["full"][1]
+    report = {}
+    for profile, (avg_coverage, coverages, n_mutants, elapsed) in runs.items():
+        # Benchmarks without a verified mutant in either profile have no
+        # coverage to compare
+        pairs = [(a, b) for a, b in zip(coverages, full_coverage) if a is not None and b is not None]
+        x = [a for a, _ in pairs]
+        y = [b for _, b in pairs]
+        report[profile] = {
+            "avg_coverage": avg_coverage,
+            "n_mutants": n_mutants,
+            "time": elapsed,
+            "pearson": _correlation(x, y),
+            "spearman": _correlation(_ranks(x), _ranks(y)),
+            "mean_abs_diff": sum(abs(a - b) for a, b in pairs) / max(1, len(pairs)),
+            "time_saved": 1 - elapsed / runs["full"][3] if runs["full"][3] > 0 else 0.0
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="formalbench-profiles",
+        description="Compare the completeness scores of the mutation operator profiles with the full profile")
+    parser.add_argument("--spec-dir", required=True, help="Directory of the specifications")
+    parser.add_argument("--analysis-dir", required=True, help="Directory of the consistency analysis results")
+    parser.add_argument("--save-dir", required=True, help="Directory storing the mutants and results of each profile")
+    parser.add_argument("--language", default="java", help="Language of the specifications: java or c")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles to compare")
+    parser.add_argument("--data-ids", default=None, help="Comma-separated benchmarks to evaluate")
+    parser.add_argument("--n-proc", type=int, default=8, help="Number of mutants verified concurrently")
+    parser.add_argument("--timeout", type=int, default=300, help="Timeout of a verification in seconds")
+    parser.add_argument("--cache-dir", default=None, help="Directory of the verification result cache")
+    parser.add_argument("--output", default=None, help="Path of the JSON report")
+    args = parser.parse_args()
+
+    report = compare_profiles(
+        args.spec_dir, args.analysis_dir, args.save_dir, language=args.language,
+        profiles=args.profiles.split(","), data_ids=args.data_ids,
+        n_proc=args.n_proc, timeout=args.timeout, cache_dir=args.cache_dir)
+
+    print("{:<12}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}".format(
+        "profile", "coverage", "mutants", "time (s)", "pearson", "spearman", "mad", "time saved"))
+    for profile, row in report.items():
+        print("{:<12}{:>10.3f}{:>10}{:>10.0f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.0%}".format(
+            profile, row["avg_coverage"], row["n_mutants"], row["time"],
+            row["pearson"], row["spearman"], row["mean_abs_diff"], row["time_saved"]))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
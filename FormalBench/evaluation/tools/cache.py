@@ -0,0 +1,206 @@
+from typing import Callable, Dict, Optional, Tuple
+from functools import partial
+import concurrent.futures
+import threading
+import hashlib
+import json
+import os
+import uuid
+from .verifier import Verifier
+from .result import VerificationResult
+
+# Stands for the reported path of the verified file in cached outputs
+_DISPLAY_PATH = "<formalbench-file>"
+
+# Other verification entry points whose results are cached, keyed by their arguments as well
+_CACHED_METHODS = ("verify_fail_fast", "verify_methods", "verify_functions")
+
+
+class VerificationCache():
+    """
+    A content-addressed on-disk store of verification results.
+
+    Each entry is a small JSON file named after its key and sharded by the
+    first two hex digits of the key. Reads refresh the file's modification
+    time, so evicting the oldest files implements LRU. The directory can be
+    shared by several verifiers and processes: writes are atomic renames and
+    entries deleted by a concurrent eviction are treated as misses.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 100000) -> None:
+        assert max_entries > 0, "Cache size must be positive"
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._n_entries = sum(1 for _ in self._entries())
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            digest.update(hashlib.sha256(part).digest())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    yield entry
+
+    def get(self, key: str) -> Optional[VerificationResult]:
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                n_errors, output = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return VerificationResult(n_errors, output)
+
+    def put(self, key: str, result: Tuple[int, str]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+        with open(tmp_path, "w") as f:
+            json.dump([result[0], result[1]], f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._n_entries += 1
+            if self._n_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Drop the least recently used entries down to 90% of the capacity
+        # so that eviction scans are amortised over many insertions.
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        n_remove = max(0, len(entries) - int(self.max_entries * 0.9))
+        for _, path in entries[:n_remove]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._n_entries = len(entries) - n_remove
+
+
+class CachedVerifier(Verifier):
+    """
+    Wrap a verifier with a content-addressed result cache.
+
+    Results are keyed by the file contents and name, the verifier signature
+    and the timeout. Concurrent requests for the same key are coalesced into a single
+    verification. Timeouts are not cached since they depend on the load of the
+    machine rather than on the specification. `verify_fail_fast`,
+    `verify_methods` and `verify_functions` of the wrapped verifier are cached
+    as well, under keys that also hold their name and arguments.
+    """
+
+    def __init__(self, verifier: Verifier, cache_dir: str, max_entries: int = 100000) -> None:
+        self.verifier = verifier
+        self.cache = VerificationCache(cache_dir, max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, concurrent.futures.Future] = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.verifier, name)
+        if name in _CACHED_METHODS:
+            return partial(self._verify_cached, name, attr)
+        return attr
+
+    def signature(self) -> str:
+        return self.verifier.signature()
+
+    def extract_output(self, output: str) -> Tuple[int, str]:
+        return self.verifier.extract_output(output)
+
+    def _display_path(self, path: str, basedir: str) -> str:
+        # Path at which verifiers report the file, see the verifiers' `_run`
+        tmp_dir = getattr(self.verifier, "tmp_dir", "/tmp/")
+        return os.path.join(tmp_dir, basedir, os.path.basename(path))
+
+    def verify(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+        return self._cached(
+            path, timeout, basedir, lambda: self.verifier.verify(path, timeout=timeout, basedir=basedir))
+
+    def _verify_cached(
+            self,
+            name: str,
+            method: Callable[..., Tuple[int, str]],
+            path: str,
+            *args,
+            timeout: int = 1800,
+            basedir: str = "",
+            **kwargs
+        ) -> Tuple[int, str]:
+        return self._cached(
+            path, timeout, basedir, lambda: method(path, *args, timeout=timeout, basedir=basedir, **kwargs),
+            name, json.dumps([args, kwargs], sort_keys=True))
+
+    def _cached(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            run: Callable[[], Tuple[int, str]],
+            *key_parts: str
+        ) -> Tuple[int, str]:
+
+        with open(path, "rb") as f:
+            content = f.read()
+        # Java requires public classes to match their file, so the file name is part of the key
+        key = VerificationCache.make_key(
+            content, os.path.basename(path), *key_parts, self.verifier.signature(), str(timeout))
+        display_path = self._display_path(path, basedir)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            result = self.cache.get(key)
+            with self._lock:
+                if result is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if result is not None:
+                result = VerificationResult(
+                    result.n_errors, result.output.replace(_DISPLAY_PATH, display_path))
+            else:
+                result = run()
+                if result[0] != -1:
+                    # Entries are shared by files of other benchmarks, which report their own path
+                    self.cache.put(key, (result[0], result[1].replace(display_path, _DISPLAY_PATH)))
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return result
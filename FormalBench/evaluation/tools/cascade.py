@@ -0,0 +1,97 @@
+from typing import Dict, NamedTuple, Tuple
+import threading
+import time
+import re
+from .verifier import Verifier
+
+# Goals whose prover ran out of time, which the full budget may decide otherwise
+_TIMED_OUT_GOAL = re.compile(r"\[wp\] \[Timeout\] typed_")
+
+
+class CascadePolicy(NamedTuple):
+    """
+    Stages tried before a full verification.
+
+    `typecheck` rejects files with syntax or type errors without running the
+    provers. The short stage then runs the provers with a small budget:
+    `short_timeout` seconds per OpenJML run, or a per-goal prover timeout of
+    `short_prover_timeout` seconds for Frama-C. Only files whose short stage
+    times out, or has a goal whose prover times out, are verified again with
+    the full budget.
+    """
+    typecheck: bool = True
+    short_timeout: int = 30
+    short_prover_timeout: int = 2
+
+
+class CascadeVerifier(Verifier):
+    """
+    Verify files through the stages of a `CascadePolicy`, stopping at the first conclusive stage.
+
+    `stats` records, for each stage, how many files it ran on, how many it
+    decided and the time spent in it.
+    """
+
+    STAGES = ("typecheck", "short", "full")
+
+    def __init__(self, verifier: Verifier, policy: CascadePolicy = CascadePolicy()) -> None:
+        assert not policy.typecheck or hasattr(verifier, "check"), \
+            "Verifier {} does not support type-checking".format(type(verifier).__name__)
+        self.verifier = verifier
+        self.policy = policy
+        self.stats: Dict[str, Dict[str, float]] = {
+            stage: {"runs": 0, "decided": 0, "time": 0.0} for stage in self.STAGES
+        }
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.verifier, name)
+
+    def signature(self) -> str:
+        return self.verifier.signature() + ":cascade"
+
+    def extract_output(self, output: str) -> Tuple[int, str]:
+        return self.verifier.extract_output(output)
+
+    def _record(self, stage: str, start: float, decided: bool) -> None:
+        with self._lock:
+            self.stats[stage]["runs"] += 1
+            self.stats[stage]["decided"] += int(decided)
+            self.stats[stage]["time"] += time.monotonic() - start
+
+    def _short(self, path: str, timeout: int, basedir: str) -> Tuple[int, str]:
+        if hasattr(self.verifier, "verify_with_prover_timeout"):
+            return self.verifier.verify_with_prover_timeout(
+                path, self.policy.short_prover_timeout, timeout=timeout, basedir=basedir)
+        return self.verifier.verify(
+            path, timeout=min(timeout, self.policy.short_timeout), basedir=basedir)
+
+    def verify(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+
+        if self.policy.typecheck:
+            start = time.monotonic()
+            result = self.verifier.check(path, basedir=basedir, timeout=timeout)
+            decided = result[0] > 0
+            self._record("typecheck", start, decided)
+            if decided:
+                return result
+
+        start = time.monotonic()
+        result = self._short(path, timeout, basedir)
+        # A timeout at the full budget is final as well.
+        decided = (result[0] != -1 and not _TIMED_OUT_GOAL.search(result[1])) or (
+            not hasattr(self.verifier, "verify_with_prover_timeout")
+            and self.policy.short_timeout >= timeout)
+        self._record("short", start, decided)
+        if decided:
+            return result
+
+        start = time.monotonic()
+        result = self.verifier.verify(path, timeout=timeout, basedir=basedir)
+        self._record("full", start, True)
+        return result
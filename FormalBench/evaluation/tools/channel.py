@@ -0,0 +1,168 @@
+from typing import List, Optional
+import subprocess
+import threading
+import time
+from docker.utils.socket import frames_iter
+from ..utils import kill_process_tree
+
+# Stops a process in a container: SIGTERM, then SIGKILL if it is still alive after two seconds
+_KILL_SCRIPT = (
+    "kill -TERM {pid}; i=0; "
+    "while [ $i -lt 20 ] && kill -0 {pid} 2>/dev/null; do sleep 0.1; i=$((i + 1)); done; "
+    "kill -9 {pid} 2>/dev/null"
+)
+
+
+class Channel():
+    """
+    A bidirectional byte stream to a long-lived process.
+
+    A background thread drains the process output into a buffer so that reads
+    can wait with a deadline, which is how callers implement per-job timeouts
+    on a process that outlives the job.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._eof = False
+        self._cond = threading.Condition()
+
+    def _start_reader(self) -> None:
+        thread = threading.Thread(target=self._drain, daemon=True)
+        thread.start()
+
+    def _drain(self) -> None:
+        try:
+            for chunk in self._chunks():
+                with self._cond:
+                    self._buffer += chunk
+                    self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def _chunks(self):
+        raise NotImplementedError
+
+    def _wait_for(self, ready, timeout: Optional[float]) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not ready() and not self._eof:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def readline(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Read one line, including its trailing newline.
+
+        Returns:
+            Optional[bytes]: The line, b"" at end of stream or None if the timeout expired
+        """
+        if not self._wait_for(lambda: b"\n" in self._buffer, timeout):
+            return None
+        with self._cond:
+            idx = self._buffer.find(b"\n")
+            end = len(self._buffer) if idx < 0 else idx + 1
+            line = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            return line
+
+    def read_exactly(self, n: int, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Read exactly `n` bytes. Returns fewer bytes at end of stream and None if the timeout expired
+        """
+        if not self._wait_for(lambda: len(self._buffer) >= n, timeout):
+            return None
+        with self._cond:
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+            return data
+
+    @property
+    def closed(self) -> bool:
+        return self._eof
+
+    def send(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def kill(self) -> None:
+        raise NotImplementedError
+
+
+class LocalChannel(Channel):
+    """
+    A channel to a local subprocess. Stderr is merged into stdout.
+    """
+
+    def __init__(self, cmd: List[str], cwd: Optional[str] = None) -> None:
+        super().__init__()
+        self.process = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
+        )
+        self._start_reader()
+
+    def _chunks(self):
+        while True:
+            chunk = self.process.stdout.read1(65536)
+            if not chunk:
+                return
+            yield chunk
+
+    def send(self, data: bytes) -> None:
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def kill(self) -> None:
+        kill_process_tree(self.process.pid)
+        self.process.wait()
+
+
+class DockerExecChannel(Channel):
+    """
+    A channel to a process started with `docker exec` and attached through the exec socket.
+
+    The script runs under `bash -c 'echo $$; <script>'` so that its pid inside
+    the container is known and it can be killed with another exec. Scripts
+    should `exec` their long-lived process to keep that pid. The process gets
+    SIGTERM, so that it can stop its children, and SIGKILL two seconds later.
+    """
+
+    def __init__(self, container, script: str, workdir: Optional[str] = None) -> None:
+        super().__init__()
+        self.container = container
+        exec_result = container.exec_run(
+            ["/bin/bash", "-c", "echo $$; {}".format(script)],
+            stdin=True,
+            socket=True,
+            workdir=workdir
+        )
+        self.socket = exec_result.output
+        self._start_reader()
+        line = self.readline(timeout=60)
+        assert line, "Failed to start process in container: {}".format(script)
+        self.pid = int(line.strip())
+
+    def _chunks(self):
+        for _, chunk in frames_iter(self.socket, tty=False):
+            yield chunk
+
+    def send(self, data: bytes) -> None:
+        raw = getattr(self.socket, "_sock", self.socket)
+        raw.sendall(data)
+
+    def kill(self) -> None:
+        self.container.exec_run(["/bin/sh", "-c", _KILL_SCRIPT.format(pid=self.pid)])
+        try:
+            self.socket.close()
+        except OSError:
+            pass
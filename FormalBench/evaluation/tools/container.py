@@ -0,0 +1,294 @@
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, List, Optional, Union
+import concurrent.futures
+import threading
+import hashlib
+import atexit
+import json
+import time
+import os
+import docker
+from .channel import DockerExecChannel
+from .shell import SHELL_WORKER_SCRIPT, ShellCrashed, ShellResult, ShellWorkerPool, shell_command
+
+# Number of docker API connections reserved for each container of a pool.
+# A verification holds one connection for the whole exec, so this bounds how
+# many concurrent calls can be in flight against one container without
+# urllib3 discarding connections ("Connection pool is full").
+_CONNECTIONS_PER_CONTAINER = 4
+
+# Every container started by FormalBench carries the first label; reusable
+# containers also carry the key of their configuration.
+LABEL = "formalbench"
+POOL_LABEL = "formalbench.pool"
+CPUSET_LABEL = "formalbench.cpuset"
+
+# Keep containers running after exit and attach to them in later runs.
+REUSE_CONTAINERS = os.environ.get("FORMALBENCH_REUSE_CONTAINERS", "0") == "1"
+
+# Run commands through persistent shell workers instead of one docker exec
+# each. Off by default: each worker keeps a docker exec connection open.
+PERSISTENT_SHELL = os.environ.get("FORMALBENCH_PERSISTENT_SHELL", "0") == "1"
+
+
+def create_docker_client(pool_size: int = 1) -> docker.DockerClient:
+    """
+    Create a docker client whose HTTP connection pool is sized for a container pool
+
+    Args:
+        pool_size (int, optional): Number of containers that will be driven by the client. Defaults to 1.
+
+    Returns:
+        docker.DockerClient: A docker client
+    """
+    max_pool_size = max(docker.constants.DEFAULT_MAX_POOL_SIZE,
+                        pool_size * _CONNECTIONS_PER_CONTAINER)
+    return docker.from_env(max_pool_size=max_pool_size)
+
+
+def partition_cpus(n: int) -> List[str]:
+    """
+    Split the cores available to this process into `n` disjoint cpusets, one per container
+
+    When there are fewer cores than containers, containers share single cores round-robin.
+
+    Returns:
+        List[str]: The cpusets, in the format of docker's `cpuset_cpus`, e.g. "0,1,2,3"
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if n >= len(cores):
+        return [str(cores[i % len(cores)]) for i in range(n)]
+    size, extra = divmod(len(cores), n)
+    cpusets = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        cpusets.append(",".join(str(core) for core in cores[start:end]))
+        start = end
+    return cpusets
+
+
+def _force_remove(container) -> None:
+    # Kill and remove in one call, skipping the stop grace period.
+    try:
+        container.remove(force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+def shutdown_containers(client: Optional[docker.DockerClient] = None) -> int:
+    """
+    Kill and remove every container started by FormalBench, including reusable ones left running
+
+    Returns:
+        int: The number of removed containers
+    """
+    client = client or docker.from_env()
+    containers = client.containers.list(all=True, filters={"label": LABEL})
+    threads = [threading.Thread(target=_force_remove, args=(c,)) for c in containers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(containers)
+
+
+class ContainerPool():
+    """
+    A fixed-size pool of identically configured docker containers.
+
+    Containers are started in parallel and leased to callers. A lease is not
+    exclusive: it hands out the container with the fewest in-flight calls so
+    that a pool of size one behaves exactly like a single shared container.
+
+    With `reuse`, containers are labelled with a key of their configuration
+    (image, volumes and environment) and left running at exit. A later pool
+    with the same configuration attaches to the healthy ones instead of
+    starting new containers. `shutdown_containers` removes them.
+
+    With `cpusets`, container i is pinned to cpusets[i] (see `partition_cpus`).
+
+    With `persistent_shell`, `exec_run` sends commands to shell workers
+    started once in each container rather than creating a docker exec per
+    command. It defaults to $FORMALBENCH_PERSISTENT_SHELL, off unless set to 1.
+    """
+
+    def __init__(
+            self,
+            client: docker.DockerClient,
+            image_name: str,
+            volumes: Dict[str, dict],
+            size: int = 1,
+            environment: Optional[Dict[str, str]] = None,
+            reuse: Optional[bool] = None,
+            persistent_shell: Optional[bool] = None,
+            cpusets: Optional[List[str]] = None
+        ) -> None:
+        assert size >= 1, "Pool size must be at least 1"
+        self.client = client
+        self.image_name = image_name
+        self.volumes = volumes
+        self.environment = environment
+        self.size = size
+        self.cpusets = cpusets
+        assert cpusets is None or len(cpusets) == size, "One cpuset is needed per container"
+        self.reuse = REUSE_CONTAINERS if reuse is None else reuse
+        self.key = hashlib.sha256(
+            json.dumps([image_name, volumes, environment, cpusets], sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+        attached = self._attach() if self.reuse else []
+        # Pinned containers are told apart by their cpuset, so only the
+        # missing ones are started.
+        missing = list(range(size))
+        if cpusets is not None:
+            for container in attached:
+                missing.remove(cpusets.index(container.labels.get(CPUSET_LABEL)))
+        else:
+            missing = missing[len(attached):]
+        started = []
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                started = list(executor.map(self._start, missing))
+
+        for container in started:
+            assert container.status == "created", "Container failed to start"
+        self.containers: List = attached + started
+
+        self._lock = threading.Lock()
+        self._in_flight = {container.id: 0 for container in self.containers}
+        self.shells = None
+        if PERSISTENT_SHELL if persistent_shell is None else persistent_shell:
+            self.shells = {
+                container.id: ShellWorkerPool(partial(DockerExecChannel, container, SHELL_WORKER_SCRIPT))
+                for container in self.containers
+            }
+        self._closed = False
+        atexit.register(self.clean_up)
+
+    def _attach(self) -> list:
+        candidates = self.client.containers.list(
+            filters={"label": "{}={}".format(POOL_LABEL, self.key), "status": "running"})
+        attached = []
+        cpusets = set()
+        for container in candidates:
+            if len(attached) == self.size:
+                break
+            cpuset = container.labels.get(CPUSET_LABEL)
+            if self.cpusets is not None and (cpuset not in self.cpusets or cpuset in cpusets):
+                continue
+            try:
+                if container.exec_run(["true"]).exit_code == 0:
+                    attached.append(container)
+                    cpusets.add(cpuset)
+            except docker.errors.APIError:
+                continue
+        if attached:
+            print("Attached to {} running container(s) of {}".format(len(attached), self.image_name))
+        return attached
+
+    def _start(self, index: int):
+        labels = {LABEL: "1"}
+        if self.reuse:
+            labels[POOL_LABEL] = self.key
+        cpuset = None
+        if self.cpusets is not None:
+            cpuset = self.cpusets[index]
+            labels[CPUSET_LABEL] = cpuset
+        return self.client.containers.run(
+            self.image_name,
+            "/bin/bash",
+            detach=True,
+            tty=True,
+            volumes=self.volumes,
+            environment=self.environment,
+            labels=labels,
+            cpuset_cpus=cpuset
+        )
+
+    @contextmanager
+    def lease(self):
+        """
+        Lease the least loaded container of the pool for the duration of a `with` block
+        """
+        with self._lock:
+            container = min(self.containers, key=lambda c: self._in_flight[c.id])
+            self._in_flight[container.id] += 1
+        try:
+            yield container
+        finally:
+            with self._lock:
+                self._in_flight[container.id] -= 1
+
+    def exec_run(
+            self,
+            container,
+            cmd: Union[str, List[str]],
+            environment: Optional[Dict[str, str]] = None,
+            workdir: Optional[str] = None
+        ):
+        """
+        Run a command in a container of the pool, like `container.exec_run`
+
+        Returns:
+            ShellResult: The exit code, the output and the elapsed time in seconds
+        """
+        if self.shells is not None:
+            try:
+                return self.shells[container.id].run(shell_command(cmd, environment, workdir))
+            except ShellCrashed as e:
+                print("[WARNING] Shell worker crashed, falling back to docker exec: {}".format(e))
+        start = time.monotonic()
+        exec_result = container.exec_run(cmd, environment=environment, workdir=workdir)
+        return ShellResult(exec_result.exit_code, exec_result.output, time.monotonic() - start)
+
+    def run_on_all(self, func) -> list:
+        """
+        Apply a function to every container of the pool in parallel
+        """
+        # Plain threads rather than an executor: this also runs from atexit,
+        # after which concurrent.futures refuses to schedule new work.
+        results = [None] * len(self.containers)
+
+        def _run(idx, container):
+            results[idx] = func(container)
+
+        threads = [
+            threading.Thread(target=_run, args=(idx, container))
+            for idx, container in enumerate(self.containers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def clean_up(self):
+        """
+        Release the containers at exit: reusable containers keep running, others are killed and removed
+        """
+        if self.reuse:
+            if not self._closed:
+                self._closed = True
+                # Shell workers belong to this process; the containers outlive it.
+                self._stop_shells()
+                print("Leaving {} docker container(s) running for reuse".format(len(self.containers)))
+            return
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Kill and remove the containers of the pool in parallel, even reusable ones
+        """
+        if self._closed and not self.reuse:
+            return
+        self._closed = True
+        self.reuse = False
+        print("Cleaning up {} docker container(s)".format(len(self.containers)))
+        self.run_on_all(_force_remove)
+
+    def _stop_shells(self):
+        if self.shells is not None:
+            for shells in self.shells.values():
+                shells.stop()
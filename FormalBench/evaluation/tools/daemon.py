@@ -0,0 +1,153 @@
+from typing import Callable, List, Optional, Tuple
+import threading
+import time
+import os
+from .channel import Channel
+import FormalBench
+
+_LIB_DIR = os.path.dirname(os.path.abspath(FormalBench.__file__))
+
+WORKER_SOURCE = os.path.join(_LIB_DIR, "config", "OpenJMLWorker.java")
+_DONE = b"__FORMALBENCH_DONE__"
+
+
+def openjml_worker_script(openjml_home: str, worker_dir: str) -> str:
+    """
+    Build the bash script that starts an OpenJML worker JVM.
+
+    OpenJML releases ship their own JDK image with the JML-aware compiler in
+    the jdk.compiler module, so the worker runs on that JVM with the OpenJML
+    packages exported to it. The release's openjml.jar, if any, is also put on
+    the class path.
+    """
+    return (
+        'J={home}/bin/java; [ -x "$J" ] || J=java; '
+        'exec "$J" --add-exports jdk.compiler/org.jmlspecs.openjml=ALL-UNNAMED '
+        '-cp {worker_dir}:{home}/openjml.jar OpenJMLWorker'
+    ).format(home=openjml_home, worker_dir=worker_dir)
+
+
+def openjml_worker_build_script(openjml_home: str, worker_dir: str) -> str:
+    """
+    Build the bash script that compiles the OpenJML worker into `worker_dir`
+    """
+    return (
+        'J={home}/bin/javac; [ -x "$J" ] || J=javac; '
+        '"$J" -d {worker_dir} {worker_dir}/OpenJMLWorker.java'
+    ).format(home=openjml_home, worker_dir=worker_dir)
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class OpenJMLDaemon():
+    """
+    A long-lived OpenJML worker JVM that verifies one job at a time.
+
+    The worker is (re)started lazily and recycled after `max_jobs` jobs or when
+    its heap grows beyond `max_memory` bytes. On timeout the worker is killed,
+    since a running proof cannot be interrupted from the outside.
+    """
+
+    def __init__(
+            self,
+            spawn: Callable[[], Channel],
+            max_jobs: int = 500,
+            max_memory: int = 2 * 1024 ** 3
+        ) -> None:
+        self.spawn = spawn
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.channel: Optional[Channel] = None
+        self.n_jobs = 0
+
+    def run(self, args: List[str], timeout: int) -> Tuple[int, str]:
+        """
+        Run OpenJML with the given command-line arguments
+
+        Args:
+            args (List[str]): OpenJML command-line arguments
+            timeout (int): timeout in seconds
+
+        Returns:
+            Tuple[int, str]: The exit code (124 on timeout, as with `timeout`) and the output of OpenJML
+        """
+        if self.channel is None or self.channel.closed:
+            self.channel = self.spawn()
+            self.n_jobs = 0
+
+        self.channel.send(("\t".join(args) + "\n").encode("utf-8"))
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            line = self.channel.readline(timeout=max(0, deadline - time.monotonic()))
+            if line is None:
+                self.stop()
+                return 124, "Timeout"
+            if line == b"":
+                self.stop()
+                raise WorkerCrashed(b"".join(lines).decode("utf-8", errors="replace"))
+            if line.startswith(_DONE):
+                _, exit_code, used_memory = line.split()
+                break
+            lines.append(line)
+
+        self.n_jobs += 1
+        if self.n_jobs >= self.max_jobs or int(used_memory) > self.max_memory:
+            self.stop()
+
+        output = b"".join(lines)
+        # The worker separates the output from the marker with a newline.
+        if output.endswith(b"\n"):
+            output = output[:-1]
+        return int(exit_code), output.decode("utf-8")
+
+    def stop(self) -> None:
+        if self.channel is not None:
+            self.channel.kill()
+            self.channel = None
+
+
+class OpenJMLDaemonPool():
+    """
+    A set of OpenJML daemons sharing one environment (a container or the host).
+
+    Daemons are started on demand, up to `max_workers` concurrent jobs, and
+    kept warm between jobs.
+    """
+
+    def __init__(
+            self,
+            spawn: Callable[[], Channel],
+            max_workers: int = 8,
+            max_jobs: int = 500,
+            max_memory: int = 2 * 1024 ** 3
+        ) -> None:
+        self.spawn = spawn
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self._idle: List[OpenJMLDaemon] = []
+        self._cond = threading.Condition()
+        self._available = max_workers
+
+    def run(self, args: List[str], timeout: int) -> Tuple[int, str]:
+        with self._cond:
+            while not self._idle and self._available == 0:
+                self._cond.wait()
+            if self._idle:
+                daemon = self._idle.pop()
+            else:
+                self._available -= 1
+                daemon = OpenJMLDaemon(self.spawn, self.max_jobs, self.max_memory)
+        try:
+            return daemon.run(args, timeout)
+        finally:
+            with self._cond:
+                self._idle.append(daemon)
+                self._cond.notify()
+
+    def stop(self) -> None:
+        with self._cond:
+            for daemon in self._idle:
+                daemon.stop()
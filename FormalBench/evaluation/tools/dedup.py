@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional
+import concurrent.futures
+import subprocess
+import tempfile
+import hashlib
+import shutil
+import os
+from .source import normalize_source
+
+ORIGINAL = "Original"
+
+
+def source_key(path: str) -> str:
+    """
+    Hash of the normalized source of a program, see `normalize_source`
+    """
+    with open(path, "r") as f:
+        code = f.read()
+    return hashlib.sha256(normalize_source(code).encode("utf-8")).hexdigest()
+
+
+def compiled_key(path: str) -> Optional[str]:
+    """
+    Hash of the unoptimized LLVM IR or assembly (C) or bytecode (Java) of a program, compiled with the local clang, gcc or javac
+
+    Returns:
+        Optional[str]: The hash, or None if the compiler is not found or the program does not compile
+    """
+    digest = hashlib.sha256()
+    if path.endswith(".c"):
+        clang = shutil.which("clang") or shutil.which("clang-12")
+        if clang is not None:
+            cmd = [clang, "-S", "-emit-llvm", "-O0", "-g0", "-w", "-o", "-", path]
+        elif shutil.which("gcc") is not None:
+            cmd = ["gcc", "-S", "-O0", "-g0", "-w", "-o", "-", path]
+        else:
+            return None
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if process.returncode != 0:
+            return None
+        for line in process.stdout.splitlines(keepends=True):
+            # Skip the lines naming the source file
+            if not line.startswith((b"; ModuleID", b"source_filename", b"\t.file")):
+                digest.update(line)
+        return digest.hexdigest()
+
+    if path.endswith(".java"):
+        javac = shutil.which("javac")
+        if javac is None:
+            return None
+        with tempfile.TemporaryDirectory() as class_dir:
+            process = subprocess.run(
+                [javac, "-g:none", "-proc:none", "-nowarn", "-d", class_dir, path],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if process.returncode != 0:
+                return None
+            for root, _, files in sorted(os.walk(class_dir)):
+                for name in sorted(files):
+                    class_path = os.path.join(root, name)
+                    digest.update(os.path.relpath(class_path, class_dir).encode("utf-8"))
+                    with open(class_path, "rb") as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+    return None
+
+
+def group_mutants(
+        mutation_dir: str,
+        basename: str,
+        original_path: Optional[str] = None,
+        compiled: bool = False,
+        n_proc: int = 1
+    ) -> Dict[str, List[str]]:
+    """
+    Group the mutants of `mutation_dir` that are the same program
+
+    Mutants are first grouped by their normalized source and, with `compiled`,
+    the groups whose compiled programs are identical are merged. Mutants that
+    are the same program as `original_path` form the group `ORIGINAL`.
+
+    Args:
+        mutation_dir (str): Directory of the mutants, one `<mutant>/<basename>` per mutant
+        basename (str): File name of the program
+        original_path (str, optional): Path to the original program. Defaults to None.
+        compiled (bool, optional): Also group mutants by their compiled program, see `compiled_key`. Defaults to False.
+        n_proc (int, optional): Number of programs hashed concurrently. Defaults to 1.
+
+    Returns:
+        Dict[str, List[str]]: The members of each group, representative included, by representative
+    """
+    mutants = sorted(os.listdir(mutation_dir))
+    paths = [os.path.join(mutation_dir, mutant, basename) for mutant in mutants]
+    if original_path is not None:
+        # First, so that the original program, whose result is known, represents its group
+        mutants.insert(0, ORIGINAL)
+        paths.insert(0, original_path)
+
+    def _keys(path: str):
+        return source_key(path), compiled_key(path) if compiled else None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_proc) as executor:
+        keys = list(executor.map(_keys, paths))
+
+    representatives = {}
+    groups: Dict[str, List[str]] = {}
+    for mutant, (key, compiled_hash) in zip(mutants, keys):
+        representative = representatives.get(key)
+        if representative is None and compiled_hash is not None:
+            representative = representatives.get(compiled_hash)
+        if representative is None:
+            representative = mutant
+            groups[representative] = []
+        groups[representative].append(mutant)
+        representatives.setdefault(key, representative)
+        if compiled_hash is not None:
+            representatives.setdefault(compiled_hash, representative)
+    return groups
@@ -0,0 +1,56 @@
+from typing import List, Optional, Tuple
+import tempfile
+import threading
+from .verifier import Verifier
+from .cache import VerificationCache
+from .split import SplitVerifier
+
+
+class IncrementalVerifier(SplitVerifier):
+    """
+    Verify files unit by unit and reuse the results of unchanged units.
+
+    Files are split as in `SplitVerifier`. A unit's result is cached under its
+    own source and contract together with the file-level context: fields,
+    invariants and the contracts of all methods or functions. Changing a body
+    therefore only re-verifies that unit, while changing a contract or an
+    invariant re-verifies the whole file.
+    """
+
+    def __init__(
+            self,
+            verifier: Verifier,
+            cache_dir: Optional[str] = None,
+            max_entries: int = 100000,
+            n_workers: int = 1
+        ) -> None:
+        super().__init__(verifier, n_workers=n_workers)
+        if cache_dir is None:
+            cache_dir = tempfile.mkdtemp(prefix="formalbench-units-")
+        self.cache = VerificationCache(cache_dir, max_entries=max_entries)
+        self.n_verified_units = 0
+        self.n_reused_units = 0
+        self._lock = threading.Lock()
+
+    def signature(self) -> str:
+        return self.verifier.signature() + ":incremental"
+
+    def verify_unit(
+            self,
+            path: str,
+            job: Tuple[str, List[str], bool],
+            timeout: int,
+            basedir: str
+        ) -> Tuple[int, str]:
+        key = job[0]
+        result = self.cache.get(key)
+        if result is not None:
+            with self._lock:
+                self.n_reused_units += 1
+            return result
+        with self._lock:
+            self.n_verified_units += 1
+        result = super().verify_unit(path, job, timeout, basedir)
+        if result[0] != -1:
+            self.cache.put(key, result)
+        return result
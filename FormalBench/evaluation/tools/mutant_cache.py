@@ -0,0 +1,117 @@
+from typing import Dict, Optional
+import threading
+import tempfile
+import shutil
+import os
+from .mutation_analysis import MutantGenerator
+from .cache import VerificationCache
+from .source import split_annotations, splice_annotations
+
+
+class CachedMutantGenerator(MutantGenerator):
+    """
+    Generate the mutants of a program once and re-annotate them for each specification.
+
+    Specifications of the same program differ only in their annotations, and
+    mutation operators do not touch comments. Mutants are therefore generated
+    from the program without annotations, stored under a hash of it, and the
+    annotations of each specification are spliced back onto the stored
+    mutants. A specification whose annotations sit inside a mutated region is
+    handed to the underlying mutator as is. Runs producing no mutants are not
+    stored, so a failed run of the mutator is retried.
+
+    Other attributes are delegated to the wrapped mutator.
+    """
+
+    def __init__(self, mutator: MutantGenerator, cache_dir: str) -> None:
+        self.mutator = mutator
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.mutator, name)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _populate(self, key: str, stripped: str, file_name: str) -> Optional[str]:
+        entry_dir = self._entry_dir(key)
+        with self._key_lock(key):
+            if os.path.exists(entry_dir):
+                return entry_dir
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(entry_dir))
+            try:
+                src_dir = os.path.join(tmp_dir, "src")
+                os.makedirs(src_dir)
+                with open(os.path.join(src_dir, file_name), "w") as f:
+                    f.write(stripped)
+                self.mutator.generate_mutants(os.path.join(src_dir, file_name), tmp_dir)
+                mutation_dir = os.path.join(tmp_dir, "mutants")
+                if not os.path.isdir(mutation_dir) or len(os.listdir(mutation_dir)) == 0:
+                    # Likely a failed run of the mutator, which should not be stored
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return None
+                try:
+                    os.replace(tmp_dir, entry_dir)
+                except OSError:
+                    # Another process stored the same entry first
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+        return entry_dir
+
+    def generate_mutants(self, path: str, out_dir: str):
+        with open(path, "r") as f:
+            code = f.read()
+        stripped, spans = split_annotations(code)
+        file_name = os.path.basename(path)
+        key = VerificationCache.make_key(
+            stripped, file_name, type(self.mutator).__name__, getattr(self.mutator, "profile", "full"))
+        entry_dir = self._populate(key, stripped, file_name)
+        if entry_dir is None:
+            print("[WARNING]: No mutants generated")
+            return
+
+        mutants = []
+        cached_dir = os.path.join(entry_dir, "mutants")
+        for root, _, files in os.walk(cached_dir):
+            for name in files:
+                cached_path = os.path.join(root, name)
+                out_path = os.path.join(out_dir, "mutants", os.path.relpath(cached_path, cached_dir))
+                if name != file_name:
+                    mutants.append((cached_path, out_path, None))
+                    continue
+                with open(cached_path, "r") as f:
+                    mutant = splice_annotations(code, spans, stripped, f.read())
+                if mutant is None:
+                    print("[WARNING]: Mutant {} changes an annotation of {}. Generating mutants without the cache".format(
+                        cached_path, path))
+                    self.mutator.generate_mutants(path, out_dir)
+                    return
+                mutants.append((cached_path, out_path, mutant))
+
+        if len(mutants) == 0:
+            print("[WARNING]: No mutants generated")
+        # Operators of the mutants, see `mutant_operators`
+        if os.path.exists(os.path.join(entry_dir, "mutants.log")):
+            os.makedirs(out_dir, exist_ok=True)
+            shutil.copyfile(os.path.join(entry_dir, "mutants.log"), os.path.join(out_dir, "mutants.log"))
+        if os.path.isdir(os.path.join(entry_dir, "mutants-patches")):
+            shutil.copytree(os.path.join(entry_dir, "mutants-patches"), os.path.join(out_dir, "mutants-patches"),
+                            dirs_exist_ok=True)
+        for cached_path, out_path, mutant in mutants:
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            if mutant is None:
+                shutil.copyfile(cached_path, out_path)
+            else:
+                with open(out_path, "w") as f:
+                    f.write(mutant)
+            shutil.copymode(path, out_path)
@@ -1,24 +1,134 @@
 from abc import ABC, abstractmethod
+from typing import Optional
+import subprocess
+import tempfile
+import uuid
+import shutil
 import os
-import atexit
-import docker
+import re
+from .container import ContainerPool, create_docker_client
 from ..utils import (
     execute_command, 
     copy_to_container, 
     copy_from_container,
-    execute_command_in_container
+    stage_in_container,
+    write_to_container
 )
 import time
 import FormalBench
 
 _LIB_DIR = os.path.dirname(os.path.abspath(FormalBench.__file__))
 
-def create_mutator(name: str) -> "MutantGenerator":
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+_LLVM_CRASH = "PLEASE submit a bug report to https://bugs.llvm.org/"
+_MULL_MAX_RETRIES = 20
+
+# Operator profiles, from the largest to the cheapest set of mutation operators
+PROFILES = ("full", "sufficient", "minimal")
+
+def _profile_config(mutator: str, profile: str) -> str:
+    """
+    Path to the configuration of an operator profile: a compiled MML file (full) or MML source for Major, a yml file for Mull
+    """
+    assert profile in PROFILES, "Unknown operator profile: {}. Please select from {}".format(profile, list(PROFILES))
+    if mutator == "major":
+        name = "major.mml.bin" if profile == "full" else "major-{}.mml".format(profile)
+    else:
+        name = "mull.yml" if profile == "full" else "mull-{}.yml".format(profile)
+    config_path = os.path.abspath(os.path.join(_LIB_DIR, "config", name))
+    assert os.path.exists(
+        config_path
+    ), "{} config file not found at: {}. Please re-download our package".format(mutator.capitalize(), config_path)
+    return config_path
+
+def apply_patch(source: str, patch: str) -> str:
+    """
+    Apply a unified diff of a single file, such as the patches written by Mull
+
+    Raises:
+        ValueError: If the context or removed lines of a hunk do not match the source
+
+    Returns:
+        str: The patched source
+    """
+    lines = source.splitlines(keepends=True)
+    patch_lines = patch.splitlines(keepends=True)
+    result = []
+    pos = 0
+    i = 0
+    while i < len(patch_lines):
+        match = _HUNK_HEADER.match(patch_lines[i])
+        i += 1
+        if match is None:
+            continue
+        start = int(match.group(1)) - 1
+        if match.group(2) == "0":
+            # Pure insertions are located after the given line.
+            start += 1
+        if start < pos:
+            raise ValueError("Overlapping hunks")
+        result.extend(lines[pos:start])
+        pos = start
+        tag = None
+        while i < len(patch_lines) and not patch_lines[i].startswith("@@"):
+            line = patch_lines[i]
+            i += 1
+            if line.startswith("\\"):
+                # "\ No newline at end of file" applies to the previous line.
+                if tag == "+":
+                    result[-1] = result[-1].rstrip("\r\n")
+                continue
+            tag, text = (line[:1], line[1:]) if line.strip("\r\n") else (" ", line)
+            if tag in (" ", "-"):
+                if pos >= len(lines) or lines[pos].rstrip("\r\n") != text.rstrip("\r\n"):
+                    raise ValueError("Hunk does not match the source at line {}".format(pos + 1))
+                if tag == " ":
+                    result.append(lines[pos])
+                pos += 1
+            elif tag == "+":
+                result.append(text)
+    result.extend(lines[pos:])
+    return "".join(result)
+
+def _job_dir(tmp_dir: str) -> str:
+    return os.path.join(tmp_dir, "formalbench-job-{}".format(uuid.uuid4().hex))
+
+def _write_mutants_from_patches(path: str, code: str, out_dir: str) -> None:
+    """
+    Write `out_dir/mutants/<idx>/<file name>` for each patch in `out_dir/mutants-patches`
+    """
+    file_name = os.path.basename(path)
+    all_mutant_patches = sorted(os.listdir(os.path.join(out_dir, "mutants-patches")))
+    if len(all_mutant_patches) == 0:
+        print("[WARNING]: No mutants generated")
+
+    for idx, patch in enumerate(all_mutant_patches):
+        patch_out_dir = os.path.join(out_dir, "mutants", str(idx))
+        os.makedirs(patch_out_dir, exist_ok=True)
+        patch_out_path = os.path.join(patch_out_dir, file_name)
+        patch_path = os.path.join(out_dir, "mutants-patches", patch)
+        with open(patch_path, "r") as f:
+            try:
+                mutant = apply_patch(code, f.read())
+            except ValueError:
+                # Let `patch` find the hunk with an offset or fuzz.
+                mutant = None
+        if mutant is None:
+            execute_command("patch {} < {} -o {}".format(os.path.abspath(path), patch_path, patch_out_path))
+        else:
+            with open(patch_out_path, "w") as f:
+                f.write(mutant)
+        # Keep the permissions of the original program
+        shutil.copymode(path, patch_out_path)
+
+def create_mutator(name: str, reuse_containers: Optional[bool] = None, profile: str = "full") -> "MutantGenerator":
     """
     Create a code mutator instance
 
     Args:
         name (str): Name of the code mutator
+        reuse_containers (bool, optional): Keep the mutator container running at exit and attach to it in later runs. Defaults to $FORMALBENCH_REUSE_CONTAINERS.
+        profile (str, optional): Set of mutation operators: full, sufficient or minimal. Defaults to full.
 
     Raises:
         ValueError: If the mutator is not supported
@@ -27,15 +137,13 @@ def create_mutator(name: str) -> "MutantGenerator":
         MutantGenerator: A code mutator instance
     """
     if name == "Major":
-        return MajorMutantGenerator()
+        return MajorMutantGenerator(reuse=reuse_containers, profile=profile)
     elif name == "MajorWithoutDocker":
-        return MajorMutantGeneratorWithoutDocker()
+        return MajorMutantGeneratorWithoutDocker(profile=profile)
     elif name == "Mull":
-        return MullMutantGenerator()
+        return MullMutantGenerator(reuse=reuse_containers, profile=profile)
     elif name == "MullWithoutDocker":
-        raise NotImplementedError(
-            "Mull should be run in a docker container. Please use Mull instead."
-        )
+        return MullMutantGeneratorWithoutDocker(profile=profile)
     else:
         raise ValueError(
             "Unknown mutator: {}. Please select Major for Java programs"
@@ -68,80 +176,83 @@ class MutantGenerator(ABC):
 
 class MajorMutantGenerator(MutantGenerator):
 
-    def __init__(self) -> None:
+    def __init__(self, reuse: Optional[bool] = None, profile: str = "full") -> None:
         self.tmp_dir = os.path.join("/tmp/")
         self.config_path = os.path.join(self.tmp_dir, "major.mml.bin")
+        self.profile = profile
         
         self.home_dir = "/home/FormalBench"
         self.image_name = "thanhlecong/major:latest"
-        self.client = docker.from_env()
-        self.container = self.client.containers.run(
+        self.mount_dir = os.getcwd()
+        self.client = create_docker_client()
+        self.pool = ContainerPool(
+            self.client,
             self.image_name,
-            "/bin/bash",
-            detach=True,
-            tty=True,
-            volumes={os.getcwd(): {
+            volumes={self.mount_dir: {
                          'bind': self.home_dir,
                          'mode': 'rw'
                      }},
-            environment=None
+            reuse=reuse
         )
-        
-        assert self.container.status == "created", "Container failed to start"
-        atexit.register(self.clean_up)
+        self.container = self.pool.containers[0]
         
         self.executable_path = "/home/major/bin/major"
-        local_config_path = os.path.abspath(os.path.join(_LIB_DIR, "config/major.mml.bin"))
-        assert os.path.exists(
-            local_config_path
-        ), "MML file not found at: {}. Please re-download our package.".format(
-            local_config_path)
-
-        copy_to_container(self.container, local_config_path, self.tmp_dir)
+        local_config_path = _profile_config("major", profile)
+
+        self.config_path, _ = stage_in_container(
+            self.container, local_config_path, self.mount_dir, self.home_dir, self.tmp_dir)
+        if profile != "full":
+            ### Compile the MML source of the profile
+            compiled_path = os.path.join(self.tmp_dir, "major-{}.mml.bin".format(profile))
+            exec_result = self.pool.exec_run(
+                self.container, ["/home/major/bin/mmlc", self.config_path, compiled_path])
+            assert exec_result.exit_code == 0, "Failed to compile {}: {}".format(
+                local_config_path, exec_result.output.decode("utf-8"))
+            self.config_path = compiled_path
 
     def generate_mutants(self, path: str, out_dir: str):
         os.makedirs(out_dir, exist_ok=True)
-        
-        file_name = os.path.basename(path)
-        copy_to_container(self.container, path, self.tmp_dir)
-        path_in_container = os.path.join(self.tmp_dir, file_name)
 
-        ""
-        cmd = "{} --mml {} {} --export export.mutants".format(
-            self.executable_path, self.config_path, path_in_container)
-        cmd_splitted = cmd.split(" ")
-        print("Executing command: {}".format(cmd))
+        ### Major exports to ./mutants, so each job runs in its own directory
+        job_dir = _job_dir(self.tmp_dir)
+        self.pool.exec_run(self.container, ["mkdir", "-p", job_dir])
+        try:
+            path_in_container, _ = stage_in_container(
+                self.container, path, self.mount_dir, self.home_dir, job_dir)
 
-        exec_result = self.container.exec_run(cmd_splitted)
-        output = exec_result.output.decode("utf-8")
-        print(output)
-        
-        exec_result = self.container.exec_run("ls /mutants")
-        if exec_result.exit_code != 0:
-            print("[WARNING]: No mutants generated")
-            return
-        
-        copy_from_container(self.container, "/mutants", out_dir)
-        
-        self.container.exec_run("rm -rf {}".format(path_in_container, path_in_container))
-        
-        self.container.exec_run("rm -rf /mutants")
+            cmd = "{} --mml {} {} --export export.mutants".format(
+                self.executable_path, self.config_path, path_in_container)
+            cmd_splitted = cmd.split(" ")
+            print("Executing command: {}".format(cmd))
+
+            exec_result = self.pool.exec_run(self.container, cmd_splitted, workdir=job_dir)
+            output = exec_result.output.decode("utf-8")
+            print(output)
+
+            exec_result = self.pool.exec_run(self.container, ["ls", os.path.join(job_dir, "mutants")])
+            if exec_result.exit_code != 0:
+                print("[WARNING]: No mutants generated")
+                return
+
+            copy_from_container(self.container, os.path.join(job_dir, "mutants"), out_dir)
+            # The log names the operator of each mutant
+            log_path = os.path.join(job_dir, "mutants.log")
+            if self.pool.exec_run(self.container, ["test", "-f", log_path]).exit_code == 0:
+                copy_from_container(self.container, log_path, out_dir)
+        finally:
+            self.pool.exec_run(self.container, ["rm", "-rf", job_dir])
     
     def clean_up(self):
         """
         Clean up the docker container and temporary files
         """
-        
-        print("Cleaning up the docker container")
-        self.container.stop()
-        self.container.remove()
-        if os.path.exists(os.path.abspath(os.path.join(_LIB_DIR, "config/major.mml.bin.tar"))):
-            os.remove(os.path.abspath(os.path.join(_LIB_DIR, "config/major.mml.bin.tar")))
+        self.pool.clean_up()
 
 class MajorMutantGeneratorWithoutDocker(MutantGenerator):
 
-    def __init__(self) -> None:
+    def __init__(self, profile: str = "full") -> None:
         super().__init__()
+        self.profile = profile
         major_dir = os.path.abspath(os.path.join(_LIB_DIR, "../executables/mutators/"))
         os.makedirs(major_dir, exist_ok=True)
         self.executable_path = os.path.abspath(f"{major_dir}/major/bin/major")
@@ -154,12 +265,14 @@ class MajorMutantGeneratorWithoutDocker(MutantGenerator):
         ), "Major executable not found at: {}. Please download Major v.3.0.1 and put into the mutators/ folder".format(
             self.executable_path)
         
-        self.config_path = os.path.abspath(os.path.join(_LIB_DIR, "config/major.mml.bin"))
-        
-        assert os.path.exists(
-            self.config_path
-        ), "MML file not found at: {}. Please re-download our package.".format(
-            self.config_path)
+        self.config_path = _profile_config("major", profile)
+        if profile != "full":
+            ### Compile the MML source of the profile
+            compiled_path = os.path.join(major_dir, "major-{}.mml.bin".format(profile))
+            output = execute_command("{} {} {}".format(
+                os.path.join(os.path.dirname(self.executable_path), "mmlc"), self.config_path, compiled_path))
+            assert os.path.exists(compiled_path), "Failed to compile {}: {}".format(self.config_path, output)
+            self.config_path = compiled_path
         
         self.executable_cmd = "{} --mml {} {} --export export.mutants"
     
@@ -169,64 +282,49 @@ class MajorMutantGeneratorWithoutDocker(MutantGenerator):
 
         absolute_path = os.path.join(os.path.abspath(out_dir),
                                      os.path.basename(path))
-        current_dir = os.getcwd()
-        os.chdir(out_dir)
         command = self.executable_cmd.format(self.executable_path,
                                              self.config_path, absolute_path)
-        output = execute_command(command)
+        ### Major exports to ./mutants, which is the output directory
+        output = execute_command(command, cwd=out_dir)
         print(output)
-        os.chdir(current_dir)
 
 class MullMutantGenerator(MutantGenerator):
 
-    def __init__(self) -> None:
+    def __init__(self, reuse: Optional[bool] = None, profile: str = "full") -> None:
         self.tmp_dir = os.path.join("/tmp/")
-        self.config_path = os.path.join(self.tmp_dir, "mull.yml")
+        self.profile = profile
+        local_config_path = _profile_config("mull", profile)
+        self.config_path = os.path.join(self.tmp_dir, os.path.basename(local_config_path))
         
         self.home_dir="/home/FormalBench"
         self.image_name="thanhlecong/mull:latest"
         self.environment={"MULL_CONFIG": self.config_path}
+        self.mount_dir = os.getcwd()
 
-        self.client = docker.from_env()
-        self.container = self.client.containers.run(
+        self.client = create_docker_client()
+        self.pool = ContainerPool(
+            self.client,
             self.image_name,
-            "/bin/bash",
-            detach=True,
-            tty=True,
-            volumes={os.getcwd(): {
+            volumes={self.mount_dir: {
                          'bind': self.home_dir,
                          'mode': 'rw'
                      }},
-            environment=self.environment
+            environment=self.environment,
+            reuse=reuse
         )
+        self.container = self.pool.containers[0]
         
         ### Ensure MULL_CONFIG is set correctly
         exec_result = self.container.exec_run("/bin/bash -c 'echo $MULL_CONFIG'")
         assert exec_result.output.decode("utf-8").strip() == self.config_path, \
             "MULL_CONFIG is not set correctly. Please check your docker image"
 
-        assert self.container.status == "created", "Container failed to start"
-        atexit.register(self.clean_up)
-            
-        local_config_path = os.path.abspath(os.path.join(_LIB_DIR, "config/mull.yml"))
-        assert os.path.exists(
-            local_config_path
-        ), "Mull config file not found at: {}. Please re-download our package".format(
-            local_config_path)
-
         ### Copy the config file to the container
         copy_to_container(self.container, local_config_path, self.tmp_dir)
     
-    def apply_patches(self, patch_path: str, source_path: str, out_path: str):
-        command = f"patch {source_path} < {patch_path} -o {out_path}"
-        execute_command(command)
+    def _execute(self, cmd: str, workdir: str) -> str:
+        return self.pool.exec_run(self.container, cmd.split(" "), workdir=workdir).output.decode("utf-8")
 
-        # Get the permissions of source_path
-        source_permissions = os.stat(source_path).st_mode
-
-        # Set the same permissions to out_path
-        os.chmod(out_path, source_permissions)
-    
     def generate_mutants(self, path: str, out_dir: str):
         '''
         
@@ -234,7 +332,6 @@ class MullMutantGenerator(MutantGenerator):
         os.makedirs(out_dir, exist_ok=True)
         # Copy the source file to the container
         file_name = os.path.basename(path)
-        absolute_path = os.path.abspath(path)
         
         ### Read original code
         with open(path, "r") as f:
@@ -243,75 +340,122 @@ class MullMutantGenerator(MutantGenerator):
         ### Add main function to the code
         code_with_main = code + "\nint main() { return 0; }" 
         
-        ### Write the code to a temporary file
-        with open(path, "w") as f:
-            f.write(code_with_main)
-        
-        copy_to_container(self.container, path, self.tmp_dir)
-        path_in_container = os.path.join(self.tmp_dir, file_name)
-
-        ### Reset code to original
-        with open(path, "w") as f:
-            f.write(code)
-        
-        cmd = "clang-12 -fexperimental-new-pass-manager \
-                        -fpass-plugin=/usr/lib/mull-ir-frontend-12 \
-                        -g -grecord-command-line \
-                        {} -o ./output".format(path_in_container)
-        output = execute_command_in_container(self.container, cmd)
-        output += execute_command_in_container(
-            self.container,
-            "mull-runner-12 ./output --report-name=mutants --reporters=Patches"
-        )
-
-        print(output)
-        cnt = 0
-        while ("PLEASE submit a bug report to https://bugs.llvm.org/"
-               in output):
-            cnt += 1
-            print(f"Error. Retrying {cnt}...")
-            output = execute_command_in_container(self.container, cmd)
-            output += execute_command_in_container(
-                self.container,
-                "mull-runner-12 ./output --report-name=mutants --reporters=Patches"
+        ### Mull writes ./output and ./mutants-patches, so each job runs in its own directory
+        job_dir = _job_dir(self.tmp_dir)
+        self.pool.exec_run(self.container, ["mkdir", "-p", job_dir])
+        try:
+            ### Stream the code into the container, leaving the original file untouched
+            write_to_container(self.container, code_with_main.encode("utf-8"), file_name, job_dir)
+            path_in_container = os.path.join(job_dir, file_name)
+
+            cmd = "clang-12 -fexperimental-new-pass-manager \
+                            -fpass-plugin=/usr/lib/mull-ir-frontend-12 \
+                            -g -grecord-command-line \
+                            {} -o ./output".format(path_in_container)
+            output = self._execute(cmd, job_dir)
+            output += self._execute(
+                "mull-runner-12 ./output --report-name=mutants --reporters=Patches", job_dir
             )
+
             print(output)
-            if cnt >= 20:
-                print("[ERROR] Skipping ...")
+            cnt = 0
+            while (_LLVM_CRASH in output):
+                cnt += 1
+                print(f"Error. Retrying {cnt}...")
+                output = self._execute(cmd, job_dir)
+                output += self._execute(
+                    "mull-runner-12 ./output --report-name=mutants --reporters=Patches", job_dir
+                )
+                print(output)
+                if cnt >= _MULL_MAX_RETRIES:
+                    print("[ERROR] Skipping ...")
+                    print("[WARNING]: No mutants generated")
+                    return
+
+            patch_dir = os.path.join(job_dir, "mutants-patches")
+            exec_result = self.pool.exec_run(self.container, ["ls", "-1", patch_dir])
+            if exec_result.exit_code != 0:
                 print("[WARNING]: No mutants generated")
                 return
 
-        exec_result = self.container.exec_run("ls -1 /mutants-patches")
-        if exec_result.exit_code != 0:
-            print("[WARNING]: No mutants generated")
-            return
-
-        copy_from_container(self.container, "/mutants-patches", out_dir)
-        current_dir = os.getcwd()
-        os.chdir(out_dir)
-
-        all_mutant_patches = os.listdir("mutants-patches")
-        if len(all_mutant_patches) == 0:
-            print("[WARNING]: No mutants generated")
-
-        for idx, patch in enumerate(all_mutant_patches):
-            patch_out_dir = os.path.join("mutants", str(idx))
-            os.makedirs(patch_out_dir, exist_ok=True)
-            patch_out_path = os.path.join(patch_out_dir, file_name)
-            self.apply_patches(os.path.join("mutants-patches", patch),
-                               absolute_path, patch_out_path)
-
-        os.chdir(current_dir)
-        self.container.exec_run("rm -rf /mutants-patches")
-        self.container.exec_run("rm -rf {}".format(path_in_container))
+            copy_from_container(self.container, patch_dir, out_dir)
+        finally:
+            self.pool.exec_run(self.container, ["rm", "-rf", job_dir])
+
+        _write_mutants_from_patches(path, code, out_dir)
     
     def clean_up(self):
         """
         Clean up the docker container and temporary files
         """
-        
-        print("Cleaning up the docker container")
-        self.container.stop()
-        self.container.remove()
-        if os.path.exists(os.path.abspath(os.path.join(_LIB_DIR, "config/mull.yml.tar"))):
-            os.remove(os.path.abspath(os.path.join(_LIB_DIR, "config/mull.yml.tar")))
\ No newline at end of file
+        self.pool.clean_up()
+
+class MullMutantGeneratorWithoutDocker(MutantGenerator):
+    """
+    Mull installed on the host (clang with the Mull IR frontend and mull-runner), producing the same layout as MullMutantGenerator.
+
+    Each call works in its own temporary directory, so benchmarks can be
+    mutated in parallel from several threads.
+    """
+
+    def __init__(self, llvm_version: int = 12, profile: str = "full") -> None:
+        super().__init__()
+        self.profile = profile
+        self.clang_path = shutil.which("clang-{}".format(llvm_version))
+        self.runner_path = shutil.which("mull-runner-{}".format(llvm_version))
+        self.plugin_path = "/usr/lib/mull-ir-frontend-{}".format(llvm_version)
+        assert self.clang_path is not None and self.runner_path is not None and os.path.exists(self.plugin_path), \
+            "Mull for LLVM {} not found (clang-{}, mull-runner-{} and {}). Please install Mull from https://mull.readthedocs.io or use Mull with docker".format(
+                llvm_version, llvm_version, llvm_version, self.plugin_path)
+
+        self.config_path = _profile_config("mull", profile)
+        self.environment = dict(os.environ, MULL_CONFIG=self.config_path)
+
+    def _execute(self, cmd: list, work_dir: str) -> str:
+        result = subprocess.run(
+            cmd, cwd=work_dir, env=self.environment, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return result.stdout.decode("utf-8", errors="replace")
+
+    def generate_mutants(self, path: str, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        file_name = os.path.basename(path)
+        with open(path, "r") as f:
+            code = f.read()
+
+        work_dir = tempfile.mkdtemp(prefix="formalbench-mull-")
+        try:
+            ### Add main function to a copy of the code
+            source_path = os.path.join(work_dir, file_name)
+            with open(source_path, "w") as f:
+                f.write(code + "\nint main() { return 0; }")
+
+            binary_path = os.path.join(work_dir, "output")
+            compile_cmd = [
+                self.clang_path, "-fexperimental-new-pass-manager",
+                "-fpass-plugin={}".format(self.plugin_path),
+                "-g", "-grecord-command-line", source_path, "-o", binary_path
+            ]
+            run_cmd = [
+                self.runner_path, binary_path, "--report-name=mutants",
+                "--reporters=Patches", "--report-dir={}".format(work_dir)
+            ]
+            for attempt in range(_MULL_MAX_RETRIES + 1):
+                output = self._execute(compile_cmd, work_dir) + self._execute(run_cmd, work_dir)
+                print(output)
+                if _LLVM_CRASH not in output:
+                    break
+                print("Error. Retrying {}...".format(attempt + 1))
+            else:
+                print("[ERROR] Skipping ...")
+                print("[WARNING]: No mutants generated")
+                return
+
+            patch_dir = os.path.join(work_dir, "mutants-patches")
+            if not os.path.isdir(patch_dir):
+                print("[WARNING]: No mutants generated")
+                return
+            shutil.copytree(patch_dir, os.path.join(out_dir, "mutants-patches"), dirs_exist_ok=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        _write_mutants_from_patches(path, code, out_dir)
@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import concurrent.futures
+import threading
+import json
+import os
+import uuid
+from .verifier import Verifier
+
+
+class _Racer():
+    """
+    Kill handle of one verification in a race, which may be cancelled before it has started
+    """
+
+    def __init__(self) -> None:
+        self._kill: Optional[Callable[[], None]] = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def started(self, kill: Callable[[], None]) -> None:
+        with self._lock:
+            self._kill = kill
+            cancelled = self._cancelled
+        if cancelled:
+            kill()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            kill = self._kill
+        if kill is not None:
+            kill()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+
+class PortfolioVerifier(Verifier):
+    """
+    Race several provers on the same file and keep the first definitive answer.
+
+    A result is definitive when no other prover can improve on it: the file is
+    verified, or it is invalid. The other provers are then killed. The first
+    prover is the verifier's default configuration, whose answer ends the race
+    as well, so the portfolio is never slower and never reports failures the
+    verifier alone would not. Without it, the result with the fewest errors is
+    kept, preferring failures over timeouts.
+
+    Winners are counted per benchmark (the file name, which mutants share with
+    their original) and saved to `winners_path`. The known winner of a
+    benchmark is started first when the provers are raced.
+
+    Only `verify` races the provers; other methods such as `verify_fail_fast`,
+    `verify_methods` or `verify_functions` are those of the wrapped verifier.
+    """
+
+    def __init__(
+            self,
+            verifier: Verifier,
+            provers: Optional[Sequence[str]] = None,
+            winners_path: Optional[str] = None
+        ) -> None:
+        assert hasattr(verifier, "verify_with_prover"), \
+            "Verifier {} does not support prover selection".format(type(verifier).__name__)
+        self.verifier = verifier
+        self.provers = list(provers if provers is not None else verifier.provers)
+        assert len(self.provers) > 0, "At least one prover is required"
+        self.winners_path = winners_path
+        self.winners: Dict[str, Dict[str, int]] = {}
+        if winners_path is not None and os.path.exists(winners_path):
+            with open(winners_path, "r") as f:
+                self.winners = json.load(f)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.verifier, name)
+
+    def signature(self) -> str:
+        return self.verifier.signature() + ":portfolio:" + ",".join(self.provers)
+
+    def extract_output(self, output: str) -> Tuple[int, str]:
+        return self.verifier.extract_output(output)
+
+    @staticmethod
+    def is_definitive(result: Tuple[int, str]) -> bool:
+        return result[0] == 0 or result[0] == 999
+
+    @staticmethod
+    def _rank(result: Tuple[int, str]) -> Tuple[int, int]:
+        n_errors = result[0]
+        if n_errors > 0:
+            return (0, n_errors)
+        if n_errors == -1:
+            return (1, 0)
+        return (2, 0)
+
+    def likely_winner(self, path: str) -> Optional[str]:
+        counts = self.winners.get(os.path.basename(path))
+        if not counts:
+            return None
+        prover = max(counts, key=counts.get)
+        return prover if prover in self.provers else None
+
+    def _record_winner(self, path: str, prover: str) -> None:
+        with self._lock:
+            counts = self.winners.setdefault(os.path.basename(path), {})
+            counts[prover] = counts.get(prover, 0) + 1
+            if self.winners_path is None:
+                return
+            tmp_path = "{}.{}.tmp".format(self.winners_path, uuid.uuid4().hex)
+            with open(tmp_path, "w") as f:
+                json.dump(self.winners, f, indent=2)
+            os.replace(tmp_path, self.winners_path)
+
+    def race(
+            self,
+            path: str,
+            provers: List[str],
+            timeout: int,
+            basedir: str
+        ) -> Tuple[Optional[str], Tuple[int, str]]:
+        """
+        Run the provers concurrently until one gives a definitive answer or the default configuration answers
+
+        Returns:
+            Tuple[Optional[str], Tuple[int, str]]: The winning prover (None if no answer is definitive) and its result
+        """
+        racers = {prover: _Racer() for prover in provers}
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(provers)) as executor:
+            futures = {
+                executor.submit(
+                    self.verifier.verify_with_prover, path, prover,
+                    timeout=timeout, basedir=basedir, on_start=racers[prover].started
+                ): prover
+                for prover in provers
+            }
+            for future in concurrent.futures.as_completed(futures):
+                prover = futures[future]
+                if racers[prover].cancelled:
+                    continue
+                result = future.result()
+                if self.is_definitive(result) or prover == self.provers[0]:
+                    for other, racer in racers.items():
+                        if other != prover:
+                            racer.cancel()
+                    return (prover if self.is_definitive(result) else None), result
+                results[prover] = result
+        return None, min(results.values(), key=self._rank)
+
+    def verify(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+
+        provers = list(self.provers)
+        first = self.likely_winner(path)
+        if first is not None:
+            provers.remove(first)
+            provers.insert(0, first)
+
+        winner, result = self.race(path, provers, timeout, basedir)
+        if winner is not None:
+            self._record_winner(path, winner)
+        return result
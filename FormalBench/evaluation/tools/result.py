@@ -0,0 +1,171 @@
+from typing import Iterable, Optional, Tuple, Union
+import os
+import re
+
+# OpenJML summary lines, e.g. "2 verification failures", "1 warning", "3 errors"
+_OPENJML_COUNT = re.compile(rb"(\d+) (verification failure|warning|error)")
+_OPENJML_INTERNAL_BUG = b"Internal JML bug"
+
+# Frama-C lines that decide the result, in the order of precedence used
+# when several of them appear on the same line.
+_FRAMAC_EVENT = re.compile(
+    rb"^[^\n]*?(?P<abort>\[kernel\] Frama-C aborted:|\[kernel\] Plug-in wp aborted"
+    rb"|(?P<no_goal>\[wp\] Warning: No goal generated)|error: invalid preprocessing directive)"
+    rb"|^[^\n]*?\[wp\] \[(?P<status>Timeout|Unknown|Failed)\] (?P<goal>typed_[^\s(]*)[^\n]*"
+    rb"|^[^\n]*?\[wp\] Proved goals:\s*(?P<proved>\d+)\s*/\s*(?P<total>\d+)",
+    re.MULTILINE
+)
+_FRAMAC_CRASH = (
+    b"Unexpected error",
+    b"Please report as 'crash' at https://git.frama-c.com/pub/frama-c/issues"
+)
+
+
+class VerificationResult():
+    """
+    The outcome of one verification.
+
+    The error code follows the verifier contract: the number of errors, 0 if
+    the file is verified, -1 on timeout, -5 on an internal verifier error and
+    999 for invalid specifications (Frama-C). Counts by category and the
+    status of the goals that were not proved are kept when known. The output
+    is stored as UTF-8 bytes and only decoded when accessed.
+
+    The result behaves as the (n_errors, output) tuple returned by verifiers,
+    so existing code can keep unpacking and indexing it.
+    """
+
+    __slots__ = ("n_errors", "counts", "goals", "_raw")
+
+    def __init__(
+            self,
+            n_errors: int,
+            output: Union[str, bytes, None] = b"",
+            counts: Optional[dict] = None,
+            goals: Tuple[Tuple[str, str], ...] = ()
+        ) -> None:
+        self.n_errors = n_errors
+        self.counts = counts
+        self.goals = goals
+        self._raw = output.encode("utf-8") if isinstance(output, str) else output
+
+    @classmethod
+    def from_tuple(cls, result: Iterable) -> "VerificationResult":
+        if isinstance(result, cls):
+            return result
+        n_errors, output = result
+        return cls(n_errors, output)
+
+    @property
+    def raw(self) -> Optional[bytes]:
+        return self._raw
+
+    @property
+    def output(self) -> str:
+        if self._raw is None:
+            return ""
+        return self._raw.decode("utf-8", errors="replace")
+
+    def drop_output(self) -> None:
+        """
+        Release the output when only the error code and counts are needed
+        """
+        self._raw = None
+
+    def __iter__(self):
+        yield self.n_errors
+        yield self.output
+
+    def __getitem__(self, index):
+        return (self.n_errors, self.output)[index]
+
+    def __len__(self) -> int:
+        return 2
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (VerificationResult, tuple, list)) and len(other) == 2:
+            return self.n_errors == other[0] and self.output == other[1]
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "VerificationResult(n_errors={}, counts={}, output_size={})".format(
+            self.n_errors, self.counts, 0 if self._raw is None else len(self._raw))
+
+
+def _as_bytes(output: Union[str, bytes]) -> bytes:
+    return output.encode("utf-8") if isinstance(output, str) else output
+
+
+def parse_openjml_output(output: Union[str, bytes]) -> VerificationResult:
+    """
+    Parse the output of OpenJML
+
+    The error count is the sum of the first reported number of verification
+    failures, warnings and compilation errors.
+    """
+    raw = _as_bytes(output).replace(os.getcwd().encode("utf-8") + b"/", b"")
+    counts = {}
+    for match in _OPENJML_COUNT.finditer(raw):
+        category = match.group(2).decode("ascii")
+        if category not in counts:
+            counts[category] = int(match.group(1))
+            if len(counts) == 3:
+                break
+
+    if counts:
+        return VerificationResult(sum(counts.values()), raw, counts=counts)
+    if raw == b"Timeout":
+        return VerificationResult(-1, raw)
+    if _OPENJML_INTERNAL_BUG in raw:
+        return VerificationResult(-5, raw)
+    return VerificationResult(0, raw)
+
+
+def parse_framac_output(output: Union[str, bytes], partial: bool = False) -> VerificationResult:
+    """
+    Parse the output of Frama-C WP
+
+    Goals that time out are not errors, and the file passes if all goals are
+    proved except timeouts on callers' preconditions. A file without goals is
+    invalid, but a run restricted to some functions (`partial`) may select
+    none and then passes.
+    """
+    raw = _as_bytes(output)
+    goals = []
+    timeout_in_requires = 0
+    all_timeout = 0
+    no_goal = False
+    for match in _FRAMAC_EVENT.finditer(raw):
+        if partial and match.group("no_goal") is not None:
+            no_goal = True
+            continue
+        if match.group("abort") is not None:
+            return VerificationResult(999, raw, goals=tuple(goals))
+        if match.group("status") is not None:
+            status = match.group("status").decode("ascii")
+            goal = match.group("goal").decode("utf-8", errors="replace")
+            goals.append((goal, status))
+            if status == "Timeout":
+                all_timeout += 1
+                line = match.group(0)
+                if b"_requires (" in line or b"_requires_" in line:
+                    timeout_in_requires += 1
+            continue
+
+        proved = int(match.group("proved"))
+        total = int(match.group("total"))
+        counts = {"proved": proved, "total": total, "timeout": all_timeout}
+        if proved + timeout_in_requires == total:
+            return VerificationResult(0, raw, counts=counts, goals=tuple(goals))
+        n_errors = total - proved - all_timeout
+        assert n_errors >= 0, "Number of errors should be greater than or equal to 0"
+        if n_errors == 0:
+            return VerificationResult(-1, raw, counts=counts, goals=tuple(goals))
+        return VerificationResult(n_errors, raw, counts=counts, goals=tuple(goals))
+
+    if no_goal:
+        return VerificationResult(0, raw, goals=tuple(goals))
+    if all(marker in raw for marker in _FRAMAC_CRASH):
+        return VerificationResult(-5, "Internal Frama-C bug")
+    assert raw == b"Timeout", "Unknown output: {}".format(raw.decode("utf-8", errors="replace"))
+    return VerificationResult(-1, raw)
@@ -0,0 +1,291 @@
+from typing import Deque, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+import concurrent.futures
+import socketserver
+import threading
+import argparse
+import tempfile
+import shutil
+import socket
+import json
+import os
+from .verifier import Verifier, create_verifier
+from .result import VerificationResult, parse_openjml_output, parse_framac_output
+
+DEFAULT_SOCKET = os.environ.get("FORMALBENCH_VERIFYD_SOCKET", "/tmp/formalbench-verifyd.sock")
+
+
+class FairScheduler():
+    """
+    Run jobs on a fixed number of workers, taking turns between clients.
+
+    Each client has its own queue and workers serve the queues round-robin, so
+    a client submitting thousands of mutants does not starve a client that
+    submits one specification at a time.
+    """
+
+    def __init__(self, n_workers: int = 4) -> None:
+        assert n_workers > 0, "Number of workers must be positive"
+        self._queues: "OrderedDict[str, Deque]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, client: str, func, *args, **kwargs) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        with self._cond:
+            assert not self._closed, "Scheduler is closed"
+            self._queues.setdefault(client, deque()).append((future, func, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def _next(self):
+        with self._cond:
+            while not self._queues and not self._closed:
+                self._cond.wait()
+            if not self._queues:
+                return None
+            # Serve the first client, then move it to the back of the line.
+            client, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self._queues[client] = queue
+            return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            future, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class VerificationService():
+    """
+    Serve a verifier to local processes over a Unix socket.
+
+    Requests and responses are JSON lines. A request carries the content and
+    name of the file to verify, so clients need not share a working directory
+    with the service. Requests of one connection may be pipelined; responses
+    are matched to requests by their `id`.
+    """
+
+    def __init__(self, verifier: Verifier, socket_path: str = DEFAULT_SOCKET, n_workers: int = 4) -> None:
+        self.verifier = verifier
+        self.socket_path = socket_path
+        self.scheduler = FairScheduler(n_workers)
+        # Files are staged below the working directory, which the verifier
+        # containers mount, so they do not need to be copied in.
+        self.scratch_dir = tempfile.mkdtemp(prefix=".formalbench-verifyd-", dir=os.getcwd())
+        self.server = None
+
+    def _verify(self, content: str, name: str, timeout: int, basedir: str) -> VerificationResult:
+        job_dir = tempfile.mkdtemp(dir=self.scratch_dir)
+        try:
+            path = os.path.join(job_dir, name)
+            with open(path, "w") as f:
+                f.write(content)
+            return VerificationResult.from_tuple(
+                self.verifier.verify(path, timeout=timeout, basedir=basedir))
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def handle(self, client: str, request: dict) -> concurrent.futures.Future:
+        method = request.get("method")
+        if method == "signature":
+            future = concurrent.futures.Future()
+            future.set_result({"signature": self.verifier.signature()})
+            return future
+        if method != "verify":
+            raise ValueError("Unknown method: {}".format(method))
+        name = os.path.basename(request["name"])
+        assert name not in ("", ".", ".."), "Invalid file name: {}".format(request["name"])
+        future = self.scheduler.submit(
+            client, self._verify, request["content"], name,
+            int(request.get("timeout", 1800)), request.get("basedir", ""))
+        response = concurrent.futures.Future()
+
+        def _done(f):
+            try:
+                result = f.result()
+                response.set_result({"n_errors": result.n_errors, "output": result.output})
+            except BaseException as e:
+                response.set_exception(e)
+
+        future.add_done_callback(_done)
+        return response
+
+    def serve_forever(self) -> None:
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                client = str(id(self))
+                lock = threading.Lock()
+
+                def reply(message: dict) -> None:
+                    data = (json.dumps(message) + "\n").encode("utf-8")
+                    with lock:
+                        try:
+                            self.wfile.write(data)
+                            self.wfile.flush()
+                        except OSError:
+                            pass
+
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        assert isinstance(request, dict), "Requests should be JSON objects"
+                    except (ValueError, AssertionError) as e:
+                        reply({"id": None, "error": "{}: {}".format(type(e).__name__, e)})
+                        continue
+                    request_id = request.get("id")
+
+                    def _done(f, request_id=request_id):
+                        try:
+                            reply(dict(f.result(), id=request_id))
+                        except BaseException as e:
+                            reply({"id": request_id, "error": "{}: {}".format(type(e).__name__, e)})
+
+                    try:
+                        service.handle(client, request).add_done_callback(_done)
+                    except Exception as e:
+                        reply({"id": request_id, "error": "{}: {}".format(type(e).__name__, e)})
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # Only the owner may connect, since requests run on the owner's verifier
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        self.server.daemon_threads = True
+        print("Verification service listening on {}".format(self.socket_path))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+        self.scheduler.close()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class RemoteVerifier(Verifier):
+    """
+    A verifier backed by a `formalbench-verifyd` service on the same host.
+
+    The instance is thread-safe: concurrent calls to `verify` share one
+    connection and are scheduled by the service.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None) -> None:
+        self.socket_path = socket_path or DEFAULT_SOCKET
+        assert os.path.exists(self.socket_path), \
+            "Verification service not found at: {}. Please start formalbench-verifyd".format(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        self._reader = self.sock.makefile("rb")
+        self._lock = threading.Lock()
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._next_id = 0
+        threading.Thread(target=self._receive, daemon=True).start()
+        self._signature = self._call({"method": "signature"})["signature"]
+
+    def _receive(self) -> None:
+        try:
+            for line in self._reader:
+                response = json.loads(line)
+                with self._lock:
+                    future = self._pending.pop(response["id"])
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response)
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("Verification service closed the connection"))
+
+    def _call(self, request: dict) -> dict:
+        future = concurrent.futures.Future()
+        with self._lock:
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = future
+            self.sock.sendall((json.dumps(dict(request, id=request_id)) + "\n").encode("utf-8"))
+        return future.result()
+
+    def signature(self) -> str:
+        return self._signature
+
+    def verify(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+        with open(path, "r") as f:
+            content = f.read()
+        response = self._call({
+            "method": "verify",
+            "name": os.path.basename(path),
+            "content": content,
+            "timeout": timeout,
+            "basedir": basedir
+        })
+        return VerificationResult(response["n_errors"], response["output"])
+
+    def extract_output(self, output: str) -> Tuple[int, str]:
+        if self._signature.startswith("FramaC"):
+            return parse_framac_output(output)
+        return parse_openjml_output(output)
+
+    def clean_up(self) -> None:
+        self.sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="formalbench-verifyd",
+        description="Share a verifier, its containers and its result cache between local processes")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Path of the Unix socket to listen on")
+    parser.add_argument("--verifier", default="OpenJML", help="Verifier to serve: OpenJML or FramaC")
+    parser.add_argument("--version", type=int, default=21, help="Version of OpenJML")
+    parser.add_argument("--pool-size", type=int, default=1, help="Number of verifier containers")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent verifications")
+    parser.add_argument("--cache-dir", default=None, help="Directory of the verification result cache")
+    parser.add_argument("--daemon", action="store_true", help="Run OpenJML in long-lived worker JVMs")
+    args = parser.parse_args()
+
+    verifier = create_verifier(
+        args.verifier, args.version, pool_size=args.pool_size, cache_dir=args.cache_dir, daemon=args.daemon)
+    VerificationService(verifier, args.socket, n_workers=args.workers).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
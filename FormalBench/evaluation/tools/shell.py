@@ -0,0 +1,139 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+import threading
+import shlex
+import time
+from .channel import Channel
+
+_DONE = b"__FORMALBENCH_DONE__"
+
+# Runs one command per input line, in a subshell with stdin detached from the
+# request stream, and answers with a header line followed by the raw output:
+#   __FORMALBENCH_DONE__ <exit code> <output size> <elapsed ms>
+# Each command runs in its own process group (job control), which the worker
+# kills on SIGTERM so that no verifier outlives it. The worker's own stderr,
+# where bash reports killed jobs, is discarded to keep the stream parseable.
+SHELL_WORKER_SCRIPT = (
+    'exec 2>/dev/null; set -m; p=; '
+    'f=$(mktemp); trap \'rm -f "$f"\' EXIT; '
+    'trap \'[ -n "$p" ] && kill -9 -- -"$p"; exit 143\' TERM; '
+    'while IFS= read -r cmd; do '
+    's=$(date +%s%N); '
+    '(eval "$cmd") </dev/null >"$f" 2>&1 & p=$!; wait "$p"; c=$?; p=; '
+    'e=$(date +%s%N); '
+    'echo "' + _DONE.decode("ascii") + ' $c $(wc -c <"$f") $(( (e - s) / 1000000 ))"; '
+    'cat "$f"; '
+    'done'
+)
+
+
+class ShellResult(NamedTuple):
+    """
+    Result of a command run by a shell worker, compatible with docker's ExecResult
+    """
+    exit_code: int
+    output: bytes
+    elapsed: float
+
+
+class ShellCrashed(RuntimeError):
+    pass
+
+
+def shell_command(
+        cmd: Union[str, List[str]],
+        environment: Optional[Dict[str, str]] = None,
+        workdir: Optional[str] = None
+    ) -> str:
+    """
+    Build the shell line running `cmd` with the same argument vector as `container.exec_run(cmd)`
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    if environment:
+        args = ["env"] + ["{}={}".format(k, v) for k, v in environment.items()] + args
+    line = shlex.join(args)
+    if workdir is not None:
+        line = "cd {} && {}".format(shlex.quote(workdir), line)
+    assert "\n" not in line, "Commands sent to a shell worker must fit on one line"
+    return line
+
+
+class ShellWorker():
+    """
+    A long-lived shell that runs commands sent over one stream.
+
+    Running a command costs one write and one read on an open stream instead
+    of creating, starting and inspecting a docker exec instance. On timeout
+    the worker is killed and restarted lazily for the next command.
+    """
+
+    def __init__(self, spawn: Callable[[], Channel]) -> None:
+        self.spawn = spawn
+        self.channel: Optional[Channel] = None
+
+    def run(self, line: str, timeout: Optional[float] = None) -> ShellResult:
+        """
+        Run one shell line
+
+        Args:
+            line (str): The command line, see `shell_command`
+            timeout (float, optional): Time to wait for the result in seconds. Defaults to None (no limit).
+
+        Returns:
+            ShellResult: The exit code (124 on timeout, as with `timeout`), the output and the elapsed time in seconds
+        """
+        if self.channel is None or self.channel.closed:
+            self.channel = self.spawn()
+
+        self.channel.send(line.encode("utf-8") + b"\n")
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def _remaining():
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        header = self.channel.readline(timeout=_remaining())
+        if header is None:
+            self.stop()
+            return ShellResult(124, b"Timeout", timeout)
+        if not header.startswith(_DONE):
+            self.stop()
+            raise ShellCrashed(header.decode("utf-8", errors="replace"))
+        _, exit_code, size, elapsed_ms = header.split()
+        output = self.channel.read_exactly(int(size), timeout=_remaining())
+        if output is None or len(output) < int(size):
+            self.stop()
+            raise ShellCrashed("Shell worker stopped while sending the output")
+        return ShellResult(int(exit_code), output, int(elapsed_ms) / 1000)
+
+    def stop(self) -> None:
+        if self.channel is not None:
+            self.channel.kill()
+            self.channel = None
+
+
+class ShellWorkerPool():
+    """
+    Shell workers sharing one container, started on demand and kept warm between commands
+    """
+
+    def __init__(self, spawn: Callable[[], Channel]) -> None:
+        self.spawn = spawn
+        self._idle: List[ShellWorker] = []
+        self._busy: List[ShellWorker] = []
+        self._lock = threading.Lock()
+
+    def run(self, line: str, timeout: Optional[float] = None) -> ShellResult:
+        with self._lock:
+            worker = self._idle.pop() if self._idle else ShellWorker(self.spawn)
+            self._busy.append(worker)
+        try:
+            return worker.run(line, timeout)
+        finally:
+            with self._lock:
+                self._busy.remove(worker)
+                self._idle.append(worker)
+
+    def stop(self) -> None:
+        with self._lock:
+            workers = self._idle + self._busy
+        for worker in workers:
+            worker.stop()
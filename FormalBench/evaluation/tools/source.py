@@ -0,0 +1,392 @@
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import re
+from .result import VerificationResult
+
+_JAVA_NON_METHODS = {
+    "if", "for", "while", "switch", "catch", "synchronized", "try", "do",
+    "else", "return", "new", "throw"
+}
+_JAVA_TYPE_DECLARATION = re.compile(r"\b(class|interface|enum|record)\b")
+_JAVA_METHOD_HEADER = re.compile(
+    r"\b([A-Za-z_$][\w$]*)\s*\((?:[^()]|\([^()]*\))*\)\s*(?:throws\s+[\w$.,\s]+)?$"
+)
+_C_NON_FUNCTIONS = {
+    "if", "for", "while", "switch", "return", "sizeof"
+}
+_C_FUNCTION_HEADER = re.compile(r"\b([A-Za-z_]\w*)\s*\((?:[^()]|\([^()]*\))*\)$")
+_PURE_MODIFIER = re.compile(r"\bpure\b")
+# Tokens of C-like source code, with the longest operators first as in the
+# compilers' maximal munch. Comments and literals are single tokens.
+_TOKEN = re.compile(
+    r"//[^\n]*|/\*.*?(?:\*/|$)"
+    r"|\"(?:\\.|[^\"\\\n])*\"?|'(?:\\.|[^'\\\n])*'?"
+    r"|[A-Za-z_$][\w$]*|\.?\d(?:[eEpP][-+]|[\w.])*"
+    r"|>>>=|<<=|>>=|>>>|\.\.\.|->|::|\+\+|--|&&|\|\||<<|>>|##|[-+*/%&|^!=<>]=|\S",
+    re.DOTALL
+)
+
+
+class SourceUnit(NamedTuple):
+    """
+    A method (Java) or function (C) of a source file.
+
+    `start` includes the leading comments of the unit, i.e. its contract, and
+    `body_start` is the offset of the opening brace of its body.
+    """
+    name: str
+    start: int
+    body_start: int
+    end: int
+    text: str
+
+
+def _scan(code: str):
+    """
+    Yield (offset, char) for the structural characters `{`, `}` and `;` of C-like source code, skipping comments, string and character literals
+    """
+    i = 0
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "/" and code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if c == "/" and code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if c == '"' or c == "'":
+            i += 1
+            while i < n and code[i] != c and code[i] != "\n":
+                i += 2 if code[i] == "\\" else 1
+            i += 1
+            continue
+        if c in "{};":
+            yield i, c
+        i += 1
+
+
+def strip_comments(code: str) -> str:
+    """
+    Remove `//` and `/* */` comments, which is where JML and ACSL specifications live
+    """
+    out = []
+    i = 0
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "/" and code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if c == "/" and code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            out.append(" ")
+            continue
+        if c == '"' or c == "'":
+            j = i + 1
+            while j < n and code[j] != c and code[j] != "\n":
+                j += 2 if code[j] == "\\" else 1
+            out.append(code[i:j + 1])
+            i = j + 1
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def normalize_source(code: str) -> str:
+    """
+    Put each token of a program on its own line, so that programs differing only in layout are equal
+    """
+    return "\n".join(_TOKEN.findall(code))
+
+
+def split_annotations(code: str) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Remove the JML or ACSL annotations, i.e. the comments starting with `@`, and keep everything else as is
+
+    Returns:
+        Tuple[str, List[Tuple[int, int]]]: The program without annotations and the (start, end) offsets of the removed annotations in `code`
+    """
+    out = []
+    spans = []
+    last = 0
+    i = 0
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "/" and code.startswith("//", i):
+            end = code.find("\n", i)
+            end = n if end < 0 else end
+        elif c == "/" and code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+        elif c == '"' or c == "'":
+            i += 1
+            while i < n and code[i] != c and code[i] != "\n":
+                i += 2 if code[i] == "\\" else 1
+            i += 1
+            continue
+        else:
+            i += 1
+            continue
+        if code.startswith("@", i + 2):
+            out.append(code[last:i])
+            spans.append((i, end))
+            last = end
+        i = end
+    out.append(code[last:])
+    return "".join(out), spans
+
+
+def changed_region(code: str, mutant: str) -> Tuple[int, int, int]:
+    """
+    Find the region where `mutant` differs from `code`, between their common prefix and suffix
+
+    Returns:
+        Tuple[int, int, int]: The start of the region, its end in `code` and its end in `mutant`
+    """
+    n = min(len(code), len(mutant))
+    prefix = 0
+    while prefix < n and code[prefix] == mutant[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and code[-1 - suffix] == mutant[-1 - suffix]:
+        suffix += 1
+    return prefix, len(code) - suffix, len(mutant) - suffix
+
+
+def changed_units(code: str, mutant: str, split: Callable[[str], List[SourceUnit]]) -> Optional[List[str]]:
+    """
+    Name the units to verify for a mutant whose change is confined to the body of one unit
+
+    Other units are verified against the contract of the changed unit, which
+    the mutant keeps, so their results are those of `code`. Bodies of pure
+    methods are visible to specifications, so the units mentioning a changed
+    pure method are verified as well.
+
+    Args:
+        code (str): The original program
+        mutant (str): The mutant
+        split (Callable[[str], List[SourceUnit]]): `split_java_methods` or `split_c_functions`
+
+    Returns:
+        Optional[List[str]]: The unit names, or None if the change is not inside a unit body
+    """
+    start, end, _ = changed_region(code, mutant)
+    units = split(code)
+    for unit in units:
+        if unit.body_start < start and end < unit.end:
+            break
+    else:
+        return None
+    names = [unit.name]
+    if _PURE_MODIFIER.search(code[unit.start:unit.body_start]):
+        # Uses of a pure constructor, `new C(...)`, mention it as well
+        mention = re.compile(r"\b{}\s*\(".format(re.escape(unit.name)))
+        # Invariants and field initializers may mention it too
+        if mention.search(outside_units(code, units)):
+            return None
+        for other in units:
+            if other.name not in names and mention.search(other.text):
+                names.append(other.name)
+    return names
+
+
+def splice_annotations(code: str, spans: List[Tuple[int, int]], stripped: str, mutant: str) -> Optional[str]:
+    """
+    Carry the change from `stripped` to `mutant` over to `code`, the annotated program returned with `stripped` by `split_annotations`
+
+    Returns:
+        Optional[str]: The annotated mutant, or None if the change overlaps an annotation
+    """
+    start, end, mutant_end = changed_region(stripped, mutant)
+
+    # Offsets of the annotations in `stripped`, with their lengths
+    positions = []
+    removed = 0
+    for span_start, span_end in spans:
+        positions.append((span_start - removed, span_end - span_start))
+        removed += span_end - span_start
+    if any(start < position < end for position, _ in positions):
+        return None
+
+    # Annotations at the boundaries of the change stay outside of it: before
+    # it at its start (contracts precede code) and after it at its end.
+    def _to_code(offset: int, after: bool) -> int:
+        return offset + sum(
+            length for position, length in positions
+            if position < offset or (after and position == offset))
+
+    code_start = _to_code(start, True)
+    code_end = _to_code(end, start == end)
+    return code[:code_start] + mutant[start:mutant_end] + code[code_end:]
+
+
+def _skip_block(structure, depth: int) -> int:
+    """
+    Consume structural characters until the block opened at `depth` closes and return the offset of its closing brace
+    """
+    for offset, c in structure:
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return offset
+    return -1
+
+
+def _leading_start(code: str, segment_start: int) -> int:
+    while segment_start < len(code) and code[segment_start].isspace():
+        segment_start += 1
+    return segment_start
+
+
+def split_java_methods(code: str) -> List[SourceUnit]:
+    """
+    Split a Java compilation unit into the methods and constructors of its top-level types.
+
+    Constructors are named after their class, which is how OpenJML's
+    `--method` and `--exclude` select them. Members of nested types,
+    initializer blocks and field initializers are not units; they belong to
+    the class-level context.
+    """
+    units = []
+    structure = _scan(code)
+    depth = 0
+    segment_start = 0
+    for offset, c in structure:
+        if c == "}":
+            depth -= 1
+            segment_start = offset + 1
+            continue
+        if c == ";":
+            if depth == 1:
+                segment_start = offset + 1
+            continue
+        # Opening brace
+        if depth == 0:
+            depth = 1
+            segment_start = offset + 1
+            continue
+        header = strip_comments(code[segment_start:offset]).strip()
+        match = _JAVA_METHOD_HEADER.search(header)
+        is_method = (
+            match is not None
+            and match.group(1) not in _JAVA_NON_METHODS
+            and "=" not in header[:match.start()]
+            and _JAVA_TYPE_DECLARATION.search(header) is None
+        )
+        end = _skip_block(structure, 1)
+        if end < 0:
+            break
+        if is_method:
+            start = _leading_start(code, segment_start)
+            units.append(SourceUnit(match.group(1), start, offset, end + 1, code[start:end + 1]))
+        segment_start = end + 1
+    return units
+
+
+def split_c_functions(code: str) -> List[SourceUnit]:
+    """
+    Split a C translation unit into its function definitions.
+
+    Function declarations, type definitions and global initializers are not
+    units; they belong to the file-level context. Preprocessor lines before a
+    function are not part of its unit.
+    """
+    units = []
+    structure = _scan(code)
+    segment_start = 0
+    for offset, c in structure:
+        if c != "{":
+            segment_start = offset + 1
+            continue
+        header = strip_comments(code[segment_start:offset])
+        header = "\n".join(
+            line for line in header.split("\n") if not line.lstrip().startswith("#")).strip()
+        match = _C_FUNCTION_HEADER.search(header)
+        is_function = (
+            match is not None
+            and match.group(1) not in _C_NON_FUNCTIONS
+            and "=" not in header
+        )
+        end = _skip_block(structure, 1)
+        if end < 0:
+            break
+        if is_function:
+            start = _leading_start(code, segment_start)
+            while code.startswith("#", start):
+                line_end = code.find("\n", start)
+                start = _leading_start(code, offset if line_end < 0 else line_end)
+            units.append(SourceUnit(match.group(1), start, offset, end + 1, code[start:end + 1]))
+        segment_start = end + 1
+    return units
+
+
+def outside_units(code: str, units: List[SourceUnit]) -> str:
+    """
+    Return the source outside the units, contracts of the units excluded
+    """
+    parts = []
+    last = 0
+    for unit in units:
+        parts.append(code[last:unit.start])
+        last = unit.end
+    parts.append(code[last:])
+    return "".join(parts)
+
+
+def unit_context(code: str, units: List[SourceUnit]) -> str:
+    """
+    Return the class-level context shared by all units: the source with unit bodies elided.
+
+    Contracts and signatures of every unit are kept since callers are verified
+    against them, and bodies of pure methods are kept since specifications may
+    depend on them.
+    """
+    parts = []
+    last = 0
+    for unit in units:
+        if _PURE_MODIFIER.search(code[unit.start:unit.body_start]):
+            continue
+        parts.append(code[last:unit.body_start])
+        parts.append("{}")
+        last = unit.end
+    parts.append(code[last:])
+    return "".join(parts)
+
+
+def merge_results(results: List[Tuple[int, str]]) -> VerificationResult:
+    """
+    Combine the results of verifying the units of one file into the result for the whole file.
+
+    Errors are summed over units. Identical outputs are counted once since they
+    come from file-level problems, such as a syntax error, that every unit
+    reports. Without errors, internal verifier errors (-5) take precedence over
+    timeouts (-1), which take precedence over success (0).
+    """
+    seen = set()
+    unique = []
+    for n_errors, output in results:
+        if output in seen and output != "":
+            continue
+        seen.add(output)
+        unique.append((n_errors, output))
+
+    for n_errors, output in unique:
+        if n_errors == 999:
+            return VerificationResult(n_errors, output)
+    failures = [(n, output) for n, output in unique if n > 0]
+    if failures:
+        return VerificationResult(
+            sum(n for n, _ in failures), "\n".join(output for _, output in failures))
+    for code in (-5, -1):
+        for n_errors, output in unique:
+            if n_errors == code:
+                return VerificationResult(n_errors, output)
+    return VerificationResult(0, "\n".join(output for _, output in unique if output))
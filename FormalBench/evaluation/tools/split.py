@@ -0,0 +1,142 @@
+from typing import List, Tuple
+from functools import partial
+import concurrent.futures
+import time
+import os
+import re
+from .verifier import Verifier
+from .result import VerificationResult
+from .cache import VerificationCache
+from .source import (
+    SourceUnit, split_java_methods, split_c_functions, split_annotations, unit_context, outside_units, merge_results
+)
+
+# ACSL annotations outside functions, and lemmas wherever they sit, have goals
+# of their own that only the residual unit proves.
+_ANNOTATION = re.compile(r"/\*@|//@")
+_LEMMA = re.compile(r"\blemma\b")
+
+
+class SplitVerifier(Verifier):
+    """
+    Verify one file as several independent units on up to `n_workers` workers.
+
+    Java classes are split per method name (overloads are verified together)
+    and C files per function. A residual unit excluding every named unit
+    covers the rest of the file: default constructors and nested classes in
+    Java, global lemmas in C. Each unit is a separate verifier call restricted
+    with `--method`/`--exclude` (OpenJML) or `-wp-fct`/`-wp-skip-fct` (Frama-C).
+    C files without lemmas or other annotations outside functions have no
+    residual unit.
+
+    The per-unit results are merged into the usual (n_errors, output) result.
+    Zero versus non-zero errors match whole-file verification, but the error
+    count is summed over units and may exceed the whole-file count. The
+    timeout bounds the whole file: each unit gets the remaining budget, and
+    the file times out if the budget runs out before every unit is verified.
+    """
+
+    def __init__(self, verifier: Verifier, n_workers: int = 4) -> None:
+        assert n_workers > 0, "Number of workers must be positive"
+        self.verifier = verifier
+        self.n_workers = n_workers
+        if hasattr(verifier, "verify_methods"):
+            self.split = split_java_methods
+            self.verify_part = verifier.verify_methods
+        elif hasattr(verifier, "verify_functions"):
+            # Share the cores between the concurrent Frama-C runs.
+            self.split = split_c_functions
+            self.verify_part = partial(
+                verifier.verify_functions, wp_par=max(1, (os.cpu_count() or 1) // n_workers))
+        else:
+            raise ValueError(
+                "Verifier {} does not support partial verification".format(type(verifier).__name__))
+
+    def __getattr__(self, name):
+        return getattr(self.verifier, name)
+
+    def signature(self) -> str:
+        return self.verifier.signature()
+
+    def extract_output(self, output: str) -> Tuple[int, str]:
+        return self.verifier.extract_output(output)
+
+    def _needs_residual(self, code: str, units: List[SourceUnit]) -> bool:
+        if self.split is split_java_methods:
+            return True
+        # Otherwise Frama-C would find no goal outside the functions
+        if _ANNOTATION.search(outside_units(code, units)):
+            return True
+        _, spans = split_annotations(code)
+        return any(_LEMMA.search(code[start:end]) for start, end in spans)
+
+    def plan(self, code: str, file_name: str, timeout: int) -> List[Tuple[str, List[str], bool]]:
+        """
+        Split a file into verification units
+
+        Args:
+            code (str): Source of the file
+            file_name (str): Name of the file, which the verifiers check and report
+            timeout (int): Timeout of the file in seconds
+
+        Returns:
+            List[Tuple[str, List[str], bool]]: For each unit, its cache key, the unit names to pass to the verifier and whether they are excluded rather than selected
+        """
+        units = self.split(code)
+        if len(units) == 0:
+            return []
+        context = unit_context(code, units)
+        signature = self.signature()
+
+        groups = {}
+        for unit in units:
+            groups.setdefault(unit.name, []).append(unit.text)
+
+        jobs = []
+        for name, texts in groups.items():
+            key = VerificationCache.make_key("method", name, *texts, context, file_name, signature, str(timeout))
+            jobs.append((key, [name], False))
+        if self._needs_residual(code, units):
+            key = VerificationCache.make_key("residual", context, file_name, signature, str(timeout))
+            jobs.append((key, list(groups.keys()), True))
+        return jobs
+
+    def verify_unit(
+            self,
+            path: str,
+            job: Tuple[str, List[str], bool],
+            timeout: int,
+            basedir: str
+        ) -> Tuple[int, str]:
+        _, names, exclude = job
+        return self.verify_part(path, names, timeout=timeout, basedir=basedir, exclude=exclude)
+
+    def verify(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+
+        with open(path, "r") as f:
+            code = f.read()
+        jobs = self.plan(code, os.path.basename(path), timeout)
+        if len(jobs) == 0:
+            return self.verifier.verify(path, timeout=timeout, basedir=basedir)
+
+        deadline = time.monotonic() + timeout
+
+        def _verify(job):
+            remaining = int(deadline - time.monotonic())
+            if remaining < 1:
+                return None
+            return self.verify_unit(path, job, remaining, basedir)
+
+        if self.n_workers == 1 or len(jobs) == 1:
+            results = [_verify(job) for job in jobs]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                results = list(executor.map(_verify, jobs))
+        if any(result is None for result in results):
+            return VerificationResult(-1, "Timeout")
+        return merge_results(results)
@@ -1,40 +1,159 @@
 from abc import ABC, abstractmethod
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple, Union
 import re
 import os
-import docker
+from functools import partial
+import shlex
+import shutil
 import atexit
-from ..utils import execute_command, copy_to_container
+import threading
+from ..utils import (
+    execute_command,
+    stage_in_container,
+    write_to_container,
+    stream_command_in_container,
+    stream_command,
+    prune_directory,
+    limit_command,
+    is_timeout
+)
+from .result import VerificationResult, parse_openjml_output, parse_framac_output
+from .container import ContainerPool, create_docker_client, partition_cpus
+from .channel import DockerExecChannel, LocalChannel
+from .daemon import (
+    OpenJMLDaemonPool,
+    WorkerCrashed,
+    WORKER_SOURCE,
+    openjml_worker_script,
+    openjml_worker_build_script
+)
 import FormalBench
 
 _LIB_DIR = os.path.dirname(os.path.abspath(FormalBench.__file__))
-
-def create_verifier(name: str, version: int = 21) -> "Verifier":
+SMT_CACHE_SOURCE = os.path.join(_LIB_DIR, "config", "smt_cache.py")
+
+_OPENJML_FLAGS = "--esc --prover=cvc4 --nullable-by-default --esc-max-warnings 1"
+_OPENJML_PROVERS = ("cvc4", "z3_4_3")
+# The combined run is the default configuration; the single provers only race
+# it to a proof, since goals may need either of them.
+_FRAMAC_PROVERS = ("Alt-Ergo,Z3", "Alt-Ergo", "Z3")
+_SMT_CACHE_BIND = "/home/smt-cache"
+_SMT_CACHE_DIR = "/tmp/formalbench-smt"
+_WP_CACHE_BIND = "/home/wp-cache"
+# Number of runs between two size checks of the SMT and WP proof caches.
+_CACHE_PRUNE_INTERVAL = 50
+# WP reports each goal it could not prove as soon as its provers give up.
+_FRAMAC_FAILED_GOAL = re.compile(r"\[wp\] \[(Failed|Unknown)\] typed_")
+_FRAMAC_FLAGS = "-wp -wp-precond-weakening -wp-no-callee-precond -warn-signed-overflow -warn-unsigned-overflow -warn-invalid-pointer -wp-model Typed+ref -wp-prover Alt-Ergo,Z3 -wp-print -wp-timeout 10"
+
+def _replace_path(output: Union[str, bytes], path: str, display_path: str) -> bytes:
+    if isinstance(output, str):
+        output = output.encode("utf-8")
+    return output.replace(path.encode("utf-8"), display_path.encode("utf-8"))
+
+def _with_openjml_prover(flags: str, prover: Optional[str]) -> str:
+    if prover is None:
+        return flags
+    return re.sub(r"--prover=\S+", "--prover=" + prover, flags)
+
+def create_verifier(
+        name: str,
+        version: int = 21,
+        pool_size: int = 1,
+        cache_dir: Optional[str] = None,
+        cache_size: int = 100000,
+        daemon: bool = False,
+        daemon_max_jobs: int = 500,
+        incremental: bool = False,
+        wp_cache_dir: Optional[str] = None,
+        wp_cache_size: int = 2 * 1024 ** 3,
+        split_workers: int = 1,
+        cascade: Optional["CascadePolicy"] = None,
+        portfolio: bool = False,
+        portfolio_winners: Optional[str] = None,
+        smt_cache_dir: Optional[str] = None,
+        smt_cache_size: int = 1000000,
+        socket_path: Optional[str] = None,
+        reuse_containers: Optional[bool] = None,
+        cpu_time_limit: bool = False,
+        pin_cpus: bool = False
+    ) -> "Verifier":
     """
     Create a verifier instance
 
     Args:
-        name (str): Name of the verifier. Currently only OpenJML is supported
+        name (str): Name of the verifier: OpenJML, OpenJMLWithoutDocker, FramaC, FramaCWithoutDocker, or Remote to use a running formalbench-verifyd service
         version (int, optional): Version of the verifier. Defaults to 21.
+        pool_size (int, optional): Number of containers started for docker-based verifiers. Concurrent calls to `verify` are spread over the containers. For FramaCWithoutDocker, the maximum number of concurrent Frama-C processes, all cores if left to 1. Defaults to 1.
+        cache_dir (str, optional): Directory of an on-disk verification result cache. Defaults to None (no caching).
+        cache_size (int, optional): Maximum number of cached results before the least recently used ones are evicted. Defaults to 100000.
+        daemon (bool, optional): Run OpenJML in long-lived worker JVMs instead of starting a JVM per verification. Defaults to False.
+        daemon_max_jobs (int, optional): Number of jobs after which an OpenJML worker JVM is recycled. Defaults to 500.
+        incremental (bool, optional): Verify files method by method (function by function for C) and reuse the results of unchanged units. Per-unit results are stored under `cache_dir` when it is given. Defaults to False.
+        wp_cache_dir (str, optional): Local directory of a persistent Frama-C WP proof cache, mounted into the containers and shareable between verifiers. Defaults to None (no proof cache).
+        wp_cache_size (int, optional): Size cap of the WP proof cache in bytes. Defaults to 2 GiB.
+        split_workers (int, optional): Split the verification of one file into per-method (per-function for C) units verified concurrently by this many workers. Defaults to 1 (whole-file verification).
+        cascade (CascadePolicy, optional): Type-check and verify with a short budget before running a full verification, which is only done for files that time out. Defaults to None (full verification only).
+        portfolio (bool, optional): Race the available provers on each file and keep the first definitive answer. Defaults to False.
+        portfolio_winners (str, optional): JSON file recording the winning prover of each benchmark, which is started first in later races. Defaults to None (winners are only kept in memory).
+        smt_cache_dir (str, optional): Local directory caching the answers of the SMT solver to OpenJML queries, mounted into the containers and shareable between verifiers. Requires python3 in the OpenJML image. Defaults to None (no query cache).
+        smt_cache_size (int, optional): Maximum number of cached SMT answers. Defaults to 1000000.
+        socket_path (str, optional): Unix socket of the formalbench-verifyd service used by the Remote verifier. Defaults to $FORMALBENCH_VERIFYD_SOCKET or /tmp/formalbench-verifyd.sock.
+        reuse_containers (bool, optional): Keep the verifier containers running at exit and attach to healthy ones with the same configuration in later runs. Defaults to $FORMALBENCH_REUSE_CONTAINERS.
+        cpu_time_limit (bool, optional): Count timeouts in CPU time of each verifier and solver process instead of wall-clock time, so that results do not depend on the load of the machine. A wall-clock limit of CPU_TIME_WALL_FACTOR times the timeout still applies. Defaults to False.
+        pin_cpus (bool, optional): Pin each verifier container to its own share of the cores. Defaults to False.
 
     Returns:
         Verifier: An instance of the verifier
     """
     if name == "OpenJML":
-        return OpenJMLVerifier(version=version)
+        verifier = OpenJMLVerifier(
+            version=version, pool_size=pool_size, daemon=daemon, daemon_max_jobs=daemon_max_jobs,
+            smt_cache_dir=smt_cache_dir, smt_cache_size=smt_cache_size, reuse=reuse_containers,
+            cpu_time_limit=cpu_time_limit, pin_cpus=pin_cpus)
     elif name == "OpenJMLWithoutDocker":
-        return OpenJMLVerifierWithoutDocker(version=version)
+        verifier = OpenJMLVerifierWithoutDocker(
+            version=version, daemon=daemon, daemon_max_jobs=daemon_max_jobs, cpu_time_limit=cpu_time_limit)
     elif name == "FramaC":
-        return FramaCVerifier()
+        verifier = FramaCVerifier(
+            pool_size=pool_size, wp_cache_dir=wp_cache_dir, wp_cache_size=wp_cache_size,
+            reuse=reuse_containers, cpu_time_limit=cpu_time_limit, pin_cpus=pin_cpus)
+    elif name == "Remote":
+        from .service import RemoteVerifier
+        verifier = RemoteVerifier(socket_path)
     elif name == "FramaCWithoutDocker":
-        raise NotImplementedError(
-            "FramaC without docker is not implemented yet. Please use FramaC with docker."
-        )
+        verifier = FramaCVerifierWithoutDocker(
+            max_workers=pool_size if pool_size > 1 else None, wp_cache_dir=wp_cache_dir,
+            wp_cache_size=wp_cache_size, cpu_time_limit=cpu_time_limit)
     else:
         raise ValueError(
             "Unknown verifier: {}. Please select OpenJML for Java"
             .format(name))
 
+    if portfolio:
+        from .portfolio import PortfolioVerifier
+        verifier = PortfolioVerifier(verifier, winners_path=portfolio_winners)
+
+    if incremental:
+        from .incremental import IncrementalVerifier
+        verifier = IncrementalVerifier(
+            verifier,
+            cache_dir=os.path.join(cache_dir, "units") if cache_dir is not None else None,
+            max_entries=cache_size,
+            n_workers=split_workers)
+    elif split_workers > 1:
+        from .split import SplitVerifier
+        verifier = SplitVerifier(verifier, n_workers=split_workers)
+
+    if cascade is not None:
+        from .cascade import CascadeVerifier
+        verifier = CascadeVerifier(verifier, cascade)
+
+    if cache_dir is not None:
+        from .cache import CachedVerifier
+        verifier = CachedVerifier(verifier, cache_dir, max_entries=cache_size)
+    return verifier
+
 class Verifier(ABC):
     def __init__(self) -> None:
         pass
@@ -71,32 +190,149 @@ class Verifier(ABC):
             Tuple[int, str]: A tuple containing the number of errors and the output of the verifier
         """
         pass
+
+    def signature(self) -> str:
+        """
+        Describe the verifier configuration (tool, version and command-line flags). Two verifiers with the same signature produce interchangeable results.
+
+        Returns:
+            str: The signature of the verifier
+        """
+        signature = "{}:{}:{}".format(
+            type(self).__name__, getattr(self, "openjml_version", ""), getattr(self, "flags", ""))
+        if getattr(self, "cpu_time_limit", False):
+            signature += ":cpu-time"
+        return signature
     
 
 class OpenJMLVerifier(Verifier):
     
-    def __init__(self, version=21) -> None:
+    def __init__(
+            self,
+            version=21,
+            pool_size=1,
+            daemon=False,
+            daemon_max_jobs=500,
+            smt_cache_dir=None,
+            smt_cache_size=1000000,
+            reuse=None,
+            cpu_time_limit=False,
+            pin_cpus=False
+        ) -> None:
         assert version in [21, 17], "OpenJML version must be either 21 or 17"
+        assert not (daemon and cpu_time_limit), \
+            "CPU-time limits apply to processes and cannot be used with long-lived OpenJML daemons"
+        self.cpu_time_limit = cpu_time_limit
         self.home_dir = "/home/specInfer"
         self.image_name = "thanhlecong/openjml:latest"
-        self.client = docker.from_env()
-        self.container = self.client.containers.run(
+        self.mount_dir = os.getcwd()
+        volumes = {
+            self.mount_dir: {
+                "bind": self.home_dir,
+                "mode": "rw"
+            }
+        }
+
+        # SMT answers kept on the host so that every container, and every
+        # mutant of a benchmark, reuses the queries already solved.
+        self.smt_cache_dir = None
+        self.smt_cache_size = smt_cache_size
+        self.smt_solvers = {}
+        self._n_runs = 0
+        self._prune_lock = threading.Lock()
+        if smt_cache_dir is not None:
+            self.smt_cache_dir = os.path.abspath(smt_cache_dir)
+            os.makedirs(self.smt_cache_dir, exist_ok=True)
+            volumes[self.smt_cache_dir] = {
+                "bind": _SMT_CACHE_BIND,
+                "mode": "rw"
+            }
+
+        self.client = create_docker_client(pool_size)
+        self.pool = ContainerPool(
+            self.client,
             self.image_name,
-                    "/bin/bash",
-                    detach=True,
-                    tty=True,
-                    volumes={
-                        os.getcwd(): {
-                            "bind": self.home_dir,
-                            "mode": "rw"
-                        }
-                    },
-            )
+            volumes=volumes,
+            size=pool_size,
+            reuse=reuse,
+            cpusets=partition_cpus(pool_size) if pin_cpus else None
+        )
+        self.container = self.pool.containers[0]
 
         self.tmp_dir = os.path.join("/tmp/")
-        assert self.container.status == "created", "Container failed to start"
-        atexit.register(self.clean_up)
         self.openjml_version = version
+        self.openjml_home = "/home/openjml{}".format(version)
+        self.flags = _OPENJML_FLAGS
+        self.provers = _OPENJML_PROVERS
+
+        if self.smt_cache_dir is not None:
+            installed = self.pool.run_on_all(self._install_smt_cache)
+            self.smt_solvers = installed[0] if all(i == installed[0] for i in installed) else {}
+            if len(self.smt_solvers) == 0:
+                print("[WARNING] Cannot set up the SMT query cache (python3 or solvers not found in {}). "
+                      "Verifying without it.".format(self.image_name))
+                self.smt_cache_dir = None
+
+        self.daemons = None
+        if daemon:
+            worker_dir = "/tmp/formalbench-worker"
+            self.pool.run_on_all(partial(self._install_worker, worker_dir=worker_dir))
+            self.daemons = {
+                container.id: OpenJMLDaemonPool(
+                    partial(DockerExecChannel, container,
+                            openjml_worker_script(self.openjml_home, worker_dir)),
+                    max_jobs=daemon_max_jobs)
+                for container in self.pool.containers
+            }
+
+    def _install_worker(self, container, worker_dir: str) -> None:
+        container.exec_run(["mkdir", "-p", worker_dir])
+        with open(WORKER_SOURCE, "rb") as f:
+            write_to_container(container, f.read(), os.path.basename(WORKER_SOURCE), worker_dir)
+        exec_result = container.exec_run(
+            ["/bin/bash", "-c", openjml_worker_build_script(self.openjml_home, worker_dir)])
+        assert exec_result.exit_code == 0, "Failed to build the OpenJML worker: {}".format(
+            exec_result.output.decode("utf-8"))
+
+    def _install_smt_cache(self, container) -> dict:
+        """
+        Install the SMT query cache proxy in a container and wrap every solver found in the OpenJML release
+
+        Returns:
+            dict: The proxy executable of each wrapped prover
+        """
+        if container.exec_run(["python3", "-c", "pass"]).exit_code != 0:
+            return {}
+        container.exec_run(["mkdir", "-p", _SMT_CACHE_DIR])
+        with open(SMT_CACHE_SOURCE, "rb") as f:
+            write_to_container(container, f.read(), os.path.basename(SMT_CACHE_SOURCE), _SMT_CACHE_DIR)
+
+        solvers = {}
+        for prover in self.provers:
+            stem = re.split(r"[_-]", prover)[0]
+            exec_result = container.exec_run([
+                "/bin/sh", "-c",
+                "find {} -type f -perm -u+x -iname '{}*' | head -n 1".format(self.openjml_home, stem)
+            ])
+            solver = exec_result.output.decode("utf-8").strip()
+            if exec_result.exit_code != 0 or solver == "":
+                continue
+            wrapper = os.path.join(_SMT_CACHE_DIR, prover)
+            script = '#!/bin/sh\nexec python3 {} {} {} "$@"\n'.format(
+                os.path.join(_SMT_CACHE_DIR, os.path.basename(SMT_CACHE_SOURCE)), _SMT_CACHE_BIND, solver)
+            write_to_container(container, script.encode("utf-8"), prover, _SMT_CACHE_DIR)
+            container.exec_run(["chmod", "+x", wrapper])
+            solvers[prover] = wrapper
+        return solvers
+
+    def _prune_smt_cache(self) -> None:
+        if self.smt_cache_dir is None:
+            return
+        with self._prune_lock:
+            self._n_runs += 1
+            prune = self._n_runs % _CACHE_PRUNE_INTERVAL == 0
+        if prune:
+            prune_directory(self.smt_cache_dir, max_files=self.smt_cache_size)
 
     def check(
             self,
@@ -104,112 +340,135 @@ class OpenJMLVerifier(Verifier):
             basedir: str = "",
             timeout: int = 1800
         ) -> Tuple[int, str]:
+        return self._run(path, timeout, basedir, ["--command=check"])
 
-        path = os.path.abspath(path)
-        print("Path: {}".format(path))
-        if basedir == "":
-            tmp_dir = self.tmp_dir
-        else:
-            tmp_dir = os.path.join(self.tmp_dir, basedir)
-            self.container.exec_run(["mkdir", "-p", tmp_dir])
-        
-        
-        copy_to_container(self.container, path, tmp_dir)
-        path_in_container = os.path.join(tmp_dir, os.path.basename(path))
-
-        cmd = f"timeout {timeout} /home/openjml{self.openjml_version}/openjml --esc --prover=cvc4 --nullable-by-default --command=check --esc-max-warnings 1 {path_in_container}"
-
-        cmd_splitted = cmd.split(" ")
-        print("Executing command: {}".format(cmd))
-
-        # Call the docker container to run the command
-        exec_result = self.container.exec_run(cmd_splitted)
-        if exec_result.exit_code == 124:
-            tar_file = path + ".tar"
-            if os.path.exists(tar_file):
-                os.remove(tar_file)
-            return (-1, "Timeout")
-        output = exec_result.output.decode("utf-8")
-        
-        tar_file = path + ".tar"
-        if os.path.exists(tar_file):
-            os.remove(tar_file)
-        return self.extract_output(output)
-    
     def verify(
             self,
             path: str,
             timeout: int = 1800,
             basedir: str = ""
         ) -> Tuple[int, str]:
-        
+        return self._run(path, timeout, basedir)
+
+    def verify_methods(
+            self,
+            path: str,
+            methods: List[str],
+            timeout: int = 1800,
+            basedir: str = "",
+            exclude: bool = False
+        ) -> Tuple[int, str]:
+        """
+        Verify only some methods of a class (or all but some methods if `exclude` is set)
+
+        Args:
+            path (str): path to the .java file to be verified
+            methods (List[str]): names of the methods, the class name for constructors
+            timeout (int): timeout in seconds
+            basedir (str): base directory to store the file in the container
+            exclude (bool): verify every method except the given ones
+
+        Returns:
+            Tuple[int, str]: A tuple containing the number of errors and the output of the verifier
+        """
+        option = "--exclude" if exclude else "--method"
+        return self._run(path, timeout, basedir, ["{}={}".format(option, ",".join(methods))])
+
+    def verify_with_prover(
+            self,
+            path: str,
+            prover: str,
+            timeout: int = 1800,
+            basedir: str = "",
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[int, str]:
+        """
+        Verify with another SMT solver than the default one
+
+        Args:
+            path (str): path to the .java file to be verified
+            prover (str): OpenJML name of the solver, e.g. cvc4 or z3_4_3
+            timeout (int): timeout in seconds
+            basedir (str): base directory to store the file in the container
+            on_start (Callable, optional): called with a function that kills the verification once it has started
+
+        Returns:
+            Tuple[int, str]: A tuple containing the number of errors and the output of the verifier
+        """
+        return self._run(path, timeout, basedir, prover=prover, on_start=on_start)
+
+    def _run(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            extra_args: Optional[List[str]] = None,
+            prover: Optional[str] = None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[int, str]:
+
         path = os.path.abspath(path)
         print("Path: {}".format(path))
         if basedir == "":
             tmp_dir = self.tmp_dir
         else:
             tmp_dir = os.path.join(self.tmp_dir, basedir)
-            self.container.exec_run(["mkdir", "-p", tmp_dir])
-        
-        
-        copy_to_container(self.container, path, tmp_dir)
-        path_in_container = os.path.join(tmp_dir, os.path.basename(path))
-
-        cmd = f"timeout {timeout} /home/openjml{self.openjml_version}/openjml --esc --prover=cvc4 --nullable-by-default --esc-max-warnings 1 {path_in_container}"
-
-        cmd_splitted = cmd.split(" ")
-        print("Executing command: {}".format(cmd))
-
-        # Call the docker container to run the command
-        exec_result = self.container.exec_run(cmd_splitted)
-        if exec_result.exit_code == 124:
-            tar_file = path + ".tar"
-            if os.path.exists(tar_file):
-                os.remove(tar_file)
-            return (-1, "Timeout")
-        output = exec_result.output.decode("utf-8")
-        tar_file = path + ".tar"
-        if os.path.exists(tar_file):
-            os.remove(tar_file)
+        # Location the file used to be copied to; error messages keep
+        # reporting it so downstream parsers see the same paths as before.
+        display_path = os.path.join(tmp_dir, os.path.basename(path))
+
+        with self.pool.lease() as container:
+            path_in_container, _ = stage_in_container(
+                container, path, self.mount_dir, self.home_dir, tmp_dir)
+
+            flags = _with_openjml_prover(self.flags, prover)
+            args = flags.split(" ") + (extra_args or [])
+            solver = self.smt_solvers.get(re.search(r"--prover=(\S+)", flags).group(1))
+            if solver is not None:
+                args.append("--exec={}".format(solver))
+            args.append(path_in_container)
+            exit_code = None
+            if self.daemons is not None and on_start is None:
+                print("Executing in OpenJML daemon: {}".format(" ".join(args)))
+                try:
+                    exit_code, output = self.daemons[container.id].run(args, timeout)
+                except WorkerCrashed as e:
+                    print("[WARNING] OpenJML worker crashed, falling back to a fresh JVM: {}".format(e))
+            if exit_code is None:
+                cmd_splitted = limit_command(
+                    ["{}/openjml".format(self.openjml_home)] + args, timeout, self.cpu_time_limit)
+                print("Executing command: {}".format(" ".join(cmd_splitted)))
+
+                # Call the docker container to run the command
+                if on_start is None:
+                    exec_result = self.pool.exec_run(container, cmd_splitted)
+                    exit_code = exec_result.exit_code
+                    output = exec_result.output
+                else:
+                    exit_code, output = stream_command_in_container(
+                        container, cmd_splitted, on_start=on_start)
+        self._prune_smt_cache()
+        if is_timeout(exit_code, self.cpu_time_limit):
+            return VerificationResult(-1, "Timeout")
+        output = _replace_path(output, path_in_container, display_path)
         return self.extract_output(output)
 
-    def extract_output(self, output: str) -> Tuple[int, str]:
-
-        failure_count_pattern = re.compile(r"(\d+) verification failure")
-        warning_count_pattern = re.compile(r"(\d+) warning")
-        compilation_error_pattern = re.compile(r"(\d+) error")
-
-        # Remove local path from the output
-        print("Current working directory: {}".format(os.getcwd()))
-        output = output.replace(os.getcwd() + "/", "")
-        failure_match = failure_count_pattern.search(output)
-        warning_match = warning_count_pattern.search(output)
-        compilation_error_match = compilation_error_pattern.search(output)
-
-        failure_count = int(failure_match.group(1)) if failure_match else 0
-        warning_count = int(warning_match.group(1)) if warning_match else 0
-        compilation_error_count = (int(compilation_error_match.group(1))
-                                   if compilation_error_match else 0)
-
-        if failure_match or warning_match or compilation_error_match:
-            return (
-                failure_count + warning_count + compilation_error_count, output
-            )
-        else:
-            print("Output: {}".format(output))
-            if "Internal JML bug" in output:
-                return (-5, output)
-            return (0, output)
+    def extract_output(self, output: Union[str, bytes]) -> VerificationResult:
+        return parse_openjml_output(output)
 
     def clean_up(self):
-        print("Cleaning up the docker container")
-        self.container.stop()
-        self.container.remove()
+        if self.daemons is not None:
+            for daemons in self.daemons.values():
+                daemons.stop()
+        self.pool.clean_up()
             
 class OpenJMLVerifierWithoutDocker(Verifier):
     
-    def __init__(self, version=21) -> None:
+    def __init__(self, version=21, daemon=False, daemon_max_jobs=500, cpu_time_limit=False) -> None:
         assert version in [21, 17], "OpenJML version must be either 21 or 17"
+        assert not (daemon and cpu_time_limit), \
+            "CPU-time limits apply to processes and cannot be used with long-lived OpenJML daemons"
+        self.cpu_time_limit = cpu_time_limit
         verifier_dir = os.path.abspath(os.path.join(_LIB_DIR, "../executables/verifiers/openjml{}".format(version)))
         if not os.path.exists(verifier_dir):
             os.makedirs(verifier_dir)
@@ -225,6 +484,30 @@ class OpenJMLVerifierWithoutDocker(Verifier):
                 execute_command(f"unzip {verifier_dir}/openjml-ubuntu-20.04-0.17.0-alpha-12.zip -d {verifier_dir}/")
         assert os.path.exists(self.exec_path), "OpenJML executable not found at: {}. Please download OpenJML and put into the verifier/openjml/ folder".format(self.exec_path)
         print("OpenJML executable path: {}".format(self.exec_path))
+        self.openjml_version = version
+        self.flags = _OPENJML_FLAGS
+        self.provers = _OPENJML_PROVERS
+
+        self.daemons = None
+        if daemon:
+            worker_dir = os.path.join(verifier_dir, "worker")
+            os.makedirs(worker_dir, exist_ok=True)
+            execute_command("cp {} {}".format(WORKER_SOURCE, worker_dir))
+            execute_command(openjml_worker_build_script(verifier_dir, worker_dir))
+            assert os.path.exists(os.path.join(worker_dir, "OpenJMLWorker.class")), \
+                "Failed to build the OpenJML worker in: {}".format(worker_dir)
+            self.daemons = OpenJMLDaemonPool(
+                partial(LocalChannel, ["/bin/bash", "-c", openjml_worker_script(verifier_dir, worker_dir)]),
+                max_jobs=daemon_max_jobs)
+            atexit.register(self.daemons.stop)
+
+    def check(
+            self,
+            path: str,
+            basedir=None,
+            timeout: int = 1800
+        ) -> Tuple[int, str]:
+        return self._run(path, timeout, ["--command=check"])
     
     def verify(
             self, 
@@ -232,152 +515,370 @@ class OpenJMLVerifierWithoutDocker(Verifier):
             timeout: int = 1800, 
             basedir=None
         ) -> Tuple[int, str]:
+        return self._run(path, timeout)
+
+    def verify_methods(
+            self,
+            path: str,
+            methods: List[str],
+            timeout: int = 1800,
+            basedir=None,
+            exclude: bool = False
+        ) -> Tuple[int, str]:
+        option = "--exclude" if exclude else "--method"
+        return self._run(path, timeout, ["{}={}".format(option, ",".join(methods))])
+
+    def verify_with_prover(
+            self,
+            path: str,
+            prover: str,
+            timeout: int = 1800,
+            basedir=None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[int, str]:
+        return self._run(path, timeout, prover=prover, on_start=on_start)
+
+    def _run(
+            self,
+            path: str,
+            timeout: int,
+            extra_args: Optional[List[str]] = None,
+            prover: Optional[str] = None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[int, str]:
         
         abs_path = os.path.abspath(path)
-        command = "{} --esc --prover=cvc4 --nullable-by-default --esc-max-warnings 1 {}".format(self.exec_path, abs_path)
+        args = _with_openjml_prover(self.flags, prover).split(" ") + (extra_args or []) + [abs_path]
+        if self.daemons is not None and on_start is None:
+            print("Executing in OpenJML daemon: {}".format(" ".join(args)))
+            try:
+                exit_code, output = self.daemons.run(args, timeout)
+                if exit_code == 124:
+                    output = "Timeout"
+                return self.extract_output(output)
+            except WorkerCrashed as e:
+                print("[WARNING] OpenJML worker crashed, falling back to a fresh JVM: {}".format(e))
+        command = "{} {}".format(self.exec_path, shlex.join(args))
         print("Executing command: {}".format(command))
-        output = execute_command(command, timeout)
-        print(output)
+        output = execute_command(command, timeout, on_start=on_start, cpu_time_limit=self.cpu_time_limit)
         return self.extract_output(output)
     
-    def extract_output(self, output: str) -> Tuple[int, str]:
-        failure_count_pattern = re.compile(r'(\d+) verification failure')
-        warning_count_pattern = re.compile(r'(\d+) warning')
-        compilation_error_pattern = re.compile(r'(\d+) error')
-        
-        #### Remove local path from the output
-        print("Current working directory: {}".format(os.getcwd()))
-        output = output.replace(os.getcwd() + "/", "")
-        failure_match = failure_count_pattern.search(output)
-        warning_match = warning_count_pattern.search(output)
-        compilation_error_match = compilation_error_pattern.search(output)
-        
-        failure_count = int(failure_match.group(1)) if failure_match else 0
-        warning_count = int(warning_match.group(1)) if warning_match else 0
-        compilation_error_count = int(compilation_error_match.group(1)) if compilation_error_match else 0
-        
-        if failure_match or warning_match or compilation_error_match:
-            # return number of failures and warnings
-            return (failure_count + warning_count + compilation_error_count, output)
-        elif output == "Timeout":
-            return (-1, output)
-        else:
-            if "Internal JML bug" in output:
-                return (-5, output)
-            return (0, output)
+    def extract_output(self, output: Union[str, bytes]) -> VerificationResult:
+        return parse_openjml_output(output)
 
 class FramaCVerifier(Verifier):
 
-    def __init__(self) -> None:
+    def __init__(
+            self,
+            pool_size=1,
+            wp_cache_dir=None,
+            wp_cache_size=2 * 1024 ** 3,
+            reuse=None,
+            cpu_time_limit=False,
+            pin_cpus=False
+        ) -> None:
+        self._init_frama_c(wp_cache_dir, wp_cache_size, cpu_time_limit)
         self.home_dir = "/home/specInfer"
         self.image_name = "framac/frama-c:26.0.debian"
-        self.client = docker.from_env()
-        self.container = self.client.containers.run(
+        self.mount_dir = os.getcwd()
+        volumes = {
+            self.mount_dir: {
+                "bind": self.home_dir,
+                "mode": "rw"
+            }
+        }
+        if self.wp_cache_dir is not None:
+            volumes[self.wp_cache_dir] = {
+                "bind": _WP_CACHE_BIND,
+                "mode": "rw"
+            }
+
+        self.client = create_docker_client(pool_size)
+        self.pool = ContainerPool(
+            self.client,
             self.image_name,
-                    "/bin/bash",
-                    detach=True,
-                    tty=True,
-                    volumes={
-                        os.getcwd(): {
-                            "bind": self.home_dir,
-                            "mode": "rw"
-                        }
-                    },
-            )
+            volumes=volumes,
+            size=pool_size,
+            reuse=reuse,
+            cpusets=partition_cpus(pool_size) if pin_cpus else None
+        )
+        self.container = self.pool.containers[0]
+
+    def _init_frama_c(self, wp_cache_dir: Optional[str], wp_cache_size: int, cpu_time_limit: bool) -> None:
+        """
+        Set up what the docker and local Frama-C verifiers share
+        """
+        self.cpu_time_limit = cpu_time_limit
+        # WP proof cache kept on the host so that it survives containers and
+        # is shared by every verifier pointing at the same directory.
+        self.wp_cache_dir = None
+        self.wp_cache_size = wp_cache_size
+        self._n_runs = 0
+        self._prune_lock = threading.Lock()
+        if wp_cache_dir is not None:
+            self.wp_cache_dir = os.path.abspath(wp_cache_dir)
+            os.makedirs(self.wp_cache_dir, exist_ok=True)
 
         self.tmp_dir = os.path.join("/tmp/")
-        assert self.container.status == "created", "Container failed to start"
-        atexit.register(self.clean_up)
-        
+        self.flags = _FRAMAC_FLAGS
+        self.provers = _FRAMAC_PROVERS
+
     def verify(self,
                path: str,
                timeout: int = 1800,
                basedir: str = ""
-            ) -> Tuple[str, str]:
+            ) -> Tuple[int, str]:
+        return self._run(path, timeout, basedir)
+
+    def verify_functions(
+            self,
+            path: str,
+            functions: List[str],
+            timeout: int = 1800,
+            basedir: str = "",
+            exclude: bool = False,
+            wp_par: Optional[int] = None,
+            fail_fast: bool = False
+        ) -> Tuple[int, str]:
+        """
+        Prove only the goals of some functions (or of all but some functions if `exclude` is set)
+
+        Args:
+            path (str): path to the .c file to be verified
+            functions (List[str]): names of the functions
+            timeout (int): timeout in seconds
+            basedir (str): base directory to store the file in the container
+            exclude (bool): verify every function except the given ones
+            wp_par (int, optional): number of provers run in parallel by this Frama-C process
+            fail_fast (bool, optional): stop as soon as one goal fails, see `verify_fail_fast`
+
+        Returns:
+            Tuple[int, str]: A tuple containing the number of errors and the output of the verifier
+        """
+        option = "-wp-skip-fct" if exclude else "-wp-fct"
+        extra_args = [option, ",".join(functions)]
+        if wp_par is not None:
+            extra_args += ["-wp-par", str(wp_par)]
+        # The selected functions may have no goals, e.g. the residual unit of SplitVerifier
+        if fail_fast:
+            return self._run_fail_fast(path, timeout, basedir, self.flags.split(" ") + extra_args, partial=True)
+        return self._run(path, timeout, basedir, extra_args, partial=True)
+
+    def verify_with_prover_timeout(
+            self,
+            path: str,
+            prover_timeout: int,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+        """
+        Verify with a per-goal prover timeout (`-wp-timeout`) other than the default one
+        """
+        return self._run(path, timeout, basedir, ["-wp-timeout", str(prover_timeout)])
+
+    def verify_with_prover(
+            self,
+            path: str,
+            prover: str,
+            timeout: int = 1800,
+            basedir: str = "",
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[int, str]:
+        """
+        Verify with other provers than the default ones
+
+        Args:
+            path (str): path to the .c file to be verified
+            prover (str): Why3 name(s) of the prover(s), comma-separated, e.g. Alt-Ergo or CVC4
+            timeout (int): timeout in seconds
+            basedir (str): base directory to store the file in the container
+            on_start (Callable, optional): called with a function that kills the verification once it has started
+
+        Returns:
+            Tuple[int, str]: A tuple containing the number of errors and the output of the verifier
+        """
+        return self._run(path, timeout, basedir, prover=prover, on_start=on_start)
+
+    def verify_fail_fast(
+            self,
+            path: str,
+            timeout: int = 1800,
+            basedir: str = ""
+        ) -> Tuple[int, str]:
+        """
+        Verify but stop Frama-C as soon as one goal fails.
+
+        Useful when only the presence of errors matters, e.g. to check mutants.
+
+        Returns:
+            Tuple[int, str]: 1 and the output so far if a goal failed, otherwise the same result as `verify`
+        """
+        return self._run_fail_fast(path, timeout, basedir, self.flags.split(" "))
+
+    def _run_fail_fast(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            args: List[str],
+            partial: bool = False
+        ) -> Tuple[int, str]:
+        exit_code, output = self._exec(
+            path, timeout, basedir, args, stop=_FRAMAC_FAILED_GOAL.search)
+        if exit_code is None:
+            return VerificationResult(1, output)
+        if is_timeout(exit_code, self.cpu_time_limit):
+            return VerificationResult(-1, "Timeout")
+        return self.extract_output(output, partial=partial)
+
+    def check(
+            self,
+            path: str,
+            basedir: str = "",
+            timeout: int = 1800
+        ) -> Tuple[int, str]:
+        """
+        Parse and type-check the C code and its ACSL annotations without running WP
+
+        Returns:
+            Tuple[int, str]: 999 and the output of Frama-C if the file is invalid, 0 otherwise
+        """
+        exit_code, output = self._exec(path, timeout, basedir, [])
+        if is_timeout(exit_code, self.cpu_time_limit):
+            return VerificationResult(-1, "Timeout")
+        if exit_code != 0:
+            return VerificationResult(999, output)
+        return VerificationResult(0, output)
+
+    def _run(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            extra_args: Optional[List[str]] = None,
+            prover: Optional[str] = None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None,
+            partial: bool = False
+        ) -> Tuple[int, str]:
+        flags = self.flags
+        if prover is not None:
+            flags = re.sub(r"-wp-prover \S+", "-wp-prover " + prover, flags)
+        args = flags.split(" ") + (extra_args or [])
+        exit_code, output = self._exec(path, timeout, basedir, args, on_start=on_start)
+        if is_timeout(exit_code, self.cpu_time_limit):
+            return VerificationResult(-1, "Timeout")
+        return self.extract_output(output, partial=partial)
+
+    def _exec(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            args: List[str],
+            stop: Optional[Callable[[str], bool]] = None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[Optional[int], bytes]:
 
         path = os.path.abspath(path)
         if basedir == "":
             tmp_dir = self.tmp_dir
         else:
             tmp_dir = os.path.join(self.tmp_dir, basedir)
-            self.container.exec_run(["mkdir", "-p", tmp_dir])
-            
-        copy_to_container(self.container, path, tmp_dir)
-        path_in_container = os.path.join(tmp_dir, os.path.basename(path))
-
-        cmd = "timeout {} frama-c -wp -wp-precond-weakening -wp-no-callee-precond -warn-signed-overflow -warn-unsigned-overflow -warn-invalid-pointer -wp-model Typed+ref -wp-prover Alt-Ergo,Z3 -wp-print -wp-timeout 10 {}".format(
-            timeout, path_in_container)
-        cmd_splitted = cmd.split(" ")
-        print("Executing command: {}".format(cmd))
-
-        # Call the docker container to run the command
-        exec_result = self.container.exec_run(cmd_splitted)
-        if exec_result.exit_code == 124:
-            tar_file = path + ".tar"
-            if os.path.exists(tar_file):
-                os.remove(tar_file)
-            return (-1, "Timeout")
-        output = exec_result.output.decode("utf-8")
-        
-        tar_file = path + ".tar"
-        if os.path.exists(tar_file):
-            os.remove(tar_file)
-        return self.extract_output(output)
+        display_path = os.path.join(tmp_dir, os.path.basename(path))
+
+        with self.pool.lease() as container:
+            path_in_container, _ = stage_in_container(
+                container, path, self.mount_dir, self.home_dir, tmp_dir)
+
+            environment = None
+            if self.wp_cache_dir is not None and "-wp" in args:
+                args = args + ["-wp-cache", "update"]
+                environment = {"FRAMAC_WP_CACHEDIR": _WP_CACHE_BIND}
+            cmd_splitted = limit_command(["frama-c"] + args + [path_in_container], timeout, self.cpu_time_limit)
+            print("Executing command: {}".format(" ".join(cmd_splitted)))
+
+            # Call the docker container to run the command
+            if stop is None and on_start is None:
+                exec_result = self.pool.exec_run(container, cmd_splitted, environment=environment)
+                exit_code = exec_result.exit_code
+                output = exec_result.output
+            else:
+                exit_code, output = stream_command_in_container(
+                    container, cmd_splitted, stop=stop, environment=environment, on_start=on_start)
+        self._prune_wp_cache()
+        return exit_code, _replace_path(output, path_in_container, display_path)
+
+    def _prune_wp_cache(self) -> None:
+        if self.wp_cache_dir is None:
+            return
+        with self._prune_lock:
+            self._n_runs += 1
+            prune = self._n_runs % _CACHE_PRUNE_INTERVAL == 0
+        if prune:
+            prune_directory(self.wp_cache_dir, self.wp_cache_size)
+
+    def extract_output(self, output: Union[str, bytes], partial: bool = False) -> VerificationResult:
+        return parse_framac_output(output, partial=partial)
+    
+    def clean_up(self):
+        self.pool.clean_up()
 
-    def extract_output(self, output: str) -> Tuple[str, str]:
-
-        # Convert from bytes to a list of strings (split by newline characters).
-        result_type = "UK"
-        context = output.split("\n")
-        # Iterate through each line in the context.
-        timeout_in_requires = 0
-        all_timeout = 0
-        for line in context:
-            # If the line contains the string "[kernel] Frama-C aborted:", then the
-            # build is invalid.
-            if ("[kernel] Frama-C aborted:" in line
-                    or "[kernel] Plug-in wp aborted" in line
-                    or "[wp] Warning: No goal generated" in line
-                    or "error: invalid preprocessing directive" in line):
-                result_type = "SyntaxError"
-                break
-            elif "[wp] [Timeout] typed_" in line:
-                if ("_requires (" in line or "_requires_" in line):
-                    timeout_in_requires += 1
-                all_timeout += 1
-                continue
-            # If the line contains the string "[wp] Proved goals:", then the build
-            # is valid. The number of proved goals is given in the form "x/y",
-            # where x is the number of proved goals and y is the number of total
-            # goals. If x == y, then the build is a pass. Otherwise, the build is
-            # a fail.
-            elif "[wp] Proved goals:" in line:
-                proportion = line.split(":")[-1]
-                left, right = proportion.split("/")
-                left = left.strip()
-                right = right.strip()
-                if int(left) + int(timeout_in_requires) == int(right):
-                    result_type = "Pass_" + left + "_" + right
-                else:
-                    result_type = "Fail_" + left + "_" + right
-                break
-        if result_type.startswith("Pass"):
-            return [0, output]
-        elif result_type.startswith("Fail"):
-            n_errors = int(right) - int(left) - all_timeout
-            assert n_errors >= 0, "Number of errors should be greater than or equal to 0"
-            if n_errors == 0:
-                return [-1, output]
-            return [n_errors, output]
-        elif result_type == "SyntaxError":
-            return [999, output]
-        elif "Unexpected error" in output and "Please report as 'crash' at https://git.frama-c.com/pub/frama-c/issues" in output:
-            return [-5, "Internal Frama-C bug"]
+
+class FramaCVerifierWithoutDocker(FramaCVerifier):
+    """
+    Frama-C installed on the host, run in at most `max_workers` concurrent processes.
+
+    Each run is a process group that is killed as a whole on timeout, so the
+    provers started by WP are not leaked. Outputs report the file at the same
+    path as the docker verifier, so both give the same results.
+    """
+
+    def __init__(
+            self,
+            max_workers=None,
+            wp_cache_dir=None,
+            wp_cache_size=2 * 1024 ** 3,
+            cpu_time_limit=False
+        ) -> None:
+        self.exec_path = shutil.which("frama-c")
+        assert self.exec_path is not None, \
+            "Frama-C executable not found. Please install Frama-C 26.0 (e.g. opam install frama-c.26.0) and put frama-c on the PATH"
+        print("Frama-C executable path: {}".format(self.exec_path))
+        # No container to start, so only the shared set-up of FramaCVerifier
+        self._init_frama_c(wp_cache_dir, wp_cache_size, cpu_time_limit)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+
+    def _exec(
+            self,
+            path: str,
+            timeout: int,
+            basedir: str,
+            args: List[str],
+            stop: Optional[Callable[[str], bool]] = None,
+            on_start: Optional[Callable[[Callable[[], None]], None]] = None
+        ) -> Tuple[Optional[int], bytes]:
+
+        path = os.path.abspath(path)
+        if basedir == "":
+            tmp_dir = self.tmp_dir
         else:
-            assert output == "Timeout", "Unknown output: {}".format(output)
-            return [-1, output]
-    
+            tmp_dir = os.path.join(self.tmp_dir, basedir)
+        display_path = os.path.join(tmp_dir, os.path.basename(path))
+
+        environment = None
+        if self.wp_cache_dir is not None and "-wp" in args:
+            args = args + ["-wp-cache", "update"]
+            environment = {"FRAMAC_WP_CACHEDIR": self.wp_cache_dir}
+        cmd_splitted = [self.exec_path] + args + [path]
+        print("Executing command: {}".format(" ".join(cmd_splitted)))
+
+        with self._slots:
+            exit_code, output = stream_command(
+                cmd_splitted, timeout, stop=stop, environment=environment,
+                on_start=on_start, cpu_time_limit=self.cpu_time_limit)
+        self._prune_wp_cache()
+        return exit_code, _replace_path(output, path, display_path)
+
     def clean_up(self):
-        print("Cleaning up the docker container")
-        self.container.stop()
-        self.container.remove()
\ No newline at end of file
+        pass
\ No newline at end of file
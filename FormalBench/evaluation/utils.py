@@ -3,6 +3,13 @@ import psutil
 import os
 import tarfile
 import io
+import fcntl
+import shlex
+import signal
+import resource
+import threading
+from functools import partial
+from typing import Callable, List, Optional, Tuple
 
 def kill_process_tree(pid):
     try:
@@ -14,18 +21,67 @@ def kill_process_tree(pid):
         pass
 
 
-def execute_command(command, timeout=None):
+# Wall-clock budget of a job limited in CPU time, as a multiple of its CPU
+# time, so that a job starved of CPU or blocked on I/O still ends.
+CPU_TIME_WALL_FACTOR = 4
+
+# A process reaching its CPU-time limit gets SIGXCPU, and SIGKILL one second
+# later if it ignores it. Only SIGXCPU counts as a timeout, since SIGKILL is
+# also how out-of-memory kills are reported.
+_CPU_TIME_SIGNALS = (signal.SIGXCPU,)
+_CPU_TIME_KILL_MARGIN = 1
+
+def _limit_cpu_time(cpu_time: int) -> None:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + _CPU_TIME_KILL_MARGIN))
+
+def limit_command(cmd: List[str], timeout: int, cpu_time_limit: bool = False) -> List[str]:
+    """
+    Prefix a command with its time limit: `timeout` seconds of wall-clock time, or of CPU time with `cpu_time_limit`
+
+    A CPU-time limit does not depend on the load of the machine. It applies to
+    each process of the job (e.g. the verifier and each solver it starts),
+    counting all of its threads.
+    """
+    if not cpu_time_limit:
+        return ["timeout", str(timeout)] + cmd
+    return ["timeout", str(timeout * CPU_TIME_WALL_FACTOR),
+            "/bin/sh", "-c", 'ulimit -S -t {}; ulimit -H -t {}; exec "$@"'.format(
+                timeout, timeout + _CPU_TIME_KILL_MARGIN), "sh"] + cmd
+
+def is_timeout(exit_code: Optional[int], cpu_time_limit: bool = False) -> bool:
+    """
+    Tell whether a command run by `limit_command` ran out of time
+    """
+    if exit_code == 124:
+        return True
+    # Signals are reported as 128 + signal by shells and docker, and as
+    # -signal by subprocess.
+    return cpu_time_limit and any(exit_code in (128 + sig, -sig) for sig in _CPU_TIME_SIGNALS)
+
+def execute_command(command, timeout=None, on_start=None, cpu_time_limit=False, cwd=None):
     try:
+        preexec_fn = None
+        if cpu_time_limit and timeout is not None:
+            cpu_time = int(timeout)
+            timeout = cpu_time * CPU_TIME_WALL_FACTOR
+            preexec_fn = lambda: _limit_cpu_time(cpu_time)
         process = subprocess.Popen(command,
                                    shell=True,
                                    stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
+                                   stderr=subprocess.PIPE,
+                                   preexec_fn=preexec_fn,
+                                   cwd=cwd)
+        if on_start is not None:
+            on_start(lambda: kill_process_tree(process.pid))
         try:
             output, error = process.communicate(timeout=timeout)
         except subprocess.TimeoutExpired:
             kill_process_tree(process.pid)
             return "Timeout"
 
+        if preexec_fn is not None and is_timeout(process.returncode, True):
+            return "Timeout"
+
         if process.returncode != 0:
             if error:
                 return error.decode("utf-8")
@@ -36,19 +92,130 @@ def execute_command(command, timeout=None):
     except subprocess.CalledProcessError as e:
         return e.output.decode("utf-8")
 
+def stream_command(
+        cmd: List[str],
+        timeout: Optional[int] = None,
+        stop: Optional[Callable[[str], bool]] = None,
+        environment: Optional[dict] = None,
+        on_start: Optional[Callable[[Callable[[], None]], None]] = None,
+        cpu_time_limit: bool = False
+    ) -> Tuple[Optional[int], str]:
+    """
+    Run a local command and stop it at the first output line matching `stop`, like `stream_command_in_container`
+
+    The command runs in its own process group, which is killed as a whole on
+    timeout or when it is stopped early. Stderr is merged into stdout.
+
+    Returns:
+        Tuple[Optional[int], str]: The exit code (124 on timeout, as with `timeout`, and None if the command was stopped early) and the output read so far
+    """
+    preexec_fn = None
+    if cpu_time_limit and timeout is not None:
+        cpu_time = int(timeout)
+        timeout = cpu_time * CPU_TIME_WALL_FACTOR
+        preexec_fn = lambda: _limit_cpu_time(cpu_time)
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=dict(os.environ, **environment) if environment else None,
+        start_new_session=True,
+        preexec_fn=preexec_fn
+    )
+
+    def _kill():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    if on_start is not None:
+        on_start(_kill)
+    timed_out = threading.Event()
+
+    def _expire():
+        timed_out.set()
+        _kill()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _expire)
+        timer.daemon = True
+        timer.start()
+
+    lines = []
+    stopped = False
+    try:
+        for raw in process.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            lines.append(line)
+            if stop is not None and stop(line):
+                _kill()
+                stopped = True
+                break
+    finally:
+        process.stdout.close()
+        exit_code = process.wait()
+        if timer is not None:
+            timer.cancel()
+    if stopped:
+        return None, "\n".join(lines)
+    if timed_out.is_set():
+        return 124, "\n".join(lines)
+    return exit_code, "\n".join(lines)
+
+def _tar_bytes(name: str, data: bytes, mode: int = 0o644) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mode = mode
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def write_to_container(container, data: bytes, name: str, dest: str) -> None:
+    """
+    Stream in-memory content into a container as `dest/name` without touching the local disk
+    """
+    container.put_archive(dest, _tar_bytes(name, data))
+
 def copy_to_container(container, src: str, dest: str) -> None:
-    src_dir = os.path.dirname(src)
-    print("src_dir: {}".format(src_dir))
-    src_name = os.path.basename(src)
-    tar_path = src + '.tar'
-    
-    with tarfile.open(tar_path, mode='w') as tar:
-        tar.add(src, arcname=src_name)
-
-    with open(tar_path, 'rb') as f:
+    with open(src, 'rb') as f:
         data = f.read()
-        container.put_archive(dest, data)
-        
+    write_to_container(container, data, os.path.basename(src), dest)
+
+def to_container_path(path: str, mount_dir: str, bind_dir: str) -> Optional[str]:
+    """
+    Translate a local path into its location under a container bind mount
+
+    Args:
+        path (str): Local path
+        mount_dir (str): Local directory mounted into the container
+        bind_dir (str): Location of the mount inside the container
+
+    Returns:
+        Optional[str]: The path inside the container, or None if the path is outside the mount
+    """
+    path = os.path.abspath(path)
+    mount_dir = os.path.abspath(mount_dir)
+    if path != mount_dir and not path.startswith(mount_dir + os.sep):
+        return None
+    return os.path.join(bind_dir, os.path.relpath(path, mount_dir))
+
+def stage_in_container(container, src: str, mount_dir: str, bind_dir: str, dest: str) -> Tuple[str, bool]:
+    """
+    Make a local file visible inside a container. Files under the bind mount are used in place, other files are streamed into `dest`.
+
+    Returns:
+        Tuple[str, bool]: The path inside the container and whether the file was copied
+    """
+    path_in_container = to_container_path(src, mount_dir, bind_dir)
+    if path_in_container is not None:
+        return path_in_container, False
+    container.exec_run(["mkdir", "-p", dest])
+    copy_to_container(container, src, dest)
+    return os.path.join(dest, os.path.basename(src)), True
+
 def copy_from_container(container, src: str, dest: str) -> str:
     data, stat = container.get_archive(src)
     file_like_object = io.BytesIO()
@@ -61,4 +228,100 @@ def copy_from_container(container, src: str, dest: str) -> str:
 
 def execute_command_in_container(container, cmd: str) -> str:
     exec_result = container.exec_run(cmd.split(" "))
-    return exec_result.output.decode("utf-8")
\ No newline at end of file
+    return exec_result.output.decode("utf-8")
+
+def stream_command_in_container(
+        container,
+        cmd: List[str],
+        stop: Optional[Callable[[str], bool]] = None,
+        environment: Optional[dict] = None,
+        on_start: Optional[Callable[[Callable[[], None]], None]] = None
+    ) -> Tuple[Optional[int], str]:
+    """
+    Run a command in a container and stop it at the first output line matching `stop`.
+
+    The command runs in its own process group, which is killed as a whole when
+    it is stopped early so that child processes such as provers are not leaked.
+    `on_start` receives a function that kills the process group, e.g. to
+    cancel the command from another thread.
+
+    Returns:
+        Tuple[Optional[int], str]: The exit code (None if the command was stopped early) and the output read so far
+    """
+    api = container.client.api
+    script = "echo PID:$$; exec {}".format(shlex.join(cmd))
+    exec_id = api.exec_create(
+        container.id, ["setsid", "/bin/sh", "-c", script], environment=environment)["Id"]
+    stream = api.exec_start(exec_id, stream=True)
+
+    pid = None
+    lines = []
+    buffer = b""
+    try:
+        for chunk in stream:
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for raw in complete:
+                line = raw.decode("utf-8", errors="replace")
+                if pid is None and line.startswith("PID:"):
+                    pid = line[4:].strip()
+                    if on_start is not None:
+                        on_start(partial(container.exec_run, ["kill", "-9", "--", "-" + pid]))
+                    continue
+                lines.append(line)
+                if stop is not None and stop(line):
+                    container.exec_run(["kill", "-9", "--", "-" + pid])
+                    return None, "\n".join(lines)
+    finally:
+        stream.close()
+    lines.append(buffer.decode("utf-8", errors="replace"))
+    return api.exec_inspect(exec_id)["ExitCode"], "\n".join(lines)
+
+def prune_directory(path: str, max_bytes: Optional[int] = None, max_files: Optional[int] = None) -> int:
+    """
+    Evict the least recently modified files of a directory tree until it is below 90% of `max_bytes` and of `max_files`.
+
+    Several processes may share the directory: only one prunes at a time and
+    the others skip pruning instead of waiting.
+
+    Returns:
+        int: The number of removed files
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".prune.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+
+        files = []
+        total = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                if name == ".prune.lock":
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file_path))
+                total += stat.st_size
+        if ((max_bytes is None or total <= max_bytes)
+                and (max_files is None or len(files) <= max_files)):
+            return 0
+
+        files.sort()
+        target = int(max_bytes * 0.9) if max_bytes is not None else total
+        target_files = int(max_files * 0.9) if max_files is not None else len(files)
+        removed = 0
+        for _, size, file_path in files:
+            if total <= target and len(files) - removed <= target_files:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
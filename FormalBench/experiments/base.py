@@ -17,6 +17,7 @@ def experiment(
     workflow="basic",
     timeout=300,
     tmp_dir=None,
+    cache_dir=None,
 ):
     """
     Run the experiment with base dataset for a specific programming language.
@@ -32,6 +33,7 @@ def experiment(
         workflow (str): Workflow type for the experiment.
         timeout (int): Timeout for the verification process.
         tmp_dir (str): Temporary directory for storing intermediate files.
+        cache_dir (str): Directory of the verification result cache reused across reruns.
     """
     assert language in ["java","c"], "Language not supported. Only java and c are supported"
     
@@ -60,6 +62,7 @@ def experiment(
                             language=language,
                             timeout=timeout,
                             tmp_dir=tmp_dir,
+                            cache_dir=cache_dir,
                         )
     
     for class_name in tqdm(meta_data):
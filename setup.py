@@ -17,4 +17,10 @@ setup(
     long_description_content_type="text/markdown",
     install_requires=[],
     extras_require={"default": requirements},
+    entry_points={
+        "console_scripts": [
+            "formalbench-verifyd=FormalBench.evaluation.tools.service:main",
+            "formalbench-profiles=FormalBench.evaluation.profiles:main",
+        ],
+    },
 )
\ No newline at end of file
@@ -1,10 +1,33 @@
 import os
+import re
+import json
+import socket
+import time
+import shutil
+import signal
+import threading
+import psutil
+import pytest
 from FormalBench.evaluation import (
     create_verifier, 
     create_mutator, 
     eval_consistency, 
     eval_completeness,
+    CascadePolicy,
+    CoverageScore,
+    SamplingPolicy,
+    SplitVerifier,
+    PortfolioVerifier,
 )
+from FormalBench.evaluation.tools.source import split_java_methods, split_c_functions, split_annotations, splice_annotations, changed_units
+from FormalBench.evaluation.utils import prune_directory, limit_command, is_timeout
+from FormalBench.evaluation.tools.result import parse_framac_output
+from FormalBench.evaluation.tools.channel import LocalChannel
+from FormalBench.evaluation.tools.shell import SHELL_WORKER_SCRIPT, ShellWorkerPool, shell_command
+from FormalBench.evaluation.concurrency import AdaptiveLimiter
+from FormalBench.evaluation.tools.mutation_analysis import apply_patch, PROFILES, _profile_config
+from FormalBench.evaluation.tools.dedup import group_mutants, ORIGINAL
+from FormalBench.evaluation.metrics.sampling import CoverageEstimate, sampling_order
 
 def test_create_java_verifier():
     assert create_verifier("OpenJML", 21)
@@ -34,11 +57,18 @@ def test_create_java_verifier():
 
 def test_create_c_verifier():
     assert create_verifier("FramaC")
+
+@pytest.mark.skipif(shutil.which("frama-c") is None, reason="Frama-C is not installed")
+def test_create_c_verifier_without_docker():
+    assert create_verifier("FramaCWithoutDocker")
+
+@pytest.mark.skipif(shutil.which("frama-c") is not None, reason="Frama-C is installed")
+def test_create_c_verifier_without_frama_c():
     try:
         create_verifier("FramaCWithoutDocker")
-    except NotImplementedError as e:
-        assert str(e) == "FramaC without docker is not implemented yet. Please use FramaC with docker."
-    except:
+    except AssertionError as e:
+        assert str(e) == "Frama-C executable not found. Please install Frama-C 26.0 (e.g. opam install frama-c.26.0) and put frama-c on the PATH"
+    else:
         assert False
         
 def test_java_verifier():
@@ -58,6 +88,298 @@ def test_java_verifier():
     assert not os.path.exists("tests/testcases/specs/Absolute_wrong.java.tar"), "Local tar file should be deleted"
     assert not os.path.exists("tests/testcases/specs/Absolute.java.tar"), "Local tar file should be deleted"
 
+def test_verifier_pool():
+    verifier = create_verifier("OpenJML", 21, pool_size=2)
+    assert len(verifier.pool.containers) == 2, "Two containers should be started"
+    n_errors, output = verifier.verify("tests/testcases/specs/Absolute.java")
+    assert n_errors == 0, "No errors should be found"
+
+def test_java_verifier_daemon():
+    verifier = create_verifier("OpenJML", 21, daemon=True)
+    n_errors, output = verifier.verify("tests/testcases/specs/Absolute.java")
+    assert n_errors == 0, "No errors should be found"
+    
+    n_errors, output = verifier.verify("tests/testcases/specs/Absolute_wrong.java")
+    assert n_errors > 0, "Errors should be found"
+
+def test_java_verifier_cascade():
+    verifier = create_verifier("OpenJML", 21, cascade=CascadePolicy(short_timeout=60))
+    n_errors, _ = verifier.verify("tests/testcases/specs/Absolute_wrong.java")
+    assert n_errors != 0, "Errors should be found"
+    assert verifier.stats["typecheck"]["runs"] == 1, "Type-checking should run first"
+    assert verifier.stats["full"]["runs"] == 0, "Full verification should only run after a timeout"
+
+def test_verification_cache(tmp_path):
+    verifier = create_verifier("OpenJML", 21, cache_dir=str(tmp_path))
+    first = verifier.verify("tests/testcases/specs/Absolute_wrong.java")
+    second = verifier.verify("tests/testcases/specs/Absolute_wrong.java")
+    assert verifier.misses == 1 and verifier.hits == 1, "Second verification should be served from the cache"
+    assert tuple(first) == tuple(second), "Cached result should match the verifier result"
+
+def test_split_java_methods():
+    code = open("tests/testcases/specs/Absolute.java").read()
+    units = split_java_methods(code)
+    assert [unit.name for unit in units] == ["Absolute"] * 3, "Three overloads should be found"
+    assert units[0].text.startswith("/*@"), "Units should include their contracts"
+    assert units[-1].text.endswith("}"), "Units should include their bodies"
+
+def test_split_java_constructors():
+    code = open("tests/testcases/specs/Counter.java").read()
+    units = split_java_methods(code)
+    assert [unit.name for unit in units] == ["Counter", "get"], "Constructors should be named after their class"
+
+def test_java_verifier_constructors():
+    verifier = create_verifier("OpenJML", 21)
+    n_errors, _ = verifier.verify_methods("tests/testcases/specs/Counter.java", ["Counter"])
+    assert n_errors > 0, "The wrong constructor should be verified"
+    n_errors, _ = verifier.verify_methods("tests/testcases/specs/Counter.java", ["Counter"], exclude=True)
+    assert n_errors == 0, "The wrong constructor should be excluded"
+
+def test_split_c_functions():
+    code = open("tests/testcases/specs/abs.c").read()
+    units = split_c_functions(code)
+    assert [unit.name for unit in units] == ["abs"], "One function should be found"
+    assert units[0].text.startswith("/*@"), "Units should include their contracts"
+
+def test_parse_framac_output():
+    output = "[wp] [Unknown] typed_abs_ensures (Alt-Ergo)\n[wp] Proved goals:    4 / 6\n"
+    result = parse_framac_output(output)
+    n_errors, parsed_output = result
+    assert n_errors == 2, "Unproved goals should be counted as errors"
+    assert parsed_output == output, "Output should be kept"
+    assert result.goals == (("typed_abs_ensures", "Unknown"),), "Goal status should be recorded"
+    assert parse_framac_output("[kernel] Frama-C aborted: invalid user input.")[0] == 999
+    assert parse_framac_output("[wp] Warning: No goal generated")[0] == 999
+    assert parse_framac_output("[wp] Warning: No goal generated", partial=True)[0] == 0, \
+        "Runs restricted to some functions may have no goals"
+
+def test_split_c_verifier():
+    class Verifier:
+        def signature(self):
+            return "test"
+
+        def verify_functions(self, path, functions, timeout=1800, basedir="", exclude=False, wp_par=None):
+            calls.append((functions, exclude))
+            return 0, ""
+
+    calls = []
+    verifier = SplitVerifier(Verifier(), n_workers=2)
+    assert verifier.verify("tests/testcases/specs/abs.c", timeout=20) == (0, "")
+    assert calls == [(["abs"], False)], "Files whose annotations are all in functions need no residual unit"
+
+    calls = []
+    code = "/*@ lemma l: \\true; */\n" + open("tests/testcases/specs/abs.c").read()
+    assert [exclude for _, _, exclude in verifier.plan(code, "abs.c", 20)] == [False, True], \
+        "Global lemmas should be verified by the residual unit"
+
+def test_cascade_prover_timeout():
+    from FormalBench.evaluation.tools.cascade import CascadeVerifier
+
+    class Verifier:
+        def signature(self):
+            return "test"
+
+        def check(self, path, basedir="", timeout=1800):
+            return 0, ""
+
+        def verify_with_prover_timeout(self, path, prover_timeout, timeout=1800, basedir=""):
+            return 0, "[wp] [Timeout] typed_abs_requires (Alt-Ergo)\n[wp] Proved goals:    3 / 4\n"
+
+        def verify(self, path, timeout=1800, basedir=""):
+            return 2, "full"
+
+    verifier = CascadeVerifier(Verifier(), CascadePolicy())
+    assert verifier.verify("tests/testcases/specs/abs.c") == (2, "full"), \
+        "Goals timing out at the short prover timeout should be verified with the full budget"
+
+def test_portfolio_verifier():
+    class Verifier:
+        provers = ("Alt-Ergo,Z3", "Alt-Ergo")
+
+        def signature(self):
+            return "test"
+
+        def verify_with_prover(self, path, prover, timeout=1800, basedir="", on_start=None):
+            killed = threading.Event()
+            on_start(killed.set)
+            killed.wait(5 if prover == "Alt-Ergo" else 0)
+            return (-1, "Timeout") if killed.is_set() else (2, prover)
+
+    verifier = PortfolioVerifier(Verifier())
+    start = time.monotonic()
+    assert verifier.verify("tests/testcases/specs/abs.c") == (2, "Alt-Ergo,Z3")
+    assert time.monotonic() - start < 4, "The answer of the default configuration should end the race"
+
+@pytest.mark.skipif(shutil.which("frama-c") is None, reason="Frama-C is not installed")
+def test_split_c_verifier_without_docker():
+    verifier = SplitVerifier(create_verifier("FramaCWithoutDocker"), n_workers=2)
+    n_errors, _ = verifier.verify("tests/testcases/specs/abs.c")
+    assert n_errors == 0, "No errors should be found"
+    n_errors, _ = verifier.verify("tests/testcases/specs/abs_wrong.c")
+    assert n_errors != 0 and n_errors != 999, "Errors should be found"
+
+def test_prune_directory(tmp_path):
+    for i in range(10):
+        path = tmp_path / "{}.bin".format(i)
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (i, i))
+    removed = prune_directory(str(tmp_path), 500)
+    assert removed == 6, "Files should be evicted down to 90% of the cap"
+    assert not (tmp_path / "0.bin").exists(), "Oldest files should be evicted first"
+    assert (tmp_path / "9.bin").exists(), "Newest files should be kept"
+
+def test_shell_worker():
+    shells = ShellWorkerPool(lambda: LocalChannel(["/bin/bash", "-c", SHELL_WORKER_SCRIPT]))
+    result = shells.run(shell_command(["sh", "-c", "echo $FOO; exit 3"], {"FOO": "a b"}))
+    assert result.exit_code == 3 and result.output == b"a b\n", "Exit code and output should be returned"
+    result = shells.run(shell_command(["sleep", "5"]), timeout=0.5)
+    assert result.exit_code == 124, "Worker should time out"
+    result = shells.run(shell_command("echo done"))
+    assert result.output == b"done\n", "Worker should restart after a timeout"
+    shells.stop()
+
+def test_shell_worker_term():
+    channel = LocalChannel(["/bin/bash", "-c", SHELL_WORKER_SCRIPT])
+    channel.send(shell_command(["sleep", "30"]).encode("utf-8") + b"\n")
+    time.sleep(0.5)
+    children = psutil.Process(channel.process.pid).children(recursive=True)
+    assert len(children) > 0, "The command should be running"
+    channel.process.send_signal(signal.SIGTERM)
+    _, alive = psutil.wait_procs(children, timeout=5)
+    assert alive == [], "Stopping the worker should kill its command"
+    channel.process.wait()
+
+def test_verification_service(tmp_path):
+    from FormalBench.evaluation.tools.service import VerificationService
+
+    class Verifier:
+        def signature(self):
+            return "test"
+
+    socket_path = str(tmp_path / "verifyd.sock")
+    service = VerificationService(Verifier(), socket_path=socket_path, n_workers=1)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    while service.server is None:
+        time.sleep(0.05)
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600, "Only the owner should be able to connect"
+    with socket.socket(socket.AF_UNIX) as client, client.makefile("rwb") as stream:
+        client.connect(socket_path)
+        for request in [b"{bad\n", b'{"id": 1, "method": "signature"}\n']:
+            stream.write(request)
+            stream.flush()
+            response = json.loads(stream.readline())
+        assert response == {"id": 1, "signature": "test"}, "Malformed requests should not stop the connection"
+    service.server.shutdown()
+
+def test_adaptive_limiter():
+    limiter = AdaptiveLimiter(max_workers=4, initial=4, interval=0, max_cpu=101, is_timeout=lambda n_errors: n_errors == -1)
+    for _ in range(3):
+        assert limiter.run(lambda: -1) == -1
+    assert limiter.limit == 1, "Timeouts should lower the number of workers"
+    assert len(limiter.history) == 3, "The limit should be revised after each window"
+
+def test_cpu_time_limit():
+    import subprocess
+    busy = limit_command(["python3", "-c", "while True: pass"], 1, cpu_time_limit=True)
+    assert is_timeout(subprocess.run(busy).returncode, cpu_time_limit=True), "Busy loop should run out of CPU time"
+    idle = limit_command(["sleep", "2"], 1, cpu_time_limit=True)
+    assert subprocess.run(idle).returncode == 0, "Sleeping should not count as CPU time"
+    assert not is_timeout(128 + 9, cpu_time_limit=True), "Out-of-memory kills should not be timeouts"
+
+def test_apply_patch():
+    source = "int add(int a, int b) {\n    return a + b;\n}\n"
+    patch = "--- a/add.c 0\n+++ b/add.c 0\n@@ -2 +2 @@\n-    return a + b;\n+    return a - b;\n"
+    assert apply_patch(source, patch) == "int add(int a, int b) {\n    return a - b;\n}\n"
+    try:
+        apply_patch("int x;\n", patch)
+        assert False, "Mismatching hunks should be rejected"
+    except ValueError:
+        pass
+
+def test_splice_annotations():
+    code = "/*@ ensures \\result == a + b; */\nint add(int a, int b) {\n    //@ assert a == a;\n    return a + b;\n}\n"
+    stripped, spans = split_annotations(code)
+    assert stripped == "\nint add(int a, int b) {\n    \n    return a + b;\n}\n"
+    mutant = stripped.replace("a + b", "a - b")
+    assert splice_annotations(code, spans, stripped, mutant) == code.replace("return a + b", "return a - b")
+    assert splice_annotations(code, spans, stripped, stripped.replace("{\n    \n    return", "{ return")) is None
+
+def test_group_mutants(tmp_path):
+    original = tmp_path / "add.c"
+    original.write_text("int add(int a, int b) { return a + b; }\n")
+    for mutant, code in [("0", "int add(int a, int b) { return a - b; }\n"),
+                         ("1", "int add(int a, int b) {\n    return a-b;\n}\n"),
+                         ("2", "int add(int a,int b){ return a+b; }\n"),
+                         ("3", "int add(int a, int b) { return a * b; }\n")]:
+        (tmp_path / "mutants" / mutant).mkdir(parents=True)
+        (tmp_path / "mutants" / mutant / "add.c").write_text(code)
+    groups = group_mutants(str(tmp_path / "mutants"), "add.c", original_path=str(original))
+    assert groups == {ORIGINAL: [ORIGINAL, "2"], "0": ["0", "1"], "3": ["3"]}
+
+def test_changed_units():
+    code = "int f(int a) { return a + 1; }\nint g(int a) { return f(a); }\nint x = 1;\n"
+    assert changed_units(code, code.replace("a + 1", "a - 1"), split_c_functions) == ["f"]
+    assert changed_units(code, code.replace("x = 1", "x = 0"), split_c_functions) is None
+
+def test_coverage_estimate():
+    estimate = CoverageEstimate(30, 40, 400)
+    assert estimate == 0.75 and estimate.low < 0.75 < estimate.high
+    assert CoverageEstimate(30, 40, 40).width == 0
+    order = sampling_order([str(i) for i in range(30)], {str(i): "AOR" if i < 20 else "ROR" for i in range(30)})
+    assert sorted(order) == sorted(str(i) for i in range(30))
+    assert sum(int(mutant) >= 20 for mutant in order[:6]) == 2
+
+def test_sampling_without_verified_mutants():
+    coverage_score = CoverageScore(None, None, sampling=SamplingPolicy(max_mutants=0))
+    coverage_score.mutation_analysis = lambda **kwargs: ({"Original": 0}, 40)
+    coverage, survived, total = coverage_score.measure_completeness("", "", "", n_proc=1, timeout=1)
+    assert coverage is None and total == 0, "A benchmark without verified mutants should have no coverage"
+
+def test_mutator_profiles():
+    for profile in PROFILES:
+        assert os.path.exists(_profile_config("major", profile))
+        assert os.path.exists(_profile_config("mull", profile))
+    operators = {}
+    for profile in PROFILES:
+        with open(_profile_config("mull", profile)) as f:
+            operators[profile] = set(re.findall(r"^\s*- (\w+)", f.read(), re.MULTILINE))
+    assert operators["minimal"] < operators["sufficient"] < operators["full"], "Reduced profiles should be subsets of the full profile"
+    with open(_profile_config("major", "minimal")) as f:
+        minimal = set(re.findall(r"^(\w+);", f.read(), re.MULTILINE))
+    with open(_profile_config("major", "sufficient")) as f:
+        assert minimal < set(re.findall(r"^(\w+);", f.read(), re.MULTILINE))
+
+@pytest.mark.skipif(shutil.which("mull-runner-12") is None, reason="Mull is not installed")
+def test_mutator_profiles_without_docker(tmp_path):
+    mutants = {}
+    for profile in PROFILES:
+        mutator = create_mutator("MullWithoutDocker", profile=profile)
+        mutator.generate_mutants("tests/testcases/specs/abs.c", str(tmp_path / profile))
+        mutation_dir = tmp_path / profile / "mutants"
+        mutants[profile] = {(mutation_dir / mutant / "abs.c").read_text() for mutant in os.listdir(mutation_dir)}
+    assert mutants["minimal"] <= mutants["sufficient"] <= mutants["full"], "Reduced profiles should generate a subset of the mutants"
+
+def test_compare_profiles(tmp_path, monkeypatch):
+    from FormalBench.evaluation import profiles
+
+    class Mutator:
+        def __init__(self, profile):
+            self.profile = profile
+
+        def generate_mutants(self, path, save_dir):
+            for i in range(PROFILES[::-1].index(self.profile) + 1):
+                os.makedirs(os.path.join(save_dir, "mutants", str(i)))
+
+    monkeypatch.setattr(profiles, "create_mutator", lambda name, profile: Mutator(profile))
+    monkeypatch.setattr(profiles, "eval_completeness", lambda *args, mutator_profile, **kwargs: (
+        0.5, [0.5, 0.5, 1.0] if mutator_profile == "full" else [0.25, 0.75, None], []))
+    report = profiles.compare_profiles("tests/testcases/specs", "", str(tmp_path), data_ids="Absolute,AddLoop,Counter")
+    assert set(report) == set(PROFILES)
+    for row in report.values():
+        assert set(row) == {"avg_coverage", "n_mutants", "time", "pearson", "spearman", "mean_abs_diff", "time_saved"}
+    assert report["full"]["n_mutants"] == 9 and report["minimal"]["n_mutants"] == 3
+    assert report["minimal"]["mean_abs_diff"] == 0.25
+
 def test_c_verifier():
     verifier = create_verifier("FramaC")
     n_errors, output = verifier.verify("tests/testcases/specs/abs.c")
@@ -75,11 +397,25 @@ def test_c_verifier():
     assert not os.path.exists("tests/testcases/specs/abs.c.tar"), "Local tar file should be deleted"
     assert not os.path.exists("tests/testcases/specs/abs_invalid.c.tar"), "Local tar file should be deleted"
     assert not os.path.exists("tests/testcases/specs/abs_wrong.c.tar"), "Local tar file should be deleted"
+
+@pytest.mark.skipif(shutil.which("frama-c") is None, reason="Frama-C is not installed")
+def test_c_verifier_without_docker():
+    verifier = create_verifier("FramaCWithoutDocker")
+    n_errors, _ = verifier.verify("tests/testcases/specs/abs.c")
+    assert n_errors == 0, "No errors should be found"
+    n_errors, _ = verifier.verify("tests/testcases/specs/abs_wrong.c")
+    assert n_errors != 0, "Errors should be found"
+    n_errors, _ = verifier.verify("tests/testcases/specs/abs_invalid.c")
+    assert n_errors == 999, "Invalid specification should return 999"
     
 def test_mutation_analysis():
     create_mutator("Major")
     create_mutator("MajorWithoutDocker")
     create_mutator("Mull")
+
+@pytest.mark.skipif(shutil.which("mull-runner-12") is None, reason="Mull is not installed")
+def test_mutation_analysis_without_docker():
+    create_mutator("MullWithoutDocker")
     
 def test_consistency():
     success_rate, failure_rate, results = eval_consistency("tests/testcases/results/specs", "tests/testcases/results/analysis_results")
@@ -0,0 +1,13 @@
+public class Counter {
+	private /*@ spec_public @*/ int count;
+
+	/*@ ensures count == start; @*/
+	public Counter(int start) {
+		count = start + 1;
+	}
+
+	/*@ ensures \result == count; @*/
+	public /*@ pure @*/ int get() {
+		return count;
+	}
+}